@@ -0,0 +1,68 @@
+"""bench_startup.py
+Cold-start import cost of the pr_analyzer entry points, measured with `python -X importtime`.
+
+Each entry point is imported in a fresh interpreter. The report shows the total import time and the
+slowest modules. `--check` fails when an entry point pulls in a dependency it must not load eagerly
+(see `FORBIDDEN`), so regressions in startup time are caught by the test suite and in CI.
+"""
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+HEAVY = ["faiss", "torch", "sentence_transformers", "openai", "requests", "httpx"]
+# entry point -> top-level packages it may not import at module load
+FORBIDDEN: Dict[str, List[str]] = {
+    "pr_analyzer.parser": HEAVY + ["numpy", "click", "fastapi", "uvicorn"],
+    "pr_analyzer.cli": HEAVY + ["numpy", "fastapi", "uvicorn", "pydantic"],
+    "pr_analyzer.indexer": HEAVY,
+    "pr_analyzer.server": ["faiss", "torch", "sentence_transformers", "openai", "requests"],
+}
+
+
+def import_profile(module: str) -> Tuple[float, Dict[str, int]]:
+    """Import `module` in a fresh interpreter; returns (total ms, cumulative microseconds per imported module)."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr}")
+    times: Dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # children are printed before their parent; a top-level line other than `module` closes
+        # an interpreter-startup import (site, .pth hooks), which is not part of the entry point
+        top_level = not name[1:].startswith(" ")
+        if top_level and name.strip() != module:
+            times = {}
+            continue
+        times[name.strip()] = int(cumulative)
+    return times.get(module, 0) / 1000.0, times
+
+
+def violations(module: str, times: Dict[str, int]) -> List[str]:
+    loaded = {name.split(".")[0] for name in times}
+    return [pkg for pkg in FORBIDDEN.get(module, []) if pkg in loaded]
+
+
+def main(argv: List[str]) -> int:
+    import argparse
+
+    p = argparse.ArgumentParser()
+    p.add_argument("modules", nargs="*", default=list(FORBIDDEN), help="Entry points to measure")
+    p.add_argument("--top", type=int, default=5, help="Slowest modules to list per entry point")
+    p.add_argument("--check", action="store_true", help="Exit non-zero if an entry point loads a forbidden dependency")
+    args = p.parse_args(argv)
+    failed = False
+    for module in args.modules:
+        total_ms, times = import_profile(module)
+        bad = violations(module, times)
+        failed = failed or bool(bad)
+        print(f"{module}: {total_ms:.1f} ms" + (f"  (eagerly imports {', '.join(bad)})" if bad else ""))
+        slowest = sorted(((t, n) for n, t in times.items() if n != module), reverse=True)[: args.top]
+        for t, name in slowest:
+            print(f"    {t / 1000.0:8.1f} ms  {name}")
+    return 1 if args.check and failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
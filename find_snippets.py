@@ -4,10 +4,20 @@ and save them to a JSON file for downstream prompting.
 """
 import json
 from pathlib import Path
-from pr_analyzer.indexer import search_index
+from typing import List, Union
+from pr_analyzer.indexer import search_many
 
-def find_snippets(index_path: str, query: str, out_path: str, top_k: int = 12):
-    res = search_index(index_path, query, top_k=top_k)
+def find_snippets(index_path: str, query: Union[str, List[str]], out_path: str, top_k: int = 12):
+    queries = [query] if isinstance(query, str) else list(query)
+    # one batched search for all queries; chunks hit by several queries are written once
+    res = []
+    seen = set()
+    for results in search_many(index_path, queries, top_k=top_k):
+        for r in results:
+            key = (r.get('path'), r.get('chunk_index'))
+            if key not in seen:
+                seen.add(key)
+                res.append(r)
     Path(out_path).write_text(json.dumps(res, indent=2), encoding='utf-8')
     print(f'Wrote {len(res)} snippets to {out_path}')
 
@@ -15,7 +25,7 @@ if __name__ == '__main__':
     import argparse
     p = argparse.ArgumentParser()
     p.add_argument('--index', default='demo_index', help='Index dir')
-    p.add_argument('--query', required=True, help='Symbol or text to search')
+    p.add_argument('--query', required=True, action='append', help='Symbol or text to search (repeat for several frames)')
     p.add_argument('--out', default='snippets.json')
     p.add_argument('--top', type=int, default=12)
     args = p.parse_args()
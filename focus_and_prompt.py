@@ -8,7 +8,7 @@ from pathlib import Path
 from pr_analyzer import analyzer, parser
 
 
-def build_prompt_from_snippets(trace_path: str, snippets_path: str, out_prompt: str, prefer_filename: str = None):
+def build_prompt_from_snippets(trace_path: str, snippets_path: str, out_prompt: str, prefer_filename: str = None, budget_tokens: int = None):
     trace = Path(trace_path).read_text(encoding='utf-8')
     frames = parser.parse_stack_trace(trace)
     if not frames:
@@ -20,7 +20,8 @@ def build_prompt_from_snippets(trace_path: str, snippets_path: str, out_prompt:
         ordered = local + [s for s in snippets if s not in local]
     else:
         ordered = snippets
-    prompt = analyzer._build_prompt(frame, ordered[:8])
+    # the packer keeps the frame's lines and fills the token budget in this order, dropping overlaps
+    prompt = analyzer._build_prompt(frame, ordered, budget_tokens=budget_tokens)
     Path(out_prompt).write_text(prompt, encoding='utf-8')
     print(f'Prompt written to {out_prompt}')
 
@@ -32,5 +33,6 @@ if __name__ == '__main__':
     p.add_argument('--snippets', default='snippets.json')
     p.add_argument('--out', default='prompt.txt')
     p.add_argument('--prefer', help='Prefer snippets containing this filename')
+    p.add_argument('--budget', type=int, default=None, help='Token budget for code snippets (default: PR_ANALYZER_PROMPT_TOKENS or 600)')
     args = p.parse_args()
-    build_prompt_from_snippets(args.trace, args.snippets, args.out, args.prefer)
+    build_prompt_from_snippets(args.trace, args.snippets, args.out, args.prefer, args.budget)
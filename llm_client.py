@@ -5,56 +5,143 @@ Environment variables used:
 - AZURE_OPENAI_ENDPOINT (e.g. https://your-resource-name.openai.azure.com/)
 - AZURE_OPENAI_KEY
 - AZURE_OPENAI_DEPLOYMENT (deployment name for chat/completions)
+
+Responses are cached on disk by `pr_analyzer.llm_cache` when the package is importable, and calls go through
+its `llm_transport` (per-call deadline, retries honouring Retry-After, circuit breaker). Clients are
+long-lived: one per (endpoint, key) and one pooled requests session, so repeated calls reuse connections.
 """
 from __future__ import annotations
 
 import json
 import os
-from typing import Optional
+import threading
+from typing import Dict, Optional, Tuple
+
+API_VERSION = '2023-05-15'
+POOL_SIZE = int(os.environ.get('PR_ANALYZER_LLM_POOL_SIZE', '16'))
+
+_CLIENTS: Dict[Tuple[str, str], object] = {}
+_SESSION = None
+_LOCK = threading.Lock()
 
 
 def _env_ok() -> bool:
     return bool(os.environ.get('AZURE_OPENAI_ENDPOINT') and os.environ.get('AZURE_OPENAI_KEY') and os.environ.get('AZURE_OPENAI_DEPLOYMENT'))
 
 
-def call_azure_openai_system_and_user(system: str, user: str, temperature: float = 0.0) -> Optional[str]:
+MAX_TOKENS = 1500
+
+
+def call_azure_openai_system_and_user(system: str, user: str, temperature: float = 0.0, use_cache: bool = True) -> Optional[str]:
+    """The model's reply; None when Azure OpenAI is not configured. A failed call raises (with
+    pr_analyzer importable: `pr_analyzer.llm_transport.TransportError`, after its retries)."""
     if not _env_ok():
         return None
+    try:
+        from pr_analyzer.llm_cache import cached_completion
+    except ImportError:
+        return _call(system, user, temperature)
+    deployment = os.environ['AZURE_OPENAI_DEPLOYMENT']
+    return cached_completion(system, user, deployment, temperature, MAX_TOKENS, lambda: _call(system, user, temperature), use_cache=use_cache)
+
+
+def _azure_client(endpoint: str, key: str):
+    """Shared AzureOpenAI client (openai>=1) for this endpoint and key; None with an older openai package."""
+    try:
+        from openai import AzureOpenAI
+    except ImportError:
+        return None
+    with _LOCK:
+        client = _CLIENTS.get((endpoint, key))
+        if client is None:
+            import httpx
+            http = httpx.Client(timeout=60, limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE))
+            # retries belong to pr_analyzer's transport when it is there, else to the SDK
+            retries = 0 if _transport(endpoint) is not None else 2
+            try:
+                client = AzureOpenAI(azure_endpoint=endpoint, api_key=key, api_version=API_VERSION, max_retries=retries, http_client=http)
+            except Exception:
+                # a configuration the SDK rejects: use the REST fallback
+                http.close()
+                return None
+            _CLIENTS[(endpoint, key)] = client
+        return client
+
+
+def _session():
+    """Shared requests session for the REST fallback, with a connection pool big enough for concurrent callers."""
+    global _SESSION
+    with _LOCK:
+        if _SESSION is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            _SESSION = requests.Session()
+            _SESSION.mount('https://', HTTPAdapter(pool_maxsize=POOL_SIZE))
+            _SESSION.mount('http://', HTTPAdapter(pool_maxsize=POOL_SIZE))
+        return _SESSION
+
+
+def _transport(endpoint: str):
+    """pr_analyzer's transport for this endpoint (deadline, retries, circuit breaker); None when the package isn't importable."""
+    try:
+        from pr_analyzer.llm_transport import get_transport
+    except ImportError:
+        return None
+    return get_transport(endpoint)
+
+
+def _send(endpoint: str, attempt):
+    transport = _transport(endpoint)
+    # without the transport: one attempt, bounded like a transport attempt would be
+    return transport.call(attempt) if transport is not None else attempt(float(os.environ.get('PR_ANALYZER_LLM_TIMEOUT', '30')))
+
+
+def _call(system: str, user: str, temperature: float) -> str:
+    """One completion; errors (after the transport's retries) are raised, not turned into None."""
     endpoint = os.environ['AZURE_OPENAI_ENDPOINT']
     key = os.environ['AZURE_OPENAI_KEY']
     deployment = os.environ['AZURE_OPENAI_DEPLOYMENT']
+    messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
 
-    # Prefer openai package if available
+    client = _azure_client(endpoint, key)
+    if client is not None:
+        resp = _send(endpoint, lambda timeout: client.chat.completions.create(
+            model=deployment, messages=messages, temperature=temperature, max_tokens=MAX_TOKENS, timeout=timeout))
+        return resp.choices[0].message.content
+
+    # openai<1: module-level configuration
     try:
         import openai
+    except ImportError:
+        openai = None
+    if openai is not None and not hasattr(openai, 'OpenAI'):
         openai.api_type = 'azure'
         openai.api_base = endpoint
         # set to a reasonable api version; change if your deployment requires different
-        openai.api_version = '2023-05-15'
+        openai.api_version = API_VERSION
         openai.api_key = key
-        resp = openai.ChatCompletion.create(
+        resp = _send(endpoint, lambda timeout: openai.ChatCompletion.create(
             engine=deployment,
-            messages=[{"role":"system","content":system},{"role":"user","content":user}],
+            messages=messages,
             temperature=temperature,
-            max_tokens=1500,
-        )
+            max_tokens=MAX_TOKENS,
+            request_timeout=timeout,
+        ))
         return resp.choices[0].message.content
-    except Exception:
-        pass
 
-    # Fallback: try HTTP via requests
-    try:
-        import requests
-        url = endpoint.rstrip('/') + f"/openai/deployments/{deployment}/chat/completions?api-version=2023-05-15"
-        headers = {"Content-Type": "application/json", "api-key": key}
-        payload = {
-            "messages": [{"role": "system", "content": system}, {"role": "user", "content": user}],
-            "temperature": temperature,
-            "max_tokens": 1500,
-        }
-        r = requests.post(url, headers=headers, data=json.dumps(payload), timeout=60)
+    # no usable openai package: plain HTTP via requests
+    url = endpoint.rstrip('/') + f"/openai/deployments/{deployment}/chat/completions?api-version={API_VERSION}"
+    headers = {"Content-Type": "application/json", "api-key": key}
+    payload = {
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": MAX_TOKENS,
+    }
+
+    def post(timeout: float):
+        r = _session().post(url, headers=headers, data=json.dumps(payload), timeout=timeout)
         r.raise_for_status()
-        j = r.json()
-        return j['choices'][0]['message']['content']
-    except Exception:
-        return None
+        return r.json()
+
+    j = _send(endpoint, post)
+    return j['choices'][0]['message']['content']
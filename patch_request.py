@@ -22,10 +22,11 @@ SYSTEM = (
 )
 
 
-def request_patch(prompt_path: str, out_raw: str = 'llm_raw.txt', out_json: str = 'llm_parsed.json'):
+def request_patch(prompt_path: str, out_raw: str = 'llm_raw.txt', out_json: str = 'llm_parsed.json', use_cache: bool = True):
     prompt = Path(prompt_path).read_text(encoding='utf-8')
     print('Calling LLM...')
-    resp = call_azure_openai_system_and_user(SYSTEM, prompt, temperature=0.2)
+    # an identical prompt from an earlier run is answered from the local response cache unless use_cache is False
+    resp = call_azure_openai_system_and_user(SYSTEM, prompt, temperature=0.2, use_cache=use_cache)
     Path(out_raw).write_text(resp, encoding='utf-8')
     print(f'Raw LLM output written to {out_raw}')
     try:
@@ -42,5 +43,6 @@ if __name__ == '__main__':
     p.add_argument('--prompt', default='prompt.txt')
     p.add_argument('--out-raw', default='llm_raw.txt')
     p.add_argument('--out-json', default='llm_parsed.json')
+    p.add_argument('--no-cache', action='store_true', help='Always call the LLM, ignoring cached responses')
     args = p.parse_args()
-    request_patch(args.prompt, args.out_raw, args.out_json)
+    request_patch(args.prompt, args.out_raw, args.out_json, use_cache=not args.no_cache)
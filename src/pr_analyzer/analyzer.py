@@ -1,39 +1,298 @@
-from typing import List, Dict, Any
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor
+from typing import AsyncContextManager, AsyncIterator, Callable, Iterator, List, Dict, Any, Optional, Tuple
+from .cache import TTLCache
+from .fingerprint import fingerprint
+from .indexer import index_version
+from .jsonstream import JSONObjectStream, parse_reply
+from .metrics import RESULT_CACHE, STAGE_SECONDS
 from .parser import parse_stack_trace
-from .retriever import retrieve_for_frame
+from .prompt import pack_snippets
+from .singleflight import SingleFlight
+from .retriever import retrieve_for_frames
 from . import llm
 
+_RESULT_CACHE: Optional[TTLCache] = None
+_RESULT_CACHE_LOCK = threading.Lock()
+_SINGLEFLIGHT: Optional[SingleFlight] = None
+_SINGLEFLIGHT_LOCK = threading.Lock()
 
-def _build_prompt(frame: Dict[str, Any], snippets: List[Dict]) -> str:
+
+def get_result_cache() -> TTLCache:
+    """Finished analyses by trace fingerprint, shared by the process.
+
+    Sized by PR_ANALYZER_RESULT_CACHE_SIZE entries (default 10000, 0 disables) and expired after
+    PR_ANALYZER_RESULT_CACHE_TTL seconds (default 3600), which also bounds how long a result outlives a reindex.
+    """
+    global _RESULT_CACHE
+    with _RESULT_CACHE_LOCK:
+        if _RESULT_CACHE is None:
+            _RESULT_CACHE = TTLCache(
+                max_entries=int(os.getenv("PR_ANALYZER_RESULT_CACHE_SIZE", "10000")),
+                ttl=float(os.getenv("PR_ANALYZER_RESULT_CACHE_TTL", "3600")),
+            )
+        return _RESULT_CACHE
+
+
+def get_singleflight() -> SingleFlight:
+    """Coalesces concurrent async analyses of the same crash; followers wait up to PR_ANALYZER_COALESCE_TIMEOUT
+    seconds (unset or 0: as long as the first analysis takes)."""
+    global _SINGLEFLIGHT
+    with _SINGLEFLIGHT_LOCK:
+        if _SINGLEFLIGHT is None:
+            _SINGLEFLIGHT = SingleFlight(wait_timeout=float(os.getenv("PR_ANALYZER_COALESCE_TIMEOUT", "0")) or None)
+        return _SINGLEFLIGHT
+
+
+def _lookup(stack_trace: str, index_path: str, top_k: int, max_frames: int) -> Tuple[Optional[str], Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    frames = parse_stack_trace(stack_trace)
+    if not frames:
+        return None, None, None
+    # the index version keeps answers retrieved from a rebuilt index from being served out of the cache
+    key = f"{fingerprint(frames)}:{os.path.abspath(index_path)}@{index_version(index_path)}:{top_k}:{max_frames}"
+    hit = get_result_cache().get(key)
+    RESULT_CACHE.inc("miss" if hit is None else "hit")
+    return key, frames[0], (None if hit is None else {**hit, "frame": frames[0]})
+
+
+def cached_analysis(stack_trace: str, index_path: str, top_k: int = 3, max_frames: int = 1) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """(cache key, cached result) for a trace; the key is None for unparseable traces, the result None on a miss.
+
+    Traces that differ only in build paths, line numbers or generic arity share a key (see `fingerprint`).
+    A hit is returned with this trace's own first frame.
+    """
+    key, _, hit = _lookup(stack_trace, index_path, top_k, max_frames)
+    return key, hit
+
+
+def _remember(key: Optional[str], result: Dict[str, Any]) -> Dict[str, Any]:
+    if key is not None and "analysis" in result:
+        get_result_cache().put(key, result)
+    return result
+
+
+def _build_prompt(frame: Dict[str, Any], snippets: List[Dict], budget_tokens: Optional[int] = None) -> str:
+    """Prompt for one frame; the snippets are deduplicated and packed into `budget_tokens` (see `prompt.pack_snippets`)."""
     prompt = (
         "You are an expert senior engineer. Given the following stack frame and code snippets, determine if the root cause is within the repository code or an external dependency.\n\n"
     )
     prompt += f"Stack frame:\n{frame['raw']}\n\n"
-    prompt += "Code snippets (file:chunk_index):\n"
-    for s in snippets:
-        prompt += f"- {s.get('path')}:{s.get('chunk_index')} ->\n{s.get('snippet')[:800].strip()}\n---\n"
+    prompt += "Code snippets (file:first-last line, or file:chunk_index where lines are unknown; the frame's line is marked with '>'):\n"
+    for s in pack_snippets(frame, snippets, budget_tokens):
+        where = f"{s['start_line']}-{s['end_line']}" if s["start_line"] else s["chunk_index"]
+        prompt += f"- {s['path']}:{where} ->\n{s['snippet']}\n---\n"
     prompt += (
         "\nReply JSON with keys: classification (one of 'code','dependency','unknown'), confidence (0-1), explanation (short), and suggested_fix (short steps).\n"
     )
     return prompt
 
 
-def analyze_stack_trace(stack_trace: str, index_path: str, top_k: int = 3) -> Dict[str, Any]:
-    frames = parse_stack_trace(stack_trace)
-    if not frames:
-        return {"error": "no frames parsed"}
+def _merge_snippets(per_frame: List[List[Dict]]) -> List[Dict]:
+    """Flatten per-frame results, keeping the first occurrence of each chunk."""
+    seen = set()
+    merged = []
+    for snippets in per_frame:
+        for s in snippets:
+            key = (s.get("path"), s.get("chunk_index"))
+            if key not in seen:
+                seen.add(key)
+                merged.append(s)
+    return merged
+
+
+def prepare_analysis(stack_trace: str, index_path: str, top_k: int = 3, max_frames: int = 1) -> Dict[str, Any]:
+    """Parse the trace, retrieve code for the top `max_frames` frames (in one batched search) and build the prompt.
+
+    This is the blocking, CPU/disk-bound half of an analysis; it is a plain module-level function so a
+    worker pool (threads or processes) can run it. Returns {"frame", "snippets", "prompt"}, or {"error"}.
+    """
+    return prepare_analyses([stack_trace], index_path, top_k=top_k, max_frames=max_frames)[0]
+
+
+def prepare_analyses(stack_traces: List[str], index_path: str, top_k: int = 3, max_frames: int = 1) -> List[Dict[str, Any]]:
+    """`prepare_analysis` for several traces, with the frames of all of them retrieved in one batched search."""
+    with STAGE_SECONDS.time("parse"):
+        parsed = [parse_stack_trace(t) for t in stack_traces]
+    frame_raws = [f["raw"] for frames in parsed for f in frames[:max_frames]]
+    with STAGE_SECONDS.time("retrieve"):
+        per_frame = iter(retrieve_for_frames(index_path, frame_raws, top_k=top_k) if frame_raws else [])
+    prepared = []
+    with STAGE_SECONDS.time("prompt"):
+        for frames in parsed:
+            if not frames:
+                prepared.append({"error": "no frames parsed"})
+                continue
+            snippets = _merge_snippets([next(per_frame) for _ in frames[:max_frames]])
+            prepared.append({"frame": frames[0], "snippets": snippets, "prompt": _build_prompt(frames[0], snippets)})
+    return prepared
+
 
-    frame = frames[0]
-    snippets = retrieve_for_frame(index_path, frame["raw"], top_k=top_k)
-    prompt = _build_prompt(frame, snippets)
-    raw = llm.ask_llm(prompt)
+def finish_analysis(prepared: Dict[str, Any], raw: str) -> Dict[str, Any]:
+    """Combine a prepared analysis with the LLM's reply."""
+    # the JSON in the reply, also when fenced or preceded by prose; otherwise {"raw_text": raw}
+    return {"frame": prepared["frame"], "snippets": prepared["snippets"], "analysis": parse_reply(raw)}
 
-    # attempt to parse LLM response as JSON; if not JSON, wrap in analysis
-    import json
 
+def analyze_stack_trace(stack_trace: str, index_path: str, top_k: int = 3, max_frames: int = 1) -> Dict[str, Any]:
+    """Retrieve code for the top `max_frames` frames (in one batched search) and ask the LLM about the first.
+
+    Duplicates of an already analyzed crash are answered from `get_result_cache`.
+    """
+    key, hit = cached_analysis(stack_trace, index_path, top_k, max_frames)
+    if hit is not None:
+        return hit
+    prepared = prepare_analysis(stack_trace, index_path, top_k=top_k, max_frames=max_frames)
+    if "error" in prepared:
+        return prepared
+    return _remember(key, finish_analysis(prepared, llm.ask_llm(prepared["prompt"])))
+
+
+def _cached_events(result: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    analysis = result.get("analysis")
+    if isinstance(analysis, dict) and "raw_text" not in analysis:
+        for name, value in analysis.items():
+            yield {"field": name, "value": value}
+    yield {"result": result}
+
+
+def _field_events(parser: JSONObjectStream, piece: str) -> Iterator[Dict[str, Any]]:
+    for name, value in parser.feed(piece).items():
+        yield {"field": name, "value": value}
+
+
+def analyze_stack_trace_stream(stack_trace: str, index_path: str, top_k: int = 3, max_frames: int = 1) -> Iterator[Dict[str, Any]]:
+    """`analyze_stack_trace`, streaming the LLM's reply: yields {"field": name, "value": value} for each
+    top-level field of the reply as soon as it is complete, then {"result": <analyze_stack_trace result>}.
+
+    "classification" and "confidence" come first in the reply, so they arrive well before the explanation
+    is written. A cached analysis yields all its fields at once; an unparseable reply only the result.
+    """
+    key, hit = cached_analysis(stack_trace, index_path, top_k, max_frames)
+    if hit is not None:
+        yield from _cached_events(hit)
+        return
+    prepared = prepare_analysis(stack_trace, index_path, top_k=top_k, max_frames=max_frames)
+    if "error" in prepared:
+        yield {"result": prepared}
+        return
+    parser, parts = JSONObjectStream(), []
+    for piece in llm.ask_llm_stream(prepared["prompt"]):
+        parts.append(piece)
+        yield from _field_events(parser, piece)
+    yield {"result": _remember(key, finish_analysis(prepared, "".join(parts)))}
+
+
+async def analyze_stack_trace_stream_async(
+    stack_trace: str, index_path: str, top_k: int = 3, max_frames: int = 1, executor: Optional[Executor] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """`analyze_stack_trace_stream` for the event loop: retrieval runs on `executor`, the reply is streamed
+    with `llm.ask_llm_stream_async`. Streams are not coalesced; each caller gets its own LLM call."""
+    key, hit = cached_analysis(stack_trace, index_path, top_k, max_frames)
+    if hit is not None:
+        for event in _cached_events(hit):
+            yield event
+        return
+    loop = asyncio.get_running_loop()
+    prepared = await loop.run_in_executor(executor, prepare_analysis, stack_trace, index_path, top_k, max_frames)
+    if "error" in prepared:
+        yield {"result": prepared}
+        return
+    parser, parts = JSONObjectStream(), []
+    async for piece in llm.ask_llm_stream_async(prepared["prompt"]):
+        parts.append(piece)
+        for event in _field_events(parser, piece):
+            yield event
+    yield {"result": _remember(key, finish_analysis(prepared, "".join(parts)))}
+
+
+async def analyze_stack_trace_async(
+    stack_trace: str,
+    index_path: str,
+    top_k: int = 3,
+    max_frames: int = 1,
+    executor: Optional[Executor] = None,
+    admit: Optional[Callable[[], AsyncContextManager[Executor]]] = None,
+) -> Dict[str, Any]:
+    """`analyze_stack_trace` for the event loop: retrieval runs on `executor` (default: the loop's), the LLM call is awaited.
+
+    Cache hits are answered on the loop right away, and concurrent requests for the same crash share one
+    analysis (see `get_singleflight`; followers may raise `CoalesceTimeout`). Uncached work first enters
+    `admit()` when given (e.g. `WorkerPool.slot`), which may wait or reject, and runs on the executor it yields.
+    """
+    key, frame, hit = _lookup(stack_trace, index_path, top_k, max_frames)
+    if hit is not None:
+        return hit
+
+    async def run() -> Dict[str, Any]:
+        if admit is None:
+            return await _analyze_uncached(key, stack_trace, index_path, top_k, max_frames, executor)
+        async with admit() as admitted:
+            return await _analyze_uncached(key, stack_trace, index_path, top_k, max_frames, admitted)
+
+    if key is None:
+        return await run()
+    result = await get_singleflight().do(key, run)
+    return {**result, "frame": frame} if "frame" in result else result
+
+
+async def _analyze_uncached(key: Optional[str], stack_trace: str, index_path: str, top_k: int, max_frames: int, executor: Optional[Executor]) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    prepared = await loop.run_in_executor(executor, prepare_analysis, stack_trace, index_path, top_k, max_frames)
+    if "error" in prepared:
+        return prepared
+    return _remember(key, finish_analysis(prepared, await llm.ask_llm_async(prepared["prompt"])))
+
+
+async def analyze_stack_traces_async(
+    stack_traces: List[str],
+    index_path: str,
+    top_k: int = 3,
+    max_frames: int = 1,
+    executor: Optional[Executor] = None,
+    concurrency: int = 8,
+) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    """Analyze a batch of traces, yielding (position, result) as each one completes.
+
+    Cached traces are yielded first. Retrieval for the rest is one `prepare_analyses` call on `executor`;
+    up to `concurrency` LLM calls are then in flight. A failed retrieval or LLM call yields {"error": ...}
+    for the traces it affects instead of ending the batch.
+    """
+    keys: Dict[int, Optional[str]] = {}
+    for n, trace in enumerate(stack_traces):
+        key, hit = cached_analysis(trace, index_path, top_k, max_frames)
+        if hit is not None:
+            yield n, hit
+        else:
+            keys[n] = key
+    if not keys:
+        return
+    loop = asyncio.get_running_loop()
     try:
-        parsed = json.loads(raw)
-    except Exception:
-        parsed = {"raw_text": raw}
+        prepared = await loop.run_in_executor(executor, prepare_analyses, [stack_traces[n] for n in keys], index_path, top_k, max_frames)
+    except Exception as e:
+        # results may already be streaming to the client, so report the failure per trace
+        for n in keys:
+            yield n, {"error": f"retrieval failed: {e}"}
+        return
+    limit = asyncio.Semaphore(max(1, concurrency))
 
-    return {"frame": frame, "snippets": snippets, "analysis": parsed}
+    async def finish(n: int, p: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        if "error" in p:
+            return n, p
+        try:
+            async with limit:
+                raw = await llm.ask_llm_async(p["prompt"])
+        except Exception as e:
+            return n, {"frame": p["frame"], "snippets": p["snippets"], "error": f"LLM call failed: {e}"}
+        return n, _remember(keys[n], finish_analysis(p, raw))
+
+    tasks = [asyncio.ensure_future(finish(n, p)) for n, p in zip(keys, prepared)]
+    try:
+        for done in asyncio.as_completed(tasks):
+            yield await done
+    finally:
+        # the consumer went away (e.g. client disconnected): don't leave LLM calls running
+        for t in tasks:
+            t.cancel()
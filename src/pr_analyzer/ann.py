@@ -0,0 +1,246 @@
+"""FAISS index construction and tuning for the supported index types.
+
+- flat:  exact brute-force L2 search (default)
+- ivf:   inverted lists over k-means centroids; `nprobe` lists are scanned per query
+- hnsw:  graph-based search; `efSearch` controls the candidate list size
+- ivfpq: inverted lists with product-quantized vectors; smallest RAM, lossy distances
+
+Vector storage is chosen independently of the index type:
+
+- float32: full precision (default)
+- float16: scalar-quantized to half precision (1/2 the RAM)
+- int8:    8-bit scalar quantization (1/4 the RAM)
+- pca:     PCA-reduced to `pca_dim` dimensions before indexing
+
+Every index is wrapped in an IndexIDMap2 so vector ids match the chunk store records.
+"""
+from __future__ import annotations
+
+import json
+import math
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import faiss
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+STORAGE_TYPES = ("float32", "float16", "int8", "pca")
+_CODECS = {"float32": "Flat", "float16": "SQfp16", "int8": "SQ8", "pca": "Flat"}
+# training uses at most this many vectors; FAISS wants ~39 points per IVF centroid and 256 per PQ codebook
+TRAIN_SAMPLE = 100_000
+MIN_POINTS_PER_LIST = 39
+PQ_MIN_TRAIN = 256
+HNSW_M = 32
+DEFAULT_EF_SEARCH = 64
+DEFAULT_NPROBE = 16
+
+
+def params_path(index_path: str) -> str:
+    return index_path + ".params.json"
+
+
+def load_params(index_path: str) -> Dict:
+    try:
+        with open(params_path(index_path), "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except Exception:
+        return {"index_type": "flat"}
+
+
+def save_params(index_path: str, params: Dict):
+    with open(params_path(index_path), "w", encoding="utf-8") as fh:
+        json.dump(params, fh)
+
+
+def supports_remove(index_type: str) -> bool:
+    return index_type != "hnsw"
+
+
+def _pq_m(dim: int) -> int:
+    # aim for 8 dimensions per sub-quantizer; m must divide dim
+    m = max(1, dim // 8)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def _resolve_type(index_type: str, n: int) -> str:
+    """Fall back to a simpler type when there are too few vectors to train the requested one."""
+    if index_type == "ivfpq" and n < PQ_MIN_TRAIN:
+        index_type = "ivf"
+    if index_type in ("ivf", "ivfpq") and n < MIN_POINTS_PER_LIST:
+        index_type = "flat"
+    return index_type
+
+
+def make_index(
+    index_type: str,
+    vectors: np.ndarray,
+    ids: np.ndarray,
+    nlist: Optional[int] = None,
+    storage: str = "float32",
+    pca_dim: Optional[int] = None,
+) -> Tuple[faiss.Index, Dict]:
+    """Create, train and fill an index of `index_type` with `storage`. Returns the index and its search parameters."""
+    import faiss
+
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"unknown index type {index_type!r}; expected one of {', '.join(INDEX_TYPES)}")
+    if storage not in STORAGE_TYPES:
+        raise ValueError(f"unknown storage {storage!r}; expected one of {', '.join(STORAGE_TYPES)}")
+    n, dim = vectors.shape
+    resolved = _resolve_type(index_type, n)
+    if resolved != index_type:
+        print(f"Only {n} vectors: using a {resolved} index instead of {index_type}")
+    params: Dict = {"index_type": resolved, "requested_type": index_type, "storage": storage}
+
+    prefix, d = "", dim
+    if storage == "pca":
+        d = min(pca_dim or max(8, dim // 4), dim)
+        if n < d:
+            print(f"Only {n} vectors: cannot train a {d}-dimensional PCA, storing float32")
+            params["storage"] = "float32"
+        else:
+            prefix = f"PCA{d},"
+            params["pca_dim"] = d
+    codec = _CODECS[params["storage"]]
+
+    if resolved == "flat":
+        spec = prefix + codec
+    elif resolved == "hnsw":
+        spec = prefix + f"HNSW{HNSW_M}" + ("" if codec == "Flat" else "_" + codec)
+        params["efSearch"] = DEFAULT_EF_SEARCH
+    else:
+        nlist = nlist or int(4 * math.sqrt(n))
+        nlist = max(1, min(nlist, n // MIN_POINTS_PER_LIST))
+        # ivfpq is already compressed; the scalar codecs only apply to plain ivf
+        spec = prefix + (f"IVF{nlist},{codec}" if resolved == "ivf" else f"IVF{nlist},PQ{_pq_m(d)}")
+        params.update(nlist=nlist, nprobe=min(nlist, DEFAULT_NPROBE))
+    params.update(factory=spec, trained_on=n)
+
+    index = faiss.IndexIDMap2(faiss.index_factory(dim, spec))
+    if not index.is_trained:
+        sample = vectors
+        if n > TRAIN_SAMPLE:
+            rng = np.random.default_rng(0)
+            sample = vectors[np.sort(rng.choice(n, TRAIN_SAMPLE, replace=False))]
+        index.train(np.ascontiguousarray(sample, dtype=np.float32))
+    if n:
+        index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), ids.astype(np.int64))
+    apply_search_params(index, params)
+    return index, params
+
+
+def _inner(index: faiss.Index) -> faiss.Index:
+    """The index doing the search, below the id map and any PCA transform."""
+    import faiss
+
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexPreTransform):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def reconstruct(index: faiss.Index, ids: np.ndarray) -> np.ndarray:
+    """Decode stored vectors by id (approximate for quantized or PCA storage)."""
+    import faiss
+
+    ivf = faiss.try_extract_index_ivf(_inner(index))
+    if ivf is not None:
+        # IVF needs a temporary id -> list map to look vectors up; it would block remove_ids if kept
+        ivf.make_direct_map()
+    try:
+        return np.vstack([index.reconstruct(int(i)) for i in ids]) if len(ids) else np.zeros((0, index.d), dtype=np.float32)
+    finally:
+        if ivf is not None:
+            ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+
+
+def index_bytes(index: faiss.Index) -> int:
+    import faiss
+
+    return int(faiss.serialize_index(index).size)
+
+
+def apply_search_params(index: faiss.Index, params: Dict):
+    """Set nprobe / efSearch on the index wrapped by an IndexIDMap."""
+    import faiss
+
+    inner = _inner(index)
+    if "nprobe" in params:
+        ivf = faiss.try_extract_index_ivf(inner)
+        if ivf is not None:
+            ivf.nprobe = int(params["nprobe"])
+    if "efSearch" in params and hasattr(inner, "hnsw"):
+        inner.hnsw.efSearch = int(params["efSearch"])
+
+
+def _sample_queries(vectors: np.ndarray, ids: np.ndarray, n_queries: int, top_k: int) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Queries sampled from the stored vectors, their exact top-k ids and the exact search latency (ms/query)."""
+    import faiss
+
+    rng = np.random.default_rng(0)
+    n = len(vectors)
+    queries = np.ascontiguousarray(vectors[rng.choice(n, min(n_queries, n), replace=False)], dtype=np.float32)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    t0 = time.perf_counter()
+    _, truth = exact.search(queries, top_k)
+    exact_ms = 1000.0 * (time.perf_counter() - t0) / len(queries)
+    return queries, np.asarray(ids)[truth], exact_ms
+
+
+def _measure(index: faiss.Index, queries: np.ndarray, truth: np.ndarray, top_k: int) -> Tuple[float, float]:
+    t0 = time.perf_counter()
+    _, found = index.search(queries, top_k)
+    elapsed = time.perf_counter() - t0
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / float(truth.size), 1000.0 * elapsed / len(queries)
+
+
+def benchmark(index: faiss.Index, vectors: np.ndarray, ids: np.ndarray, params: Dict, n_queries: int = 200, top_k: int = 10, sweep: Optional[List[int]] = None) -> List[Dict]:
+    """Recall@k, mean latency and size of `index` against exact float32 search, sweeping nprobe or efSearch.
+
+    `vectors` are full-precision vectors for `ids`; queries are sampled from them. The first row is the
+    exact flat float32 baseline on the same queries.
+    """
+    n = len(vectors)
+    if n == 0:
+        return []
+    queries, truth, exact_ms = _sample_queries(vectors, ids, n_queries, top_k)
+    rows = [{"param": "exact", "value": None, "storage": "float32", "recall": 1.0, "latency_ms": exact_ms, "bytes_per_vector": 4.0 * vectors.shape[1]}]
+    size = index_bytes(index) / float(max(1, index.ntotal))
+
+    if params.get("index_type") in ("ivf", "ivfpq"):
+        name = "nprobe"
+        sweep = sweep or sorted({v for v in (1, 2, 4, 8, 16, 32, 64, 128) if v <= params["nlist"]} | {params["nprobe"]})
+    elif params.get("index_type") == "hnsw":
+        name = "efSearch"
+        sweep = sweep or sorted({16, 32, 64, 128, 256, params["efSearch"]})
+    else:
+        name, sweep = None, [None]
+
+    for value in sweep:
+        if name:
+            apply_search_params(index, {name: value})
+        recall, latency = _measure(index, queries, truth, top_k)
+        rows.append({"param": name, "value": value, "storage": params.get("storage", "float32"), "recall": recall, "latency_ms": latency, "bytes_per_vector": size})
+    apply_search_params(index, params)
+    return rows
+
+
+def compare_storage(vectors: np.ndarray, ids: np.ndarray, index_type: str = "flat", n_queries: int = 200, top_k: int = 10, pca_dim: Optional[int] = None, nlist: Optional[int] = None) -> List[Dict]:
+    """Build `index_type` once per storage option in memory and report recall loss vs exact float32 search."""
+    if len(vectors) == 0:
+        return []
+    queries, truth, exact_ms = _sample_queries(vectors, ids, n_queries, top_k)
+    rows = [{"storage": "exact", "recall": 1.0, "latency_ms": exact_ms, "bytes_per_vector": 4.0 * vectors.shape[1]}]
+    for storage in STORAGE_TYPES:
+        index, params = make_index(index_type, vectors, ids, nlist=nlist, storage=storage, pca_dim=pca_dim)
+        recall, latency = _measure(index, queries, truth, top_k)
+        rows.append({"storage": params["storage"] if params["storage"] == storage else f"{storage}->{params['storage']}", "factory": params["factory"], "recall": recall, "latency_ms": latency, "bytes_per_vector": index_bytes(index) / float(max(1, index.ntotal))})
+    return rows
@@ -0,0 +1,76 @@
+"""Append-only chunk text store.
+
+Chunk texts are appended to a single UTF-8 blob (`<index>.chunks`) and their
+(offset, length) pairs to a raw int64 table (`<index>.offsets`). Record `i`
+belongs to vector `i` of the FAISS index. At query time the blob is
+memory-mapped so fetching a snippet is a slice of the mapping rather than a
+re-read and re-chunk of the source file.
+"""
+import mmap
+import os
+from typing import List, Optional
+
+import numpy as np
+
+
+class ChunkStore:
+    def __init__(self, blob_path: str, offsets_path: str):
+        self.blob_path = blob_path
+        self.offsets_path = offsets_path
+        self._fh = None
+        self._mm: Optional[mmap.mmap] = None
+        self._view: Optional[memoryview] = None
+        self._offsets = np.zeros((0, 2), dtype=np.int64)
+
+    @staticmethod
+    def count(offsets_path: str) -> int:
+        """Number of records on disk, without opening the blob."""
+        try:
+            return os.path.getsize(offsets_path) // 16
+        except OSError:
+            return 0
+
+    @staticmethod
+    def append(blob_path: str, offsets_path: str, texts: List[str]):
+        """Append chunk texts to the blob and their (offset, length) records to the table."""
+        if not texts:
+            return
+        with open(blob_path, "ab") as blob:
+            start = blob.tell()
+            records = np.empty((len(texts), 2), dtype=np.int64)
+            for i, t in enumerate(texts):
+                data = t.encode("utf-8")
+                blob.write(data)
+                records[i] = (start, len(data))
+                start += len(data)
+        # offsets are written after the blob so a crash never leaves records pointing past its end
+        with open(offsets_path, "ab") as fh:
+            fh.write(records.tobytes())
+
+    def open(self) -> "ChunkStore":
+        self._offsets = np.fromfile(self.offsets_path, dtype=np.int64).reshape(-1, 2)
+        self._fh = open(self.blob_path, "rb")
+        if os.fstat(self._fh.fileno()).st_size > 0:
+            self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mm)
+        return self
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def get(self, i: int) -> str:
+        start, length = self._offsets[i]
+        if self._view is None or length == 0:
+            return ""
+        return str(self._view[start : start + length], "utf-8")
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
@@ -1,22 +1,14 @@
 import click
-import uvicorn
-from fastapi import FastAPI
-from pydantic import BaseModel
-import json
-from .indexer import build_index, search_index
-from .parser import parse_stack_trace
-from .analyzer import analyze_stack_trace
+import os
 
-app = FastAPI()
 
-class AnalyzeRequest(BaseModel):
-    stack_trace: str
+def __getattr__(name):
+    # `uvicorn pr_analyzer.cli:app` keeps working; the web stack is only imported when asked for
+    if name == "app":
+        from .server import app
 
-@app.post("/analyze")
-async def analyze(req: AnalyzeRequest):
-    index_path = getattr(app.state, "index_path", "./index.faiss")
-    result = analyze_stack_trace(req.stack_trace, index_path, top_k=3)
-    return result
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 @click.group()
 def main():
@@ -27,19 +19,87 @@ def main():
 @click.option("--index-path", default="./index.faiss")
 @click.option("--chunk-size", default=1024, type=int, help="Chunk size for code splitting")
 @click.option("--use-openai-embeddings", is_flag=True, default=False, help="Use OpenAI embeddings instead of sentence-transformers")
-def index(repo, index_path):
+@click.option("--jobs", default=1, type=int, help="Worker processes for reading/chunking files (0 = one per CPU)")
+@click.option("--index-type", type=click.Choice(["flat", "ivf", "hnsw", "ivfpq"]), default=None, help="FAISS index type (default: keep the existing type, flat for new indexes)")
+@click.option("--nlist", default=None, type=int, help="IVF list count (default: 4*sqrt(n))")
+@click.option("--no-embed-cache", is_flag=True, default=False, help="Don't read or write the shared embedding cache")
+@click.option("--storage", type=click.Choice(["float32", "float16", "int8", "pca"]), default=None, help="Vector storage in the index (default: keep the existing choice, float32 for new indexes)")
+@click.option("--pca-dim", default=None, type=int, help="Target dimensions for --storage pca (default: dim/4)")
+@click.option("--raw-vectors/--no-raw-vectors", default=None, help="Keep the full-precision .vecs copy (default: keep the existing choice, on for new indexes)")
+@click.option("--shard-by", default=None, help="Split the index into shards: 'dir' (one per top-level directory) or 'hash:N' (N buckets)")
+@click.option("--shard", "shards", multiple=True, help="Only index this shard (repeatable)")
+@click.option("--rebuild", is_flag=True, default=False, help="Discard the index (or the selected shards) and build from scratch")
+def index(repo, index_path, chunk_size, use_openai_embeddings, jobs, index_type, nlist, no_embed_cache, storage, pca_dim, raw_vectors, shard_by, shards, rebuild):
     # note: default chunk and model may be overridden
     from .indexer import build_index
 
-    build_index(repo, index_path)
+    build_index(repo, index_path, chunk_size=chunk_size, use_openai=use_openai_embeddings, jobs=jobs or os.cpu_count() or 1, index_type=index_type, nlist=nlist, embed_cache=not no_embed_cache, storage=storage, pca_dim=pca_dim, keep_vectors=raw_vectors, shard_by=shard_by, shards=list(shards) or None, rebuild=rebuild)
+
+@main.command()
+@click.option("--index-path", default="./index.faiss")
+@click.option("--queries", default=200, type=int, help="Number of stored vectors used as queries")
+@click.option("--top-k", default=10, type=int)
+@click.option("--compare-storage", is_flag=True, default=False, help="Compare recall/size of every storage option instead of sweeping search parameters")
+def bench(index_path, queries, top_k, compare_storage):
+    """Print recall@k vs latency (and bytes per vector) against exact float32 search."""
+    from .indexer import shard_paths
+
+    shards = shard_paths(index_path)
+    if shards:
+        for shard in shards:
+            click.echo(f"== {shard}")
+            _bench_one(shard, queries, top_k, compare_storage)
+        return
+    _bench_one(index_path, queries, top_k, compare_storage)
+
+
+def _bench_one(index_path, queries, top_k, compare_storage):
+    from .indexer import benchmark_index
+
+    rows = benchmark_index(index_path, n_queries=queries, top_k=top_k, compare_storage=compare_storage)
+    if compare_storage:
+        click.echo(f"{'storage':>18} {'recall@' + str(top_k):>10} {'ms/query':>10} {'bytes/vec':>10}")
+        for r in rows:
+            click.echo(f"{r['storage']:>18} {r['recall']:>10.3f} {r['latency_ms']:>10.3f} {r['bytes_per_vector']:>10.1f}")
+        return
+    click.echo(f"{'param':>10} {'value':>8} {'storage':>8} {'recall@' + str(top_k):>10} {'ms/query':>10} {'bytes/vec':>10}")
+    for r in rows:
+        click.echo(f"{str(r['param'] or '-'):>10} {str(r['value'] or '-'):>8} {r['storage']:>8} {r['recall']:>10.3f} {r['latency_ms']:>10.3f} {r['bytes_per_vector']:>10.1f}")
+
+@main.command()
+@click.option("--index-path", default="./index.faiss")
+@click.option("--nprobe", default=None, type=int, help="IVF lists scanned per query")
+@click.option("--ef-search", default=None, type=int, help="HNSW candidate list size")
+def tune(index_path, nprobe, ef_search):
+    """Persist search parameters picked from `bench`."""
+    from .indexer import set_search_params
+
+    set_search_params(index_path, nprobe=nprobe, ef_search=ef_search)
 
 @main.command()
 @click.option("--index-path", default="./index.faiss")
 @click.option("--host", default="127.0.0.1")
 @click.option("--port", default=8000)
-def serve(index_path, host, port):
-    # store index_path in app state for handlers
+@click.option("--workers", default=None, type=int, help="Analysis worker threads/processes (default: CPU count + 4)")
+@click.option("--worker-kind", type=click.Choice(["thread", "process"]), default=None, help="Run retrieval in threads (default) or processes")
+@click.option("--max-concurrency", default=None, type=int, help="Analyses in flight at once (default: --workers)")
+@click.option("--queue-depth", default=None, type=int, help="Requests allowed to wait for a slot before 429s (default 64)")
+@click.option("--reload-interval", default=None, type=float, help="Seconds between checks for a rebuilt index to swap in (default 5, 0 disables)")
+@click.option("--repo", "repo_path", default=None, help="Repository diagnosed by POST /jobs (default: PR_ANALYZER_REPO)")
+@click.option("--job-workers", default=None, type=int, help="Background jobs run at once (default 2)")
+@click.option("--job-queue-length", default=None, type=int, help="Queued jobs before POST /jobs returns 429 (default 100)")
+def serve(index_path, host, port, workers, worker_kind, max_concurrency, queue_depth, reload_interval, repo_path, job_workers, job_queue_length):
+    import uvicorn
+    from .jobs import JobQueue, JobStore
+    from .server import app
+    from .workers import WorkerPool
+
+    # store index_path and the worker pool settings in app state for handlers
     app.state.index_path = index_path
+    app.state.pool = WorkerPool(workers=workers, kind=worker_kind, max_concurrency=max_concurrency, queue_depth=queue_depth)
+    app.state.reload_interval = reload_interval
+    app.state.repo_path = repo_path
+    app.state.jobs = JobQueue(JobStore(), workers=job_workers, max_queued=job_queue_length)
     uvicorn.run(app, host=host, port=port)
 
 if __name__ == "__main__":
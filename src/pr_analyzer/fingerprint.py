@@ -0,0 +1,47 @@
+"""Stable signatures for stack traces.
+
+The same crash arrives with different build paths (`F:\\dbs\\sh\\5uj5\\0401_102801\\src\\Foo.cs`), line
+numbers and generic arity (`List`1`, `Dictionary<TKey, TValue>`). `signature` reduces the frames from
+`parser.parse_stack_trace` to file basename + function name per frame so those variants compare equal,
+and `fingerprint` hashes that into a short cache key.
+"""
+import hashlib
+import re
+from typing import Dict, List, Optional
+
+# frames beyond the top ones rarely tell two crashes apart, but vary with the caller
+FINGERPRINT_FRAMES = 8
+
+_ARITY_RE = re.compile(r"`\d+")
+_GENERIC_ARGS_RE = re.compile(r"<[^<>()]*>|\[\[[^\]]*\]\]")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def _basename(path: str) -> str:
+    # traces from Windows builds show up on Linux hosts and vice versa, so split on both separators
+    return re.split(r"[\\/]", path.strip())[-1].lower()
+
+
+def normalize_func(func: str) -> str:
+    """Function/method name without generic arity or generic arguments, whitespace collapsed."""
+    func = _ARITY_RE.sub("", func or "")
+    # strip innermost generic argument lists until none are left (nested generics)
+    while True:
+        stripped = _GENERIC_ARGS_RE.sub("", func)
+        if stripped == func:
+            break
+        func = stripped
+    return _SPACE_RE.sub(" ", func).strip()
+
+
+def normalize_frame(frame: Dict) -> str:
+    return f"{frame.get('lang')}|{_basename(frame.get('file') or '')}|{normalize_func(frame.get('func') or '')}"
+
+
+def signature(frames: List[Dict], max_frames: Optional[int] = FINGERPRINT_FRAMES) -> str:
+    """Newline-joined normalized frames (top `max_frames`); equal for duplicates of the same crash."""
+    return "\n".join(normalize_frame(f) for f in frames[:max_frames])
+
+
+def fingerprint(frames: List[Dict], max_frames: Optional[int] = FINGERPRINT_FRAMES) -> str:
+    return hashlib.sha1(signature(frames, max_frames).encode("utf-8")).hexdigest()
@@ -1,20 +1,39 @@
+from __future__ import annotations
+
 import os
 import hashlib
+import heapq
 import json
-from typing import List, Dict, Optional
-
-try:
-    from sentence_transformers import SentenceTransformer
-except Exception:
-    SentenceTransformer = None
+import queue
+import shutil
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Iterator, List, Dict, Optional, Tuple
 
-import faiss
 import numpy as np
-import openai
+
+# faiss, sentence-transformers (torch) and the HTTP stack are imported where first used,
+# so importing this module (and the CLI) stays cheap
+if TYPE_CHECKING:
+    import faiss
+
+from . import ann
+from .cache import DiskLRUCache, cache_dir
+from .chunkstore import ChunkStore
+from .lexical import LexicalIndex
+from .metastore import MetaStore
+from .metrics import BUILD_CHUNKS, BUILD_STAGE_SECONDS, STAGE_SECONDS
 
 
 DEFAULT_MODEL = "all-MiniLM-L6-v2"
+DEFAULT_OPENAI_MODEL = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-ada-002")
 DEFAULT_CHUNK = 1024
+# chunks handed to the embedding model per call, files per ingestion task, batches buffered between stages
+EMBED_BATCH = 256
+FILES_PER_TASK = 32
+QUEUE_DEPTH = 8
 
 
 def _walk_files(repo_path: str) -> List[str]:
@@ -42,12 +61,144 @@ def _chunk_code(code: str, chunk_size: int = DEFAULT_CHUNK) -> List[str]:
     return chunks
 
 
+def _ingest_files(paths: List[str], chunk_size: int) -> List[Tuple[str, int, str, str]]:
+    """Read, chunk and hash a group of files. Runs in worker processes, so it must stay a picklable top-level function."""
+    records = []
+    for p in paths:
+        code = _read_file(p)
+        for i, chunk in enumerate(_chunk_code(code, chunk_size)):
+            records.append((p, i, chunk, hashlib.sha1(chunk.encode()).hexdigest()))
+    return records
+
+
+def _iter_chunk_batches(files: List[str], chunk_size: int, jobs: int = 1, batch_size: int = EMBED_BATCH) -> Iterator[List[Tuple[str, int, str, str]]]:
+    """Yield batches of (path, chunk_index, text, hash) in walk order.
+
+    With jobs > 1 the files are ingested by a process pool on a background thread and handed over
+    through a bounded queue, so reading/chunking/hashing overlaps with embedding in the caller.
+    Output order is identical to the serial path.
+    """
+    groups = [files[i : i + FILES_PER_TASK] for i in range(0, len(files), FILES_PER_TASK)]
+    if jobs <= 1:
+        batch: List[Tuple[str, int, str, str]] = []
+        for g in groups:
+            batch.extend(_ingest_files(g, chunk_size))
+            while len(batch) >= batch_size:
+                yield batch[:batch_size]
+                batch = batch[batch_size:]
+        if batch:
+            yield batch
+        return
+
+    q: "queue.Queue" = queue.Queue(maxsize=QUEUE_DEPTH)
+    done = object()
+    stop = threading.Event()
+
+    def put(item):
+        # give up when the consumer went away instead of blocking on a full queue forever
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise _IngestStopped()
+
+    def produce():
+        ex = ProcessPoolExecutor(max_workers=jobs)
+        try:
+            batch = []
+            pending = deque()
+            for g in groups:
+                pending.append(ex.submit(_ingest_files, g, chunk_size))
+                # keep a bounded window of tasks in flight; results are consumed in submission order
+                while len(pending) >= jobs * 2 or (pending and pending[0].done()):
+                    batch.extend(pending.popleft().result())
+                    while len(batch) >= batch_size:
+                        put(batch[:batch_size])
+                        batch = batch[batch_size:]
+            while pending:
+                batch.extend(pending.popleft().result())
+                while len(batch) >= batch_size:
+                    put(batch[:batch_size])
+                    batch = batch[batch_size:]
+            if batch:
+                put(batch)
+            put(done)
+        except _IngestStopped:
+            pass
+        except BaseException as e:  # surface worker failures in the consuming thread
+            try:
+                put(e)
+            except _IngestStopped:
+                pass
+        finally:
+            ex.shutdown(wait=True, cancel_futures=True)
+
+    producer = threading.Thread(target=produce, name="pr-analyzer-ingest", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = q.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # the consumer may stop early (embedding error, generator closed): stop the producer and its pool
+        stop.set()
+        producer.join()
+
+
+class _IngestStopped(Exception):
+    pass
+
+
 def _meta_path(index_path: str) -> str:
+    # legacy JSON metadata list, only read when migrating to the metadata store
     return index_path + ".meta"
 
 
 def _emb_path(index_path: str) -> str:
-    return index_path + ".npy"
+    # raw float32 rows, one per vector id, appended on every build (debugging / retraining copy)
+    return index_path + ".vecs"
+
+
+def _checkpoint_dir(index_path: str) -> str:
+    return index_path + ".embed-ckpt"
+
+
+def _metadb_path(index_path: str) -> str:
+    return index_path + ".meta.db"
+
+
+def _lex_path(index_path: str) -> str:
+    return index_path + ".lex.db"
+
+
+def _manifest_path(index_path: str) -> str:
+    # legacy JSON manifest, only read when migrating to the metadata store
+    return index_path + ".manifest.json"
+
+
+def _chunks_path(index_path: str) -> str:
+    return index_path + ".chunks"
+
+
+def _offsets_path(index_path: str) -> str:
+    return index_path + ".offsets"
+
+
+def _read_chunk_from_source(m: Dict) -> str:
+    """Legacy snippet lookup: re-read and re-chunk the source file (indexes built without a chunk store)."""
+    try:
+        code = _read_file(m["path"])
+        # stores migrated before missing chunk sizes were defaulted hold 0 for them
+        chunks = _chunk_code(code, chunk_size=int(m.get("chunk_size") or DEFAULT_CHUNK))
+        return chunks[m["chunk_index"]] if m["chunk_index"] < len(chunks) else ""
+    except Exception:
+        return ""
 
 
 class EmbeddingProvider:
@@ -63,12 +214,29 @@ class EmbeddingProvider:
             self._dim = 8
             return
 
-        if not use_openai and SentenceTransformer is None:
+        if use_openai:
+            from .openai_embed import OpenAIEmbedder
+
+            # the sentence-transformers default is not an OpenAI model name
+            self.openai = OpenAIEmbedder(DEFAULT_OPENAI_MODEL if model_name == DEFAULT_MODEL else model_name)
+            return
+        try:
+            from sentence_transformers import SentenceTransformer
+        except Exception:
             raise RuntimeError("sentence-transformers not available in environment")
-        if not use_openai:
-            self.model = SentenceTransformer(model_name)
+        self.model = SentenceTransformer(model_name)
+
+    @staticmethod
+    def cache_namespace(model_name: str = DEFAULT_MODEL, use_openai: bool = False) -> str:
+        """Identifies the vectors a provider produces, for keying the shared embedding cache."""
+        if os.getenv("PR_ANALYZER_UNIT_TEST", "0") == "1":
+            return "unit-test"
+        if use_openai:
+            return "openai:" + (DEFAULT_OPENAI_MODEL if model_name == DEFAULT_MODEL else model_name)
+        return "st:" + model_name
 
-    def embed(self, texts: List[str]) -> np.ndarray:
+    def embed(self, texts: List[str], checkpoint_dir: Optional[str] = None) -> np.ndarray:
+        """Embed texts. `checkpoint_dir` lets remote (OpenAI) runs resume from finished batches."""
         if self._test_mode:
             # deterministic small embeddings for tests: hash -> bytes -> floats
             arrs = []
@@ -80,96 +248,896 @@ class EmbeddingProvider:
                 arrs.append(vals)
             return np.vstack(arrs)
         if self.use_openai:
-            # batch via OpenAI
-            embs = []
-            for t in texts:
-                resp = openai.Embedding.create(input=t, model=self.model_name)
-                embs.append(np.array(resp["data"][0]["embedding"]))
-            return np.vstack(embs)
+            return self.openai.embed(texts, checkpoint_dir=checkpoint_dir)
         else:
             return self.model.encode(texts, show_progress_bar=False, convert_to_numpy=True)
 
 
-def build_index(repo_path: str, index_path: str, chunk_size: int = DEFAULT_CHUNK, model_name: str = DEFAULT_MODEL, use_openai: bool = False):
-    """Index the repo into a FAISS index at `index_path`. Supports incremental runs by skipping previously hashed chunks."""
-    files = _walk_files(repo_path)
-    provider = EmbeddingProvider(model_name=model_name, use_openai=use_openai)
+# process-wide caches: embedding providers keyed by (model, use_openai), open index handles keyed by abspath
+_PROVIDERS: Dict[Tuple[str, bool], EmbeddingProvider] = {}
+_HANDLES: Dict[str, "IndexHandle"] = {}
+_LOCK = threading.RLock()
+# paths reloaded in the background by an `IndexWatcher`: requests keep using the resident handle even when it is stale
+_WATCHED: Dict[str, "IndexWatcher"] = {}
+_RELOAD_LOCK = threading.Lock()
+
+
+def get_provider(model_name: str = DEFAULT_MODEL, use_openai: bool = False) -> EmbeddingProvider:
+    """Return a shared EmbeddingProvider so the model is loaded once per process."""
+    key = (model_name, use_openai)
+    with _LOCK:
+        provider = _PROVIDERS.get(key)
+        if provider is None:
+            provider = EmbeddingProvider(model_name=model_name, use_openai=use_openai)
+            _PROVIDERS[key] = provider
+        return provider
+
+
+_EMBED_CACHE: Optional[DiskLRUCache] = None
+
+
+def get_embedding_cache() -> DiskLRUCache:
+    """Process-wide embedding cache keyed by (model, chunk sha1), shared by every index built on this machine.
+
+    Location and cap: PR_ANALYZER_EMBED_CACHE (default <cache dir>/embeddings.sqlite) and
+    PR_ANALYZER_EMBED_CACHE_MB (default 2048).
+    """
+    global _EMBED_CACHE
+    with _LOCK:
+        if _EMBED_CACHE is None:
+            path = os.getenv("PR_ANALYZER_EMBED_CACHE") or os.path.join(cache_dir(), "embeddings.sqlite")
+            _EMBED_CACHE = DiskLRUCache(path, max_bytes=int(os.getenv("PR_ANALYZER_EMBED_CACHE_MB", "2048")) * 1024 * 1024)
+        return _EMBED_CACHE
 
-    metas: List[Dict] = []
-    existing_hashes = set()
-    if os.path.exists(_meta_path(index_path)):
+
+def _index_signature(index_path: str) -> Tuple:
+    """(mtime, size) of every on-disk file backing the index; changes when the index is rebuilt."""
+    sig = []
+    for p in (index_path, _metadb_path(index_path), _offsets_path(index_path), _lex_path(index_path), ann.params_path(index_path)):
         try:
-            metas = json.load(open(_meta_path(index_path), "r", encoding="utf-8"))
-            existing_hashes = {m.get("hash") for m in metas if m.get("hash")}
-        except Exception:
-            metas = []
+            st = os.stat(p)
+            sig.append((p, st.st_mtime_ns, st.st_size))
+        except OSError:
+            sig.append((p, None, None))
+    return tuple(sig)
+
+
+class _Resident:
+    """Use counting for registry handles: a handle replaced by a reload is closed once its last user is done."""
+
+    _users = 0
+    _retired = False
+
+    def acquire(self):
+        with _LOCK:
+            self._users += 1
+
+    def release(self):
+        with _LOCK:
+            self._users -= 1
+            free = self._retired and self._users == 0
+        if free:
+            self._free()
+
+    def retire(self):
+        """Called when the registry drops this handle; frees it now or when the last user releases it."""
+        with _LOCK:
+            self._retired = True
+            free = self._users == 0
+        if free:
+            self._free()
+
+    def _free(self):
+        raise NotImplementedError
+
+
+class IndexHandle(_Resident):
+    """Resident view of an on-disk index: FAISS index, chunk metadata and the query embedding provider."""
+
+    def __init__(self, index_path: str, model_name: str = DEFAULT_MODEL):
+        import faiss
+
+        self.index_path = index_path
+        self.model_name = model_name
+        # take the signature before reading so a concurrent rebuild is detected on the next check
+        self.signature = _index_signature(index_path)
+        self.index = faiss.read_index(index_path)
+        self.params = ann.load_params(index_path)
+        ann.apply_search_params(self.index, self.params)
+        # queries must be embedded by the same model the index was built with
+        emb = self.params.get("embedding", {})
+        self.provider = get_provider(emb.get("model", model_name), emb.get("use_openai", False))
+        self.metas = open_meta(index_path, readonly=True)
+        if self.metas is None:
+            raise FileNotFoundError(f"no chunk metadata for index {index_path}")
+        self.chunks: Optional[ChunkStore] = None
+        # only trust the chunk store when it lines up record-for-record with the metadata
+        if os.path.exists(_chunks_path(index_path)) and ChunkStore.count(_offsets_path(index_path)) == len(self.metas):
+            self.chunks = ChunkStore(_chunks_path(index_path), _offsets_path(index_path)).open()
+        self.lexical: Optional[LexicalIndex] = None
+        if os.path.exists(_lex_path(index_path)):
+            self.lexical = LexicalIndex(_lex_path(index_path), readonly=True)
+
+    def snippet(self, idx: int) -> str:
+        if self.chunks is not None:
+            return self.chunks.get(idx)
+        return _read_chunk_from_source(self.metas.get(idx) or {})
+
+    def is_stale(self) -> bool:
+        return _index_signature(self.index_path) != self.signature
+
+    def vector_search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """(id, L2 distance) of the nearest chunks, closest first."""
+        return self.vector_search_many([query], top_k)[0]
+
+    def vector_search_many(self, queries: List[str], top_k: int = 5) -> List[List[Tuple[int, float]]]:
+        """Nearest chunks for several queries with one embedding batch and one matrix search."""
+        if not queries:
+            return []
+        with STAGE_SECONDS.time("embed"):
+            q_emb = np.ascontiguousarray(self.provider.embed(queries), dtype=np.float32)
+        return self.search_vectors(q_emb, top_k)
+
+    def search_vectors(self, q_emb: np.ndarray, top_k: int = 5) -> List[List[Tuple[int, float]]]:
+        """Nearest chunks for already-embedded queries."""
+        with STAGE_SECONDS.time("vector_search"):
+            D, I = self.index.search(q_emb, top_k)
+        return [[(int(i), float(d)) for i, d in zip(row_i, row_d) if i >= 0] for row_i, row_d in zip(I, D)]
+
+    def lexical_search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """(id, BM25 score) of the best identifier matches; empty for indexes built without a lexical index."""
+        if self.lexical is None:
+            return []
+        with STAGE_SECONDS.time("lexical_search"):
+            return self.lexical.search(query, top_k)
+
+    def has_identifier(self, cid: int, term: str) -> bool:
+        """Whether chunk `cid` contains `term` as a whole identifier (always False without a lexical index)."""
+        return self.lexical is not None and self.lexical.has_term(cid, term)
+
+    def fetch(self, hits: List[Tuple[int, float]]) -> List[Dict]:
+        """Metadata plus snippet for (id, score) hits, in the given order."""
+        return self.fetch_many([hits])[0]
+
+    def fetch_many(self, hit_lists: List[List[Tuple[int, float]]]) -> List[List[Dict]]:
+        """Like `fetch` for several hit lists; chunks shared between lists are looked up and read once."""
+        unique = list(dict.fromkeys(i for hits in hit_lists for i, _ in hits))
+        with STAGE_SECONDS.time("fetch"):
+            metas = self.metas.get_many(unique)
+            snippets = {i: self.snippet(i) for i in unique if i in metas}
+        return [[{**metas[i], "snippet": snippets[i], "score": score} for i, score in hits if i in metas] for hits in hit_lists]
+
+    def search(self, query: str, top_k: int = 5) -> List[Dict]:
+        return self.fetch(self.vector_search(query, top_k))
+
+    def search_many(self, queries: List[str], top_k: int = 5) -> List[List[Dict]]:
+        return self.fetch_many(self.vector_search_many(queries, top_k))
+
+    def close(self):
+        """Drop the in-memory index and metadata and remove this handle from the registry."""
+        with _LOCK:
+            key = os.path.abspath(self.index_path)
+            if _HANDLES.get(key) is self:
+                del _HANDLES[key]
+        self._free()
+
+    def _free(self):
+        if self.chunks is not None:
+            self.chunks.close()
+            self.chunks = None
+        if self.metas is not None:
+            self.metas.close()
+            self.metas = None
+        if self.lexical is not None:
+            self.lexical.close()
+            self.lexical = None
+        self.index = None
+
+
+# shard number is kept in the high bits of the ids a sharded handle hands out
+SHARD_SHIFT = 40
+_FANOUT_POOL: Optional[ThreadPoolExecutor] = None
+
+
+def _fanout_pool() -> ThreadPoolExecutor:
+    global _FANOUT_POOL
+    with _LOCK:
+        if _FANOUT_POOL is None:
+            _FANOUT_POOL = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 2), thread_name_prefix="shard-search")
+        return _FANOUT_POOL
+
+
+class ShardedIndexHandle(_Resident):
+    """Index split into shards (see `build_index(shard_by=...)`), searched in parallel and merged.
+
+    Same query interface as `IndexHandle`. Ids are global: shard number << SHARD_SHIFT | id within the shard,
+    so they are only meaningful to the handle that returned them.
+    """
+
+    def __init__(self, index_path: str, model_name: str = DEFAULT_MODEL):
+        self.index_path = index_path
+        self.model_name = model_name
+        self.signature = _index_signature(_shard_manifest_path(index_path))
+        # unchanged shards come straight from the registry, so reloading after one shard is rebuilt is cheap
+        self.shards = [_current_handle(p, model_name)[0] for p in shard_paths(index_path)]
+
+    def is_stale(self) -> bool:
+        return _index_signature(_shard_manifest_path(self.index_path)) != self.signature or any(s.is_stale() for s in self.shards)
+
+    def _map(self, fn) -> List:
+        """Run fn(shard_no, shard) on every shard concurrently; FAISS and SQLite release the GIL while searching."""
+        if len(self.shards) <= 1:
+            return [fn(n, s) for n, s in enumerate(self.shards)]
+        return list(_fanout_pool().map(lambda a: fn(*a), enumerate(self.shards)))
+
+    def _merge(self, per_shard: List[List[List[Tuple[int, float]]]], top_k: int, largest: bool) -> List[List[Tuple[int, float]]]:
+        pick = heapq.nlargest if largest else heapq.nsmallest
+        merged = []
+        for q in range(len(per_shard[0]) if per_shard else 0):
+            hits = [((n << SHARD_SHIFT) | cid, score) for n, lists in enumerate(per_shard) for cid, score in lists[q]]
+            merged.append(pick(top_k, hits, key=lambda h: h[1]))
+        return merged
+
+    def vector_search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        return self.vector_search_many([query], top_k)[0]
+
+    def vector_search_many(self, queries: List[str], top_k: int = 5) -> List[List[Tuple[int, float]]]:
+        """Embed once, search every shard for its own top_k and keep the global top_k by distance."""
+        if not queries:
+            return []
+        if not self.shards:
+            return [[] for _ in queries]
+        with STAGE_SECONDS.time("embed"):
+            q_emb = np.ascontiguousarray(self.shards[0].provider.embed(queries), dtype=np.float32)
+        return self._merge(self._map(lambda n, s: s.search_vectors(q_emb, top_k)), top_k, largest=False)
+
+    def lexical_search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        if not self.shards:
+            return []
+        # BM25 statistics are per shard, so scores are only approximately comparable across shards
+        return self._merge(self._map(lambda n, s: [s.lexical_search(query, top_k)]), top_k, largest=True)[0]
+
+    def has_identifier(self, cid: int, term: str) -> bool:
+        return self.shards[cid >> SHARD_SHIFT].has_identifier(cid & ((1 << SHARD_SHIFT) - 1), term)
+
+    def fetch(self, hits: List[Tuple[int, float]]) -> List[Dict]:
+        return self.fetch_many([hits])[0]
+
+    def fetch_many(self, hit_lists: List[List[Tuple[int, float]]]) -> List[List[Dict]]:
+        mask = (1 << SHARD_SHIFT) - 1
+        wanted: List[List[Tuple[int, int, float]]] = [[] for _ in self.shards]
+        for q, hits in enumerate(hit_lists):
+            for cid, score in hits:
+                wanted[cid >> SHARD_SHIFT].append((q, cid, score))
+        # one single-hit list per row keeps the answers aligned with the requests; shards still read each chunk once
+        fetched = self._map(lambda n, s: s.fetch_many([[(cid & mask, score)] for _, cid, score in wanted[n]]))
+        rows = {}
+        for reqs, got in zip(wanted, fetched):
+            for (q, cid, _), row in zip(reqs, got):
+                if row:
+                    rows[(q, cid)] = row[0]
+        return [[rows[(q, cid)] for cid, _ in hits if (q, cid) in rows] for q, hits in enumerate(hit_lists)]
+
+    def search(self, query: str, top_k: int = 5) -> List[Dict]:
+        return self.fetch(self.vector_search(query, top_k))
+
+    def search_many(self, queries: List[str], top_k: int = 5) -> List[List[Dict]]:
+        return self.fetch_many(self.vector_search_many(queries, top_k))
+
+    def acquire(self):
+        # shard handles are registry handles too; keep them alive while this handle is in use
+        with _LOCK:
+            super().acquire()
+            for s in self.shards:
+                s.acquire()
+
+    def release(self):
+        with _LOCK:
+            shards = list(self.shards)
+        for s in shards:
+            s.release()
+        super().release()
+
+    def _free(self):
+        # the shards themselves stay registered (a reload reuses the unchanged ones)
+        self.shards = []
 
-    texts = []
-    new_metas = []
+    def close(self):
+        with _LOCK:
+            key = os.path.abspath(self.index_path)
+            if _HANDLES.get(key) is self:
+                del _HANDLES[key]
+        for s in self.shards:
+            s.close()
+        self.shards = []
+
+
+def _load_handle(index_path: str, model_name: str) -> _Resident:
+    if os.path.exists(_shard_manifest_path(index_path)):
+        return ShardedIndexHandle(index_path, model_name=model_name)
+    return IndexHandle(index_path, model_name=model_name)
+
+
+def _install(key: str, handle: _Resident):
+    with _LOCK:
+        old = _HANDLES.get(key)
+        _HANDLES[key] = handle
+        if old is not None:
+            _retire_replaced(old, handle)
+
+
+def open_index(index_path: str, model_name: str = DEFAULT_MODEL) -> IndexHandle:
+    """Return the resident handle for `index_path`, loading it on first use or when the files changed on disk.
+
+    Paths watched by an `IndexWatcher` are not reloaded here: the resident handle is served until the
+    watcher has loaded the new version in the background.
+    """
+    key = os.path.abspath(index_path)
+    with _LOCK:
+        handle = _HANDLES.get(key)
+        if handle is not None and handle.model_name == model_name and (key in _WATCHED or not handle.is_stale()):
+            return handle
+        handle = _load_handle(index_path, model_name)
+        _install(key, handle)
+        return handle
+
+
+def _current_handle(index_path: str, model_name: str) -> Tuple[_Resident, bool]:
+    """(resident handle, whether it was just loaded); a missing or stale handle is replaced by one loaded
+    without holding the registry lock, so other threads keep using the old one in the meantime."""
+    key = os.path.abspath(index_path)
+    with _LOCK:
+        handle = _HANDLES.get(key)
+    if handle is not None and handle.model_name == model_name and not handle.is_stale():
+        return handle, False
+    handle = _load_handle(index_path, model_name)
+    _install(key, handle)
+    return handle, True
+
+
+def reload_index(index_path: str, model_name: Optional[str] = None) -> bool:
+    """Load the current on-disk version of `index_path` in this thread and swap it in for the resident handle.
+
+    Requests keep being served by the old handle while the new one loads, and those already using it finish
+    on it; it is closed when the last of them is done. Returns False when the resident handle is current.
+    """
+    with _RELOAD_LOCK:
+        if model_name is None:
+            with _LOCK:
+                resident = _HANDLES.get(os.path.abspath(index_path))
+            model_name = resident.model_name if resident is not None else DEFAULT_MODEL
+        return _current_handle(index_path, model_name)[1]
+
+
+class IndexWatcher:
+    """Background thread that reloads an index (`reload_index`) after it is rebuilt on disk.
+
+    The files are polled every `interval` seconds. A new version is loaded once it has been unchanged for
+    one whole poll, so a build still writing its files is not picked up half-way. A failed load keeps the
+    old handle in service and is retried on the next poll.
+    """
+
+    def __init__(self, index_path: str, interval: float = 5.0, model_name: Optional[str] = None):
+        self.index_path = index_path
+        self.interval = interval
+        self.model_name = model_name
+        self.version = index_version(index_path)
+        self.reloads = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "IndexWatcher":
+        with _LOCK:
+            _WATCHED[os.path.abspath(self.index_path)] = self
+        self._thread = threading.Thread(target=self._run, name="index-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with _LOCK:
+            key = os.path.abspath(self.index_path)
+            if _WATCHED.get(key) is self:
+                del _WATCHED[key]
+
+    def _run(self):
+        pending = None
+        while not self._stop.wait(self.interval):
+            version = index_version(self.index_path)
+            if version == self.version or version != pending:
+                pending = None if version == self.version else version
+                continue
+            try:
+                if reload_index(self.index_path, self.model_name):
+                    self.reloads += 1
+            except Exception as e:
+                self.errors += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                continue
+            self.version = version
+            pending = None
+
+    def stats(self) -> Dict:
+        return {"version": self.version, "reloads": self.reloads, "errors": self.errors, "last_error": self.last_error, "interval": self.interval}
+
+
+def _retire_replaced(old: _Resident, new: _Resident):
+    """Release a handle the registry no longer serves (after `new` took its place)."""
+    if isinstance(old, ShardedIndexHandle):
+        kept = {id(s) for s in getattr(new, "shards", [])}
+        for s in old.shards:
+            # shards that left the manifest are not reachable through the registry any more
+            shard_key = os.path.abspath(s.index_path)
+            if id(s) not in kept and _HANDLES.get(shard_key) is s:
+                del _HANDLES[shard_key]
+                s.retire()
+    old.retire()
+
+
+@contextmanager
+def index_handle(index_path: str, model_name: str = DEFAULT_MODEL) -> Iterator[IndexHandle]:
+    """`open_index` for one unit of work: if a reload replaces the handle meanwhile, it stays open until the block exits."""
+    with _LOCK:
+        handle = open_index(index_path, model_name=model_name)
+        handle.acquire()
+    try:
+        yield handle
+    finally:
+        handle.release()
+
+
+def close_index(index_path: Optional[str] = None):
+    """Close the handle for `index_path`, or every open handle when no path is given."""
+    with _LOCK:
+        if index_path is None:
+            handles = list(_HANDLES.values())
+        else:
+            handles = [h for h in [_HANDLES.get(os.path.abspath(index_path))] if h is not None]
+    for h in handles:
+        h.close()
+
+
+def open_meta(index_path: str, readonly: bool = False) -> Optional[MetaStore]:
+    """Open the metadata store of an index, migrating a legacy `.meta` JSON list (and manifest) on first use."""
+    db = _metadb_path(index_path)
+    if not os.path.exists(db):
+        if not os.path.exists(_meta_path(index_path)):
+            return None if readonly else MetaStore(db)
+        tmp = db + ".migrating"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        store = MetaStore(tmp)
+        store.import_json(_meta_path(index_path), _manifest_path(index_path), default_chunk_size=DEFAULT_CHUNK)
+        store.close()
+        os.replace(tmp, db)
+    return MetaStore(db, readonly=readonly)
+
+
+def _gather_vectors(index_path: str, index: Optional[faiss.Index], ids: np.ndarray, dim: int, fresh_start: int, fresh: Optional[np.ndarray]) -> np.ndarray:
+    """Full-precision vectors for `ids`.
+
+    Ids from `fresh_start` on were embedded in this run and come from `fresh`. Older ids come from the raw
+    side file, or are decoded from `index` when it was not kept (approximate for quantized/PCA storage).
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    out = np.empty((len(ids), dim), dtype=np.float32)
+    new = ids >= fresh_start
+    if new.any():
+        out[new] = fresh[ids[new] - fresh_start]
+    old = ~new
+    if old.any():
+        raw = _load_vectors(index_path, dim)
+        if len(raw) >= fresh_start:
+            out[old] = raw[ids[old]]
+        else:
+            out[old] = ann.reconstruct(index, ids[old])
+    return out
+
+
+def _load_vectors(index_path: str, dim: int) -> np.ndarray:
+    """Memory-map the raw vector side file as an (n, dim) array indexed by vector id."""
+    if not os.path.exists(_emb_path(index_path)) or os.path.getsize(_emb_path(index_path)) == 0:
+        return np.zeros((0, dim), dtype=np.float32)
+    return np.memmap(_emb_path(index_path), dtype=np.float32, mode="r").reshape(-1, dim)
+
+
+def _shard_manifest_path(index_path: str) -> str:
+    return index_path + ".shards.json"
+
+
+def _shard_path(index_path: str, name: str) -> str:
+    return os.path.join(index_path + ".shards", name + ".faiss")
+
+
+def _load_shard_manifest(index_path: str) -> Optional[Dict]:
+    try:
+        with open(_shard_manifest_path(index_path), "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except Exception:
+        return None
+
+
+def shard_paths(index_path: str) -> List[str]:
+    """Index files of the shards of `index_path`; empty for an unsharded index."""
+    manifest = _load_shard_manifest(index_path)
+    return [_shard_path(index_path, name) for name in (manifest or {}).get("shards", [])]
+
+
+def index_version(index_path: str) -> str:
+    """Short digest of the on-disk files backing `index_path` (every shard, if sharded); changes on rebuild.
+
+    Costs a few stat calls, so it is cheap enough to check per request.
+    """
+    sig = [_index_signature(_shard_manifest_path(index_path))] + [_index_signature(p) for p in shard_paths(index_path)]
+    if len(sig) == 1:
+        sig.append(_index_signature(index_path))
+    return hashlib.sha1(repr(sig).encode("utf-8")).hexdigest()[:12]
+
+
+def shard_of(repo_path: str, path: str, shard_by: str) -> str:
+    """Shard name for a file: its top-level directory ("dir"), or one of N stable hash buckets ("hash:N")."""
+    rel = os.path.relpath(path, repo_path)
+    if shard_by == "dir":
+        parts = rel.split(os.sep)
+        name = parts[0] if len(parts) > 1 else "_root"
+        return "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+    if shard_by.startswith("hash:"):
+        n = int(shard_by.split(":", 1)[1])
+        bucket = int(hashlib.sha1(rel.replace(os.sep, "/").encode()).hexdigest(), 16) % n
+        return f"part{bucket:03d}"
+    raise ValueError(f"unknown shard_by {shard_by!r}; expected 'dir' or 'hash:N'")
+
+
+def _reset_index_files(index_path: str):
+    for p in (index_path, _meta_path(index_path), _metadb_path(index_path), _lex_path(index_path), _chunks_path(index_path), _offsets_path(index_path), _emb_path(index_path), _manifest_path(index_path), ann.params_path(index_path), index_path + ".npy"):
+        if os.path.exists(p):
+            os.remove(p)
+
+
+def build_index(
+    repo_path: str,
+    index_path: str,
+    chunk_size: int = DEFAULT_CHUNK,
+    model_name: str = DEFAULT_MODEL,
+    use_openai: bool = False,
+    jobs: int = 1,
+    index_type: Optional[str] = None,
+    nlist: Optional[int] = None,
+    embed_cache: bool = True,
+    storage: Optional[str] = None,
+    pca_dim: Optional[int] = None,
+    keep_vectors: Optional[bool] = None,
+    shard_by: Optional[str] = None,
+    shards: Optional[List[str]] = None,
+    rebuild: bool = False,
+):
+    """Index the repo into a FAISS index at `index_path`.
+
+    Runs are incremental: the file manifest in the metadata store (size, mtime, content hash) lets unchanged
+    files be skipped without reading them. Changed files have their stale vectors removed by id and only new
+    chunks embedded; deleted files are dropped. Chunk texts and raw vectors are append-only and only the
+    metadata rows of changed files are written.
+    `jobs` > 1 reads and chunks changed files in that many worker processes while earlier batches are embedded.
+    `index_type` (see `ann.INDEX_TYPES`) defaults to the existing index's type, or flat for a new index;
+    changing it rebuilds the FAISS index from the stored vectors without re-embedding. `storage` (see
+    `ann.STORAGE_TYPES`, with `pca_dim` for "pca") works the same way.
+    `keep_vectors` controls the full-precision `.vecs` side file (default: keep the index's current choice,
+    on for new indexes). Without it, rebuilds decode vectors from the index, which is lossy for compressed storage.
+    With `embed_cache` new chunks are looked up in the shared embedding cache (see `get_embedding_cache`)
+    before the model is called, so identical chunks across branches and forks are embedded once.
+    `shard_by` ("dir" or "hash:N", see `shard_of`) splits the index into independently built shards listed in
+    `<index>.shards.json`; later runs keep the existing sharding. `shards` restricts a run to the named shards,
+    and `rebuild` discards the selected index (or shards) first instead of updating incrementally.
+    """
+    files = _walk_files(repo_path)
+    opts = dict(
+        chunk_size=chunk_size, model_name=model_name, use_openai=use_openai, jobs=jobs, index_type=index_type, nlist=nlist,
+        embed_cache=embed_cache, storage=storage, pca_dim=pca_dim, keep_vectors=keep_vectors,
+    )
+    manifest = _load_shard_manifest(index_path) or {}
+    shard_by = shard_by or manifest.get("shard_by")
+    if not shard_by:
+        if rebuild:
+            _reset_index_files(index_path)
+        _build_files(files, repo_path, index_path, **opts)
+        return
+
+    groups: Dict[str, List[str]] = {}
     for p in files:
-        code = _read_file(p)
-        if not code:
+        groups.setdefault(shard_of(repo_path, p, shard_by), []).append(p)
+    # shards of the previous layout that no longer have files are deleted below
+    names = set(groups) | set(manifest.get("shards", []) if manifest.get("shard_by") == shard_by else [])
+    os.makedirs(index_path + ".shards", exist_ok=True)
+    for name in sorted(names):
+        if shards and name not in shards:
             continue
-        chunks = _chunk_code(code, chunk_size)
-        for i, chunk in enumerate(chunks):
-            h = hashlib.sha1(chunk.encode()).hexdigest()
-            if h in existing_hashes:
-                continue
-            texts.append(chunk)
-            new_metas.append({"path": p, "chunk_index": i, "hash": h})
+        shard_path = _shard_path(index_path, name)
+        if rebuild or name not in groups:
+            _reset_index_files(shard_path)
+        if name in groups:
+            print(f"[shard {name}]")
+            _build_files(groups[name], repo_path, shard_path, **opts)
+    live = sorted(n for n in names if os.path.exists(_shard_path(index_path, n)))
+    tmp = _shard_manifest_path(index_path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump({"version": 1, "shard_by": shard_by, "shards": live}, fh)
+    os.replace(tmp, _shard_manifest_path(index_path))
+
+
+def _build_files(
+    files: List[str],
+    repo_path: str,
+    index_path: str,
+    chunk_size: int = DEFAULT_CHUNK,
+    model_name: str = DEFAULT_MODEL,
+    use_openai: bool = False,
+    jobs: int = 1,
+    index_type: Optional[str] = None,
+    nlist: Optional[int] = None,
+    embed_cache: bool = True,
+    storage: Optional[str] = None,
+    pca_dim: Optional[int] = None,
+    keep_vectors: Optional[bool] = None,
+):
+    """Incrementally index `files` (all under `repo_path`) into the single index at `index_path`."""
+    import faiss
+
+    current = ann.load_params(index_path)
+    current_type = current.get("requested_type", "flat")
+    index_type = index_type or current_type
+    current_storage = (current.get("requested_storage", "float32"), current.get("pca_dim"))
+    storage = storage or current_storage[0]
+    if storage != "pca":
+        pca_dim = None
+    elif pca_dim is None:
+        pca_dim = current_storage[1]
+    layout_changed = index_type != current_type or (storage, pca_dim) != current_storage
+
+    store = open_meta(index_path)
+    if store.get_setting("chunk_size") != str(chunk_size):
+        # new index, an index from before the manifest existed, or a different chunking: start over
+        store.close()
+        _reset_index_files(index_path)
+        store = open_meta(index_path)
+        store.set_setting("chunk_size", chunk_size)
+    if keep_vectors is None:
+        keep_vectors = store.get_setting("keep_vectors") != "0"
+    keep_changed = str(int(keep_vectors)) != (store.get_setting("keep_vectors") or "1")
+    store.set_setting("keep_vectors", int(keep_vectors))
+    known = store.files()
+
+    stats = {}
+    changed = []
+    for p in files:
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        stats[p] = (st.st_size, st.st_mtime_ns)
+        old = known.get(p)
+        if old is None or (old[0], old[1]) != stats[p]:
+            changed.append(p)
+    deleted = [p for p in known if p not in stats]
 
-    if not texts and metas:
+    if not changed and not deleted and os.path.exists(index_path) and not layout_changed and not keep_changed:
+        store.close()
         print("No new chunks to index; existing index retained.")
         return
 
-    # compute embeddings for new texts
-    embeddings = provider.embed(texts)
+    index = faiss.read_index(index_path) if os.path.exists(index_path) else None
+    next_id = max(len(store), ChunkStore.count(_offsets_path(index_path)))
+    first_new_id = next_id
 
-    # load or create faiss index
-    dim = embeddings.shape[1]
-    if os.path.exists(index_path):
-        index = faiss.read_index(index_path)
-    else:
-        index = faiss.IndexFlatL2(dim)
+    if index is not None and keep_changed:
+        if keep_vectors:
+            # turning the side file back on: decode what the index holds, zeros for removed ids
+            rows = np.zeros((first_new_id, index.d), dtype=np.float32)
+            live_old = store.live_ids()
+            rows[live_old] = ann.reconstruct(index, live_old)
+            with open(_emb_path(index_path), "wb") as fh:
+                fh.write(rows.tobytes())
+        elif os.path.exists(_emb_path(index_path)):
+            os.remove(_emb_path(index_path))
 
-    index.add(embeddings)
-    faiss.write_index(index, index_path)
+    def old_vector(cid: int) -> np.ndarray:
+        return _gather_vectors(index_path, index, np.array([cid]), index.d, first_new_id, None)
 
-    # append metas and save
-    metas.extend(new_metas)
-    with open(_meta_path(index_path), "w", encoding="utf-8") as fh:
-        json.dump(metas, fh)
+    stale_ids: List[int] = []
+    for p in deleted:
+        stale_ids.extend(cid for cid, _ in store.by_path(p))
+        store.delete_file(p)
 
-    # optionally save raw embeddings (for debugging)
-    try:
-        if os.path.exists(_emb_path(index_path)):
-            old = np.load(_emb_path(index_path))
-            combined = np.vstack([old, embeddings])
+    # live (id, hash) pairs of each changed file before this run, in chunk order
+    old_entries: Dict[str, List[Tuple[int, str]]] = {}
+
+    provider = None
+    cache = get_embedding_cache() if embed_cache else None
+    namespace = EmbeddingProvider.cache_namespace(model_name, use_openai)
+    cache_hits = 0
+    new_ids: List[int] = []
+    new_texts: List[str] = []
+    new_metas: List[Dict] = []
+    new_vecs: List[np.ndarray] = []
+    new_entries: Dict[str, List[Tuple[int, str]]] = {p: [] for p in changed}
+    for batch in _iter_chunk_batches(changed, chunk_size, jobs=jobs):
+        to_embed = []
+        to_embed_hashes = []
+        to_embed_pos = []
+        batch_vecs: List[Optional[np.ndarray]] = []
+        for p, i, chunk, h in batch:
+            if p not in old_entries:
+                old_entries[p] = [(cid, m["hash"]) for cid, m in store.by_path(p)]
+            old_chunks = old_entries[p]
+            if i < len(old_chunks) and old_chunks[i][1] == h:
+                # same chunk at the same position: keep its vector id untouched
+                new_entries[p].append(old_chunks[i])
+                continue
+            reuse = next((cid for cid, oh in old_chunks if oh == h), None)
+            cid = next_id
+            next_id += 1
+            new_entries[p].append((cid, h))
+            new_ids.append(cid)
+            new_texts.append(chunk)
+            new_metas.append({"path": p, "chunk_index": i, "chunk_size": chunk_size, "hash": h})
+            if reuse is not None and index is not None:
+                batch_vecs.append(old_vector(reuse))
+            else:
+                to_embed_pos.append(len(batch_vecs))
+                batch_vecs.append(None)
+                to_embed.append(chunk)
+                to_embed_hashes.append(h)
+        if to_embed and cache is not None:
+            cached = cache.get_many(f"{namespace}:{h}" for h in to_embed_hashes)
+            misses = []
+            for pos, chunk, h in zip(to_embed_pos, to_embed, to_embed_hashes):
+                blob = cached.get(f"{namespace}:{h}")
+                if blob is None:
+                    misses.append((pos, chunk, h))
+                else:
+                    batch_vecs[pos] = np.frombuffer(blob, dtype=np.float32).reshape(1, -1)
+            cache_hits += len(to_embed) - len(misses)
+            BUILD_CHUNKS.inc("cache", amount=len(to_embed) - len(misses))
+            to_embed_pos = [m[0] for m in misses]
+            to_embed = [m[1] for m in misses]
+            to_embed_hashes = [m[2] for m in misses]
+        if to_embed:
+            if provider is None:
+                provider = get_provider(model_name=model_name, use_openai=use_openai)
+            with BUILD_STAGE_SECONDS.time("embed"):
+                embs = np.asarray(provider.embed(to_embed, checkpoint_dir=_checkpoint_dir(index_path) if use_openai else None), dtype=np.float32)
+            BUILD_CHUNKS.inc("embedded", amount=len(to_embed))
+            for pos, row in zip(to_embed_pos, embs):
+                batch_vecs[pos] = row.reshape(1, -1)
+            if cache is not None:
+                cache.put_many({f"{namespace}:{h}": row.tobytes() for h, row in zip(to_embed_hashes, embs)})
+        new_vecs.extend(batch_vecs)
+
+    for p in changed:
+        kept = {cid for cid, _ in new_entries[p]}
+        if p not in old_entries:
+            # file produced no chunks (emptied or unreadable)
+            old_entries[p] = [(cid, m["hash"]) for cid, m in store.by_path(p)]
+        stale_ids.extend(cid for cid, _ in old_entries[p] if cid not in kept)
+        h = hashlib.sha1("".join(ch for _, ch in new_entries[p]).encode()).hexdigest()
+        store.set_file(p, stats[p][0], stats[p][1], h)
+
+    if index is None and not new_vecs:
+        store.close()
+        print(f"No chunks to index in {repo_path}")
+        return
+
+    embeddings = np.vstack(new_vecs).astype(np.float32) if new_vecs else None
+    if embeddings is not None:
+        # chunk texts, metadata and raw vectors are append-only and stay aligned with vector ids
+        ChunkStore.append(_chunks_path(index_path), _offsets_path(index_path), new_texts)
+        store.add_chunks(new_ids, new_metas)
+        if keep_vectors:
+            with open(_emb_path(index_path), "ab") as fh:
+                fh.write(embeddings.tobytes())
+
+    store.mark_dead(stale_ids)
+    store.commit()
+
+    # identifier index for hybrid retrieval; filled from the chunk store for indexes that predate it
+    with BUILD_STAGE_SECONDS.time("lexical"):
+        backfill = not os.path.exists(_lex_path(index_path))
+        lex = LexicalIndex(_lex_path(index_path))
+        if backfill:
+            fresh = set(new_ids)
+            old_live = [int(i) for i in store.live_ids() if i not in fresh]
+            if old_live:
+                chunks = ChunkStore(_chunks_path(index_path), _offsets_path(index_path)).open()
+                lex.add(old_live, (chunks.get(i) for i in old_live))
+                chunks.close()
+        lex.remove(stale_ids)
+        lex.add(new_ids, new_texts)
+        lex.commit()
+        lex.close()
+
+    params = ann.load_params(index_path)
+    live = store.live_ids()
+    store.close()
+    rebuild = (
+        index is None
+        or layout_changed
+        or (stale_ids and not ann.supports_remove(params.get("index_type", "flat")))
+        # trained indexes are retrained once the corpus has grown well past the training set
+        or (params.get("trained_on") and len(live) > 4 * params["trained_on"])
+    )
+    with BUILD_STAGE_SECONDS.time("ann"):
+        if rebuild:
+            dim = embeddings.shape[1] if embeddings is not None else index.d
+            vectors = _gather_vectors(index_path, index, live, dim, first_new_id, embeddings)
+            index, params = ann.make_index(index_type, vectors, live, nlist=nlist, storage=storage, pca_dim=pca_dim)
+            params["requested_storage"] = storage
         else:
-            combined = embeddings
-        np.save(_emb_path(index_path), combined)
-    except Exception:
-        pass
+            if stale_ids:
+                index.remove_ids(np.array(stale_ids, dtype=np.int64))
+            if embeddings is not None:
+                index.add_with_ids(embeddings, np.array(new_ids, dtype=np.int64))
+        faiss.write_index(index, index_path)
+    params["embedding"] = {"model": model_name, "use_openai": use_openai}
+    ann.save_params(index_path, params)
 
-    print(f"Indexed {len(new_metas)} new chunks from {len(files)} files to {index_path}")
+    # every batch made it into the index, so the resume checkpoints are no longer needed
+    shutil.rmtree(_checkpoint_dir(index_path), ignore_errors=True)
 
+    if cache_hits:
+        print(f"{cache_hits} of {len(new_metas)} new chunks came from the embedding cache")
+    print(f"Indexed {len(new_metas)} new chunks, removed {len(stale_ids)} stale chunks ({len(changed)} changed, {len(deleted)} deleted of {len(files)} files) to {index_path}")
+
+
+def benchmark_index(index_path: str, n_queries: int = 200, top_k: int = 10, compare_storage: bool = False) -> List[Dict]:
+    """Recall-vs-latency report for the index at `index_path` (see `ann.benchmark`).
+
+    With `compare_storage`, instead report recall loss and bytes per vector of every storage option for the
+    index's type, built in memory over the same vectors and queries (see `ann.compare_storage`).
+    Ground truth is exact float32 search over the `.vecs` side file; without it the vectors are decoded
+    from the index, so the baseline itself is approximate.
+    """
+    import faiss
 
-def search_index(index_path: str, query: str, top_k: int = 5, model_name: str = DEFAULT_MODEL) -> List[Dict]:
-    provider = EmbeddingProvider(model_name=model_name, use_openai=False)
-    q_emb = provider.embed([query])
     index = faiss.read_index(index_path)
-    D, I = index.search(q_emb, top_k)
-    metas = json.load(open(_meta_path(index_path), "r", encoding="utf-8"))
-    results = []
-    for idx in I[0]:
-        if idx < 0 or idx >= len(metas):
-            continue
-        m = metas[idx]
-        try:
-            code = _read_file(m["path"])
-            chunks = _chunk_code(code, chunk_size=int(m.get("chunk_size", DEFAULT_CHUNK)))
-            snippet = chunks[m["chunk_index"]] if m["chunk_index"] < len(chunks) else ""
-        except Exception:
-            snippet = ""
-        results.append({**m, "snippet": snippet})
-    return results
+    params = ann.load_params(index_path)
+    store = open_meta(index_path, readonly=True)
+    live = store.live_ids() if store is not None else np.zeros(0, dtype=np.int64)
+    next_id = len(store) if store is not None else 0
+    if store is not None:
+        store.close()
+    vectors = _gather_vectors(index_path, index, live, index.d, next_id, None)
+    if compare_storage:
+        return ann.compare_storage(vectors, live, params.get("index_type", "flat"), n_queries=n_queries, top_k=top_k, pca_dim=params.get("pca_dim"))
+    return ann.benchmark(index, vectors, live, params, n_queries=n_queries, top_k=top_k)
+
+
+def set_search_params(index_path: str, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Persist query-time parameters (on every shard of a sharded index); open handles pick them up on their next staleness check."""
+    shards = shard_paths(index_path)
+    if shards:
+        for shard in shards:
+            set_search_params(shard, nprobe=nprobe, ef_search=ef_search)
+        return
+    params = ann.load_params(index_path)
+    if nprobe is not None:
+        params["nprobe"] = nprobe
+    if ef_search is not None:
+        params["efSearch"] = ef_search
+    ann.save_params(index_path, params)
+
+
+def search_index(index_path: str, query: str, top_k: int = 5, model_name: str = DEFAULT_MODEL) -> List[Dict]:
+    with index_handle(index_path, model_name=model_name) as handle:
+        return handle.search(query, top_k=top_k)
+
+
+def search_many(index_path: str, queries: List[str], top_k: int = 5, model_name: str = DEFAULT_MODEL) -> List[List[Dict]]:
+    """Search several queries at once: one embedding batch, one `index.search`, one snippet read per distinct chunk.
+
+    Returns one result list per query, in query order.
+    """
+    with index_handle(index_path, model_name=model_name) as handle:
+        return handle.search_many(queries, top_k=top_k)
@@ -0,0 +1,235 @@
+"""Persistent background jobs for analyses too slow for one HTTP request (POST /jobs, GET /jobs/{id}).
+
+Jobs are rows in a SQLite database (`<cache dir>/jobs.sqlite`, or PR_ANALYZER_JOBS_DB), so queued and
+finished jobs survive a restart; jobs that were running when the server stopped are queued again on start.
+A fixed set of worker threads runs them in submission order.
+
+Environment variables (constructor arguments take precedence):
+- PR_ANALYZER_JOB_WORKERS: jobs run at once (default 2)
+- PR_ANALYZER_JOB_QUEUE: queued jobs before new ones are rejected (`QueueFull`, HTTP 429; default 100)
+- PR_ANALYZER_JOB_TTL: seconds finished jobs are kept (default 7 days)
+"""
+import json
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from .cache import cache_dir
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created);
+"""
+
+STATUSES = ("queued", "running", "done", "failed")
+
+
+class QueueFull(Exception):
+    """The job queue already holds its maximum number of queued jobs."""
+
+
+class QueueClosed(Exception):
+    """The job queue is not running (not started yet, or shutting down)."""
+
+
+class JobStore:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("PR_ANALYZER_JOBS_DB") or os.path.join(cache_dir(), "jobs.sqlite")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # one connection shared by the worker threads and the request handlers
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    def add(self, kind: str, params: Dict[str, Any], max_queued: Optional[int] = None) -> str:
+        """Insert a queued job and return its id; raises QueueFull when `max_queued` jobs are already waiting."""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            if max_queued is not None:
+                queued = self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                if queued >= max_queued:
+                    raise QueueFull(f"{queued} jobs already queued")
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, params, status, created) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, kind, json.dumps(params), time.time()),
+            )
+            self._db.commit()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, kind, status, result, error, created, started, finished FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("id", "kind", "status", "result", "error", "created", "started", "finished")
+        job = dict(zip(keys, row))
+        job["result"] = None if job["result"] is None else json.loads(job["result"])
+        return job
+
+    def params(self, job_id: str) -> Dict[str, Any]:
+        with self._lock:
+            row = self._db.execute("SELECT params FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def start(self, job_id: str) -> bool:
+        """Mark a queued job running; False if it is not queued (e.g. picked up already)."""
+        with self._lock:
+            cur = self._db.execute("UPDATE jobs SET status = 'running', started = ? WHERE id = ? AND status = 'queued'", (time.time(), job_id))
+            self._db.commit()
+        return cur.rowcount == 1
+
+    def finish(self, job_id: str, result: Any = None, error: Optional[str] = None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ? WHERE id = ?",
+                ("failed" if error is not None else "done", None if error is not None else json.dumps(result, default=str), error, time.time(), job_id),
+            )
+            self._db.commit()
+
+    def requeue_running(self) -> int:
+        """Queue again the jobs a previous process left running (it stopped before they finished)."""
+        with self._lock:
+            cur = self._db.execute("UPDATE jobs SET status = 'queued', started = NULL WHERE status = 'running'")
+            self._db.commit()
+        return cur.rowcount
+
+    def queued(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._db.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created").fetchall()]
+
+    def prune(self, older_than: float):
+        """Delete finished jobs that finished more than `older_than` seconds ago."""
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished < ?", (time.time() - older_than,))
+            self._db.commit()
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {**{s: 0 for s in STATUSES}, **dict(rows)}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def run_analyze(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Job kind "analyze": `analyze_stack_trace` on the server's index."""
+    from .analyzer import analyze_stack_trace
+
+    return analyze_stack_trace(params["stack_trace"], params["index_path"], top_k=params.get("top_k", 3), max_frames=params.get("max_frames", 1))
+
+
+def run_diagnose(params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Job kind "diagnose": the full `diagnose_trace.diagnose` pipeline (snippets, git history scan, fix suggestions).
+
+    `diagnose_trace` is a script at the top of the source checkout, so it is only importable when the
+    server runs from there.
+    """
+    from pathlib import Path
+
+    try:
+        from diagnose_trace import diagnose
+    except ImportError as e:
+        raise RuntimeError("diagnose jobs need diagnose_trace.py on the path (run the server from the source checkout)") from e
+    with tempfile.TemporaryDirectory(prefix="pr-analyzer-job-") as tmp:
+        trace = Path(tmp) / "trace.txt"
+        trace.write_text(params["stack_trace"], encoding="utf-8")
+        return diagnose(trace, Path(params["repo"]), since_days=params.get("since_days", 30), use_llm=params.get("use_llm", False))
+
+
+RUNNERS: Dict[str, Callable[[Dict[str, Any]], Any]] = {"analyze": run_analyze, "diagnose": run_diagnose}
+
+
+class JobQueue:
+    """Worker threads running the jobs of a `JobStore`, bounded by `max_queued` waiting jobs."""
+
+    def __init__(
+        self,
+        store: JobStore,
+        workers: Optional[int] = None,
+        max_queued: Optional[int] = None,
+        runners: Optional[Dict[str, Callable[[Dict[str, Any]], Any]]] = None,
+        ttl: Optional[float] = None,
+    ):
+        self.store = store
+        self.workers = max(1, workers or int(os.getenv("PR_ANALYZER_JOB_WORKERS", "2")))
+        self.max_queued = int(os.getenv("PR_ANALYZER_JOB_QUEUE", "100")) if max_queued is None else max_queued
+        self.runners = RUNNERS if runners is None else runners
+        self.ttl = float(os.getenv("PR_ANALYZER_JOB_TTL", str(7 * 24 * 3600))) if ttl is None else ttl
+        self._pending: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._closed = True
+
+    def start(self):
+        self.store.prune(self.ttl)
+        self.store.requeue_running()
+        for job_id in self.store.queued():
+            self._pending.put(job_id)
+        self._closed = False
+        for n in range(self.workers):
+            t = threading.Thread(target=self._work, name=f"job-worker-{n}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def close(self, timeout: float = 10.0):
+        """Stop taking jobs; waits up to `timeout` seconds for running ones. Jobs still running then are
+        queued again by the next `start`."""
+        self._closed = True
+        for _ in self._threads:
+            self._pending.put(None)
+        deadline = time.monotonic() + timeout
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        if not any(t.is_alive() for t in self._threads):
+            self.store.close()
+        self._threads = []
+
+    def submit(self, kind: str, params: Dict[str, Any]) -> str:
+        if self._closed:
+            raise QueueClosed("job queue is not running")
+        if kind not in self.runners:
+            raise ValueError(f"unknown job kind {kind!r}; expected one of {sorted(self.runners)}")
+        job_id = self.store.add(kind, params, max_queued=self.max_queued)
+        self._pending.put(job_id)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def _work(self):
+        while True:
+            job_id = self._pending.get()
+            if job_id is None or self._closed:
+                return
+            if not self.store.start(job_id):
+                continue
+            job = self.store.get(job_id)
+            try:
+                result = self.runners[job["kind"]](self.store.params(job_id))
+            except Exception as e:
+                self.store.finish(job_id, error=f"{type(e).__name__}: {e}")
+            else:
+                self.store.finish(job_id, result=result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "max_queued": self.max_queued, **self.store.counts()}
@@ -0,0 +1,81 @@
+"""Incremental parsing of a JSON object that arrives in pieces (a streamed LLM reply).
+
+`JSONObjectStream.feed` returns each top-level field as soon as its value is complete. For the analysis
+reply, "classification" and "confidence" are known while "explanation" and "suggested_fix" are still
+being generated. Text before the opening brace (a ```json fence, a sentence) is skipped.
+"""
+import json
+from typing import Any, Dict, Optional
+
+
+class JSONObjectStream:
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+        self._buf = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key: Optional[str] = None
+        self._token_start = -1
+        self._value_start = -1
+
+    def feed(self, text: str) -> Dict[str, Any]:
+        """Add the next piece of the reply; returns the fields completed by it, in order."""
+        self._buf += text
+        completed: Dict[str, Any] = {}
+        buf = self._buf
+        i = self._pos
+        while i < len(buf) and not self.done:
+            c = buf[i]
+            if self._depth == 0:
+                # anything before the object's opening brace is not part of it
+                if c == "{":
+                    self._depth = 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._value_start < 0:
+                        # end of a key at the top level
+                        self._key = json.loads(buf[self._token_start : i + 1])
+            elif c == '"':
+                self._in_string = True
+                if self._depth == 1 and self._value_start < 0:
+                    self._token_start = i
+            elif c in "{[":
+                self._depth += 1
+            elif c == ":" and self._depth == 1:
+                self._value_start = i + 1
+            elif (c == "," and self._depth == 1) or (c == "}" and self._depth == 1):
+                if self._key is not None and self._value_start >= 0:
+                    try:
+                        value = json.loads(buf[self._value_start : i])
+                    except ValueError:
+                        value = buf[self._value_start : i].strip()
+                    self.fields[self._key] = completed[self._key] = value
+                self._key, self._value_start = None, -1
+                if c == "}":
+                    self._depth = 0
+                    self.done = True
+            elif c in "}]":
+                self._depth -= 1
+            i += 1
+        self._pos = i
+        return completed
+
+
+def parse_reply(raw: str) -> Any:
+    """The JSON in an LLM reply: the whole reply when it is JSON, else the first object in it (e.g. inside
+    a ```json fence); {"raw_text": raw} when there is none."""
+    try:
+        return json.loads(raw)
+    except ValueError:
+        pass
+    stream = JSONObjectStream()
+    stream.feed(raw)
+    return stream.fields if stream.done and stream.fields else {"raw_text": raw}
@@ -0,0 +1,124 @@
+"""Inverted index over code identifiers with BM25 scoring (`<index>.lex.db`).
+
+Each chunk is indexed under its full identifiers (lower-cased, e.g.
+`executewithoutcome`) and their camelCase / snake_case parts (`execute`, `with`,
+`outcome`), so exact symbols from stack frames match directly while partial
+names still score.
+"""
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+IDENT_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+PART_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+K1 = 1.2
+B = 0.75
+# terms found in more than this share of chunks carry almost no signal and have the longest postings;
+# they are skipped once the index is large enough for document frequencies to mean something
+MAX_DF = 0.1
+MIN_DOCS_FOR_DF_CAP = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, id INTEGER NOT NULL, tf INTEGER NOT NULL, PRIMARY KEY (term, id)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_id ON postings(id);
+CREATE TABLE IF NOT EXISTS docs (id INTEGER PRIMARY KEY, len INTEGER NOT NULL);
+"""
+
+
+def identifiers(text: str) -> List[str]:
+    """Full identifiers in `text`, lower-cased."""
+    return [m.lower() for m in IDENT_RE.findall(text) if len(m) > 1]
+
+
+def tokenize(text: str) -> List[str]:
+    """Identifiers plus their sub-word parts, lower-cased."""
+    tokens = []
+    for ident in IDENT_RE.findall(text):
+        if len(ident) > 1:
+            tokens.append(ident.lower())
+        parts = [p.lower() for p in PART_RE.findall(ident) if len(p) > 1 and not p.isdigit()]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class LexicalIndex:
+    def __init__(self, path: str, readonly: bool = False):
+        self.path = path
+        self._lock = threading.Lock()
+        if readonly:
+            self._db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.executescript(SCHEMA)
+            self._db.commit()
+        self._stats = None
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def add(self, ids: Iterable[int], texts: Iterable[str]):
+        docs, postings = [], []
+        for cid, text in zip(ids, texts):
+            counts = Counter(tokenize(text))
+            docs.append((int(cid), sum(counts.values())))
+            postings.extend((t, int(cid), n) for t, n in counts.items())
+        self._db.executemany("INSERT OR REPLACE INTO docs (id, len) VALUES (?, ?)", docs)
+        self._db.executemany("INSERT OR REPLACE INTO postings (term, id, tf) VALUES (?, ?, ?)", postings)
+        self._stats = None
+
+    def remove(self, ids: Iterable[int]):
+        rows = [(int(i),) for i in ids]
+        self._db.executemany("DELETE FROM postings WHERE id = ?", rows)
+        self._db.executemany("DELETE FROM docs WHERE id = ?", rows)
+        self._stats = None
+
+    def commit(self):
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def _collection_stats(self) -> Tuple[int, float]:
+        if self._stats is None:
+            n, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(len), 0) FROM docs").fetchone()
+            self._stats = (n, (total / n) if n else 0.0)
+        return self._stats
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[int, float]]:
+        """BM25 over the query's tokens; returns (id, score) best first.
+
+        In large indexes, terms in more than MAX_DF of the chunks are ignored (only the rarest one is kept
+        when that leaves nothing).
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            n, avgdl = self._collection_stats()
+            if n == 0:
+                return []
+            if n >= MIN_DOCS_FOR_DF_CAP:
+                # document frequency straight from the primary key index, before reading any postings
+                df = {t: self._db.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (t,)).fetchone()[0] for t in terms}
+                kept = {t for t in terms if 0 < df[t] <= MAX_DF * n}
+                if not kept:
+                    present = [t for t in terms if df[t]]
+                    kept = {min(present, key=df.get)} if present else set()
+                terms = kept
+            scores: Dict[int, float] = {}
+            for term in terms:
+                rows = self._db.execute("SELECT p.id, p.tf, d.len FROM postings p JOIN docs d ON d.id = p.id WHERE p.term = ?", (term,)).fetchall()
+                if not rows:
+                    continue
+                idf = math.log(1.0 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+                for cid, tf, dl in rows:
+                    scores[cid] = scores.get(cid, 0.0) + idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * dl / avgdl))
+        return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+
+    def has_term(self, cid: int, term: str) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM postings WHERE term = ? AND id = ?", (term, int(cid))).fetchone() is not None
@@ -1,66 +1,451 @@
+import json
 import os
-from typing import Optional
+import threading
+import time
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple
 
-try:
-    # new-style client
-    from openai import OpenAI
-except Exception:
-    OpenAI = None
-import requests
+from .llm_cache import cache_key, cached_completion, get_llm_cache
+from .llm_transport import get_transport
+from .metrics import LLM_REQUESTS, LLM_TOKENS, STAGE_SECONDS
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_API_TYPE = os.getenv("OPENAI_API_TYPE", "openai")
 OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")
 OPENAI_API_VERSION = os.getenv("OPENAI_API_VERSION")
 MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+MAX_TOKENS = 800
+# keep-alive connections kept per client (and per host for the REST fallback)
+POOL_SIZE = int(os.getenv("PR_ANALYZER_LLM_POOL_SIZE", "16"))
+
+# long-lived sync clients shared by every thread: one OpenAI client per configuration and one requests
+# session for the REST fallback, so calls reuse pooled connections instead of a new TLS handshake each
+_CLIENTS: Dict[Tuple, object] = {}
+_SESSION = None
+_CLIENTS_LOCK = threading.Lock()
+
+
+def _client_config() -> Tuple:
+    # what OpenAI() reads from the environment
+    return tuple(os.getenv(k) for k in ("OPENAI_API_KEY", "OPENAI_BASE_URL", "OPENAI_ORG_ID"))
 
 
 def _make_client() -> Optional[object]:
-    if OpenAI is None:
+    """The shared OpenAI client for the current configuration; None without the openai package."""
+    try:
+        # new-style client; imported on first call, it is slow to import
+        from openai import OpenAI
+    except Exception:
+        return None
+    config = _client_config()
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(config)
+        if client is None:
+            import httpx
+
+            # client will pick up env vars for api key / base automatically (and raise without a key)
+            http = httpx.Client(timeout=60, limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE))
+            try:
+                # retries and timeouts come from `llm_transport`, not the SDK's own
+                client = OpenAI(http_client=http, max_retries=0)
+            except Exception:
+                http.close()
+                raise
+            _CLIENTS[config] = client
+        return client
+
+
+def _http_session():
+    """The shared requests session for the REST fallback; urllib3's connection pool is thread-safe."""
+    global _SESSION
+    with _CLIENTS_LOCK:
+        if _SESSION is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE))
+            session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE))
+            _SESSION = session
+        return _SESSION
+
+
+def close():
+    """Close the shared sync clients and their connections (server shutdown); later calls open new ones."""
+    global _SESSION
+    with _CLIENTS_LOCK:
+        clients, session = list(_CLIENTS.values()), _SESSION
+        _CLIENTS.clear()
+        _SESSION = None
+    for client in clients:
+        client.close()
+    if session is not None:
+        session.close()
+
+
+# one async OpenAI client and one httpx client (each with its connection pool) per event loop, reused by
+# every ask_llm_async call on it; closed by `aclose`
+_ASYNC_LOOP = None
+_ASYNC_CLIENT = None
+_ASYNC_HTTP = None
+_ASYNC_CLIENT_ERROR: Optional[BaseException] = None
+
+
+def _async_clients():
+    """(AsyncOpenAI client or None, httpx.AsyncClient) for the running loop, created on first use."""
+    global _ASYNC_LOOP, _ASYNC_CLIENT, _ASYNC_HTTP, _ASYNC_CLIENT_ERROR
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    if _ASYNC_LOOP is not loop:
+        # clients are bound to the loop that created them; a new loop (e.g. a test's asyncio.run) gets its own
+        import httpx
+
+        _ASYNC_LOOP, _ASYNC_CLIENT, _ASYNC_CLIENT_ERROR = loop, None, None
+        _ASYNC_HTTP = httpx.AsyncClient(timeout=60, limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE))
+        try:
+            from openai import AsyncOpenAI
+
+            _ASYNC_CLIENT = AsyncOpenAI(http_client=_ASYNC_HTTP, max_retries=0)
+        except Exception as e:
+            # no openai package or no key configured: only the REST fallback can be used
+            _ASYNC_CLIENT_ERROR = e
+    return _ASYNC_CLIENT, _ASYNC_HTTP
+
+
+async def aclose():
+    """Close the shared async clients (server shutdown)."""
+    global _ASYNC_LOOP, _ASYNC_CLIENT, _ASYNC_HTTP
+    http, _ASYNC_LOOP, _ASYNC_CLIENT, _ASYNC_HTTP = _ASYNC_HTTP, None, None, None
+    if http is not None:
+        await http.aclose()
+
+
+def _response_text(resp) -> str:
+    try:
+        return resp.choices[0].message.content
+    except Exception:
+        d = resp if isinstance(resp, dict) else resp.__dict__
+        try:
+            return d["choices"][0]["message"]["content"]
+        except Exception:
+            return str(resp)
+
+
+def _record_usage(resp):
+    """Count the tokens the API reports for a completion (SDK object or REST JSON)."""
+    usage = resp.get("usage") if isinstance(resp, dict) else getattr(resp, "usage", None)
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        n = usage.get(kind) if isinstance(usage, dict) else getattr(usage, kind, None)
+        if n:
+            LLM_TOKENS.inc(kind.split("_")[0], amount=n)
+
+
+def _delta_text(chunk) -> str:
+    """Text of one streamed completion chunk (SDK object or SSE JSON); empty for chunks without any."""
+    choices = chunk.get("choices") if isinstance(chunk, dict) else getattr(chunk, "choices", None)
+    if not choices:
+        # e.g. Azure's leading content-filter chunk
+        return ""
+    delta = (choices[0].get("delta") or {}) if isinstance(choices[0], dict) else getattr(choices[0], "delta", None)
+    content = delta.get("content") if isinstance(delta, dict) else getattr(delta, "content", None)
+    return content or ""
+
+
+# end of a streamed completion
+_SSE_DONE = object()
+
+
+def _sse_chunk(line: str):
+    """The completion chunk in one line of a server-sent-events stream: None for other lines (blank,
+    comments, event names), `_SSE_DONE` for the closing [DONE]."""
+    if not line or not line.startswith("data:"):
         return None
-    # client will pick up env vars for api key / base automatically
-    client = OpenAI()
-    return client
+    data = line[len("data:"):].strip()
+    return _SSE_DONE if data == "[DONE]" else json.loads(data)
 
 
-def ask_llm(prompt: str, temperature: float = 0.0) -> str:
+def _rest_request(prompt: str, temperature: float):
+    """(url, headers, payload) for the direct REST fallback (Azure OpenAI deployments path)."""
+    api_version = os.getenv("OPENAI_API_VERSION", "2023-05-15")
+    base = OPENAI_API_BASE.rstrip("/")
+    url = f"{base}/openai/deployments/{MODEL}/chat/completions?api-version={api_version}"
+    headers = {"api-key": OPENAI_API_KEY, "Content-Type": "application/json"}
+    payload = {"messages": [{"role": "user", "content": prompt}], "max_tokens": MAX_TOKENS, "temperature": temperature}
+    return url, headers, payload
+
+
+def ask_llm(prompt: str, temperature: float = 0.0, use_cache: bool = True) -> str:
     """Ask the configured OpenAI/Azure model. Returns string (raw content).
 
     This uses the new OpenAI Python client (OpenAI()) which works with both
     OpenAI and Azure OpenAI when environment variables are configured.
+    A prompt answered before is served from the on-disk response cache (`llm_cache`) unless `use_cache` is False.
     """
-    client = None
+    return cached_completion("", prompt, MODEL, temperature, MAX_TOKENS, lambda: _timed_ask_llm(prompt, temperature), use_cache=use_cache)
+
+
+def _timed_ask_llm(prompt: str, temperature: float) -> str:
+    with STAGE_SECONDS.time("llm"):
+        try:
+            text = _ask_llm(prompt, temperature)
+        except Exception:
+            LLM_REQUESTS.inc("error")
+            raise
+    LLM_REQUESTS.inc("ok")
+    return text
+
+
+def _endpoint(client) -> str:
+    # transports (and their circuit breakers) are per endpoint
+    return str(getattr(client, "base_url", None) or "openai")
+
+
+def _sdk_client():
     try:
-        client = _make_client()
-        if client is not None:
-            messages = [{"role": "user", "content": prompt}]
-            resp = client.chat.completions.create(model=MODEL, messages=messages, temperature=temperature, max_tokens=800)
-            try:
-                return resp.choices[0].message.content
-            except Exception:
-                d = resp if isinstance(resp, dict) else resp.__dict__
-                try:
-                    return d["choices"][0]["message"]["content"]
-                except Exception:
-                    return str(resp)
+        return _make_client()
     except Exception:
-        # fall through to REST fallback
-        pass
+        # not configured for the SDK (e.g. no OPENAI_API_KEY): REST only
+        return None
+
+
+def _ask_llm(prompt: str, temperature: float) -> str:
+    """One completion through `llm_transport` (deadline, retries, hedging, circuit breaker): with the SDK
+    client, falling back to the REST endpoint when that fails and one is configured."""
+    failure = None
+    client = _sdk_client()
+    if client is not None:
+        messages = [{"role": "user", "content": prompt}]
+        try:
+            resp = get_transport(_endpoint(client)).call(
+                lambda timeout: client.chat.completions.create(model=MODEL, messages=messages, temperature=temperature, max_tokens=MAX_TOKENS, timeout=timeout)
+            )
+            _record_usage(resp)
+            return _response_text(resp)
+        except Exception as e:
+            # fall through to REST fallback
+            failure = e
 
     # Fallback: If Azure/OpenAI base & key are set, call REST endpoint directly (works for Azure OpenAI)
     if OPENAI_API_BASE and OPENAI_API_KEY:
-        api_version = os.getenv("OPENAI_API_VERSION", "2023-05-15")
-        base = OPENAI_API_BASE.rstrip("/")
-        # Azure OpenAI uses deployments path
-        url = f"{base}/openai/deployments/{MODEL}/chat/completions?api-version={api_version}"
-        headers = {"api-key": OPENAI_API_KEY, "Content-Type": "application/json"}
-        payload = {"messages": [{"role": "user", "content": prompt}], "max_tokens": 800, "temperature": temperature}
-        r = requests.post(url, headers=headers, json=payload, timeout=60)
-        r.raise_for_status()
-        jr = r.json()
+        url, headers, payload = _rest_request(prompt, temperature)
+
+        def post(timeout: float):
+            r = _http_session().post(url, headers=headers, json=payload, timeout=timeout)
+            r.raise_for_status()
+            return r.json()
+
+        data = get_transport(OPENAI_API_BASE).call(post)
+        _record_usage(data)
+        return _response_text(data)
+
+    if failure is not None:
+        raise failure
+    raise RuntimeError("Unable to call OpenAI client or REST endpoint; check your OpenAI/Azure configuration.")
+
+
+async def ask_llm_async(prompt: str, temperature: float = 0.0, use_cache: bool = True) -> str:
+    """`ask_llm` for async callers: the request is awaited, never blocking the event loop.
+
+    Uses the shared OpenAI client when one can be configured, otherwise the REST endpoint; errors from
+    the call itself are raised, not retried through the other path. Shares `ask_llm`'s response cache.
+    """
+    import asyncio
+
+    cache = get_llm_cache() if use_cache else None
+    key = cache_key("", prompt, MODEL, temperature, MAX_TOKENS)
+    if cache is not None:
+        # a SQLite read (and recency update); keep it off the event loop
+        text = await asyncio.to_thread(cache.get, key)
+        if text is not None:
+            return text
+    with STAGE_SECONDS.time("llm"):
         try:
-            return jr["choices"][0]["message"]["content"]
+            text = await _ask_llm_async(prompt, temperature)
         except Exception:
-            return str(jr)
+            LLM_REQUESTS.inc("error")
+            raise
+    LLM_REQUESTS.inc("ok")
+    if cache is not None and text:
+        await asyncio.to_thread(cache.put, key, text)
+    return text
+
+
+async def _ask_llm_async(prompt: str, temperature: float) -> str:
+    client, http = _async_clients()
+    if client is not None:
+        messages = [{"role": "user", "content": prompt}]
+        resp = await get_transport(_endpoint(client)).call_async(
+            lambda timeout: client.chat.completions.create(model=MODEL, messages=messages, temperature=temperature, max_tokens=MAX_TOKENS, timeout=timeout)
+        )
+        _record_usage(resp)
+        return _response_text(resp)
+
+    if OPENAI_API_BASE and OPENAI_API_KEY:
+        url, headers, payload = _rest_request(prompt, temperature)
+
+        async def post(timeout: float):
+            r = await http.post(url, headers=headers, json=payload, timeout=timeout)
+            r.raise_for_status()
+            return r.json()
+
+        data = await get_transport(OPENAI_API_BASE).call_async(post)
+        _record_usage(data)
+        return _response_text(data)
+
+    raise RuntimeError("Unable to call OpenAI client or REST endpoint; check your OpenAI/Azure configuration.") from _ASYNC_CLIENT_ERROR
+
+
+def ask_llm_stream(prompt: str, temperature: float = 0.0, use_cache: bool = True) -> Iterator[str]:
+    """`ask_llm`, yielding the reply in pieces as the model produces them.
+
+    A cached reply is yielded in one piece; a streamed one is cached once complete. Unlike `ask_llm`, a
+    failing client call is not retried over REST, since part of the reply may already have been yielded.
+    """
+    cache = get_llm_cache() if use_cache else None
+    key = cache_key("", prompt, MODEL, temperature, MAX_TOKENS)
+    text = cache.get(key) if cache is not None else None
+    if text is not None:
+        yield text
+        return
+    parts = []
+    for piece in _timed_stream(_stream_llm(prompt, temperature)):
+        parts.append(piece)
+        yield piece
+    if cache is not None and parts:
+        cache.put(key, "".join(parts))
+
+
+def _timed_stream(pieces: Iterator[str]) -> Iterator[str]:
+    start = time.perf_counter()
+    first = True
+    try:
+        for piece in pieces:
+            if first:
+                STAGE_SECONDS.observe(time.perf_counter() - start, "llm_first_token")
+                first = False
+            yield piece
+    except Exception:
+        LLM_REQUESTS.inc("error")
+        raise
+    STAGE_SECONDS.observe(time.perf_counter() - start, "llm")
+    LLM_REQUESTS.inc("ok")
+
+
+def _stream_llm(prompt: str, temperature: float) -> Iterator[str]:
+    # the transport retries opening the stream (until the response headers arrive), never a stream that
+    # has started; nor does it hedge, which would leave a second stream open
+    client = _sdk_client()
+    if client is not None:
+        messages = [{"role": "user", "content": prompt}]
+        stream = get_transport(_endpoint(client)).call(
+            lambda timeout: client.chat.completions.create(model=MODEL, messages=messages, temperature=temperature, max_tokens=MAX_TOKENS, stream=True, timeout=timeout),
+            hedge=False,
+        )
+        for chunk in stream:
+            _record_usage(chunk)
+            piece = _delta_text(chunk)
+            if piece:
+                yield piece
+        return
+
+    if OPENAI_API_BASE and OPENAI_API_KEY:
+        url, headers, payload = _rest_request(prompt, temperature)
+
+        def open_stream(timeout: float):
+            r = _http_session().post(url, headers=headers, json={**payload, "stream": True}, timeout=timeout, stream=True)
+            try:
+                r.raise_for_status()
+            except Exception:
+                r.close()
+                raise
+            return r
+
+        with get_transport(OPENAI_API_BASE).call(open_stream, hedge=False) as r:
+            # chunk_size=None: lines as each chunk arrives, instead of waiting for 512 bytes. Decoded here, since
+            # requests would assume latin-1 for a text/event-stream without a charset
+            for line in r.iter_lines(chunk_size=None):
+                chunk = _sse_chunk(line.decode("utf-8"))
+                if chunk is _SSE_DONE:
+                    break
+                if chunk is not None:
+                    _record_usage(chunk)
+                    piece = _delta_text(chunk)
+                    if piece:
+                        yield piece
+        return
 
     raise RuntimeError("Unable to call OpenAI client or REST endpoint; check your OpenAI/Azure configuration.")
+
+
+async def ask_llm_stream_async(prompt: str, temperature: float = 0.0, use_cache: bool = True) -> AsyncIterator[str]:
+    """`ask_llm_stream` for async callers, on the shared async clients."""
+    import asyncio
+
+    cache = get_llm_cache() if use_cache else None
+    key = cache_key("", prompt, MODEL, temperature, MAX_TOKENS)
+    text = await asyncio.to_thread(cache.get, key) if cache is not None else None
+    if text is not None:
+        yield text
+        return
+    parts = []
+    start = time.perf_counter()
+    try:
+        async for piece in _stream_llm_async(prompt, temperature):
+            if not parts:
+                STAGE_SECONDS.observe(time.perf_counter() - start, "llm_first_token")
+            parts.append(piece)
+            yield piece
+    except Exception:
+        LLM_REQUESTS.inc("error")
+        raise
+    STAGE_SECONDS.observe(time.perf_counter() - start, "llm")
+    LLM_REQUESTS.inc("ok")
+    if cache is not None and parts:
+        await asyncio.to_thread(cache.put, key, "".join(parts))
+
+
+async def _stream_llm_async(prompt: str, temperature: float) -> AsyncIterator[str]:
+    client, http = _async_clients()
+    if client is not None:
+        messages = [{"role": "user", "content": prompt}]
+        stream = await get_transport(_endpoint(client)).call_async(
+            lambda timeout: client.chat.completions.create(model=MODEL, messages=messages, temperature=temperature, max_tokens=MAX_TOKENS, stream=True, timeout=timeout),
+            hedge=False,
+        )
+        async for chunk in stream:
+            _record_usage(chunk)
+            piece = _delta_text(chunk)
+            if piece:
+                yield piece
+        return
+
+    if OPENAI_API_BASE and OPENAI_API_KEY:
+        url, headers, payload = _rest_request(prompt, temperature)
+        async def open_stream(timeout: float):
+            request = http.build_request("POST", url, headers=headers, json={**payload, "stream": True}, timeout=timeout)
+            r = await http.send(request, stream=True)
+            try:
+                r.raise_for_status()
+            except Exception:
+                await r.aclose()
+                raise
+            return r
+
+        r = await get_transport(OPENAI_API_BASE).call_async(open_stream, hedge=False)
+        try:
+            async for line in r.aiter_lines():
+                chunk = _sse_chunk(line)
+                if chunk is _SSE_DONE:
+                    break
+                if chunk is not None:
+                    _record_usage(chunk)
+                    piece = _delta_text(chunk)
+                    if piece:
+                        yield piece
+        finally:
+            await r.aclose()
+        return
+
+    raise RuntimeError("Unable to call OpenAI client or REST endpoint; check your OpenAI/Azure configuration.") from _ASYNC_CLIENT_ERROR
@@ -0,0 +1,95 @@
+"""On-disk cache of LLM responses, keyed by everything that determines the completion.
+
+Re-runs of a diagnosis send byte-identical prompts; answering them from disk turns seconds of LLM latency
+into a SQLite lookup. Entries live in `<cache dir>/llm_responses.sqlite` (PR_ANALYZER_LLM_CACHE_DB), capped
+at PR_ANALYZER_LLM_CACHE_MB megabytes (default 256, least recently used evicted first) and expire after
+PR_ANALYZER_LLM_CACHE_TTL seconds (default 7 days, 0: never). PR_ANALYZER_LLM_CACHE=0 turns it off; callers
+can also bypass it per call.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from .cache import DiskLRUCache, cache_dir
+from .metrics import counter
+
+LLM_CACHE = counter("pr_analyzer_llm_cache_total", "LLM response cache lookups by outcome.", ["result"])
+
+_CACHE: Optional["LLMResponseCache"] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def cache_key(system: str, user: str, model: str, temperature: float, max_tokens: int) -> str:
+    payload = json.dumps([system, user, model, float(temperature), int(max_tokens)], ensure_ascii=False)
+    return "llm:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Response text by `cache_key`, in a `DiskLRUCache` with per-entry expiry."""
+
+    def __init__(self, path: str, max_bytes: int, ttl: float = 0):
+        self.ttl = ttl
+        self.expired = 0
+        self._store = DiskLRUCache(path, max_bytes=max_bytes)
+
+    def get(self, key: str) -> Optional[str]:
+        blob = self._store.get(key)
+        if blob is None:
+            LLM_CACHE.inc("miss")
+            return None
+        # the write time is kept with the text; DiskLRUCache itself only knows about recency
+        entry = json.loads(blob.decode("utf-8"))
+        if self.ttl and time.time() - entry["t"] > self.ttl:
+            self.expired += 1
+            LLM_CACHE.inc("expired")
+            return None
+        LLM_CACHE.inc("hit")
+        return entry["text"]
+
+    def put(self, key: str, text: str):
+        self._store.put(key, json.dumps({"t": time.time(), "text": text}, ensure_ascii=False).encode("utf-8"))
+
+    def stats(self) -> Dict[str, int]:
+        # an expired entry was found on disk, so the store counts it as a hit
+        s = self._store.stats()
+        return {**s, "hits": s["hits"] - self.expired, "misses": s["misses"] + self.expired, "expired": self.expired}
+
+    def close(self):
+        self._store.close()
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """The process-wide response cache, or None when PR_ANALYZER_LLM_CACHE=0."""
+    global _CACHE
+    if os.getenv("PR_ANALYZER_LLM_CACHE", "1") == "0":
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = LLMResponseCache(
+                os.getenv("PR_ANALYZER_LLM_CACHE_DB") or os.path.join(cache_dir(), "llm_responses.sqlite"),
+                max_bytes=int(os.getenv("PR_ANALYZER_LLM_CACHE_MB", "256")) * 1024 * 1024,
+                ttl=float(os.getenv("PR_ANALYZER_LLM_CACHE_TTL", str(7 * 24 * 3600))),
+            )
+        return _CACHE
+
+
+def cached_completion(
+    system: str, user: str, model: str, temperature: float, max_tokens: int, call: Callable[[], Optional[str]], use_cache: bool = True
+) -> Optional[str]:
+    """`call()`'s response for this request, from the cache when an identical one was answered before.
+
+    Empty or missing responses are not cached. `use_cache=False` always calls (and does not store).
+    """
+    cache = get_llm_cache() if use_cache else None
+    if cache is None:
+        return call()
+    key = cache_key(system, user, model, temperature, max_tokens)
+    text = cache.get(key)
+    if text is None:
+        text = call()
+        if text:
+            cache.put(key, text)
+    return text
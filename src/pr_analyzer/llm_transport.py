@@ -0,0 +1,369 @@
+"""Deadlines, retries, hedging and a circuit breaker around LLM requests.
+
+An `LLMTransport` runs one logical LLM call as a series of attempts, each a callable given the seconds it
+may take. 429/5xx responses, timeouts and connection errors are retried with jittered exponential backoff,
+waiting at least as long as the server's Retry-After. An attempt still unanswered after the hedging delay
+gets a second, concurrent copy, and whichever answers first wins. After enough failed attempts in a row the
+endpoint's circuit opens and calls fail right away (`CircuitOpen`) until a cooldown has passed; then one
+probe call decides whether it closes again. There is one transport per endpoint (`get_transport`), so an
+unhealthy deployment does not fail calls to another.
+
+Environment variables (constructor arguments take precedence):
+- PR_ANALYZER_LLM_TIMEOUT: seconds per attempt (default 30)
+- PR_ANALYZER_LLM_DEADLINE: seconds per call, retries and backoff included (default 60)
+- PR_ANALYZER_LLM_RETRIES: retries after the first attempt (default 3)
+- PR_ANALYZER_LLM_BACKOFF: seconds before the first retry, doubling after each (default 0.5)
+- PR_ANALYZER_LLM_HEDGE_AFTER: seconds before a slow attempt is hedged (default 0: never)
+- PR_ANALYZER_LLM_BREAKER_FAILURES / PR_ANALYZER_LLM_BREAKER_COOLDOWN: failures in a row that open the
+  circuit (default 5, 0: never) and seconds it stays open (default 30)
+"""
+import asyncio
+import email.utils
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, Tuple, TypeVar
+
+from .metrics import counter
+
+T = TypeVar("T")
+
+RETRY_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+LLM_RETRIES = counter("pr_analyzer_llm_retries_total", "LLM attempts retried, by cause (HTTP status, timeout or connection).", ["cause"])
+LLM_HEDGES = counter("pr_analyzer_llm_hedges_total", "Hedged LLM attempts, launched and won (answered before the original).", ["outcome"])
+LLM_CIRCUIT_OPEN = counter("pr_analyzer_llm_circuit_open_total", "LLM calls rejected because the endpoint's circuit was open.")
+
+_TRANSPORTS: Dict[str, "LLMTransport"] = {}
+_TRANSPORTS_LOCK = threading.Lock()
+_HEDGE_POOL: Optional[ThreadPoolExecutor] = None
+
+
+class TransportError(RuntimeError):
+    """An LLM call failed for good; `status` is the HTTP status of the last attempt (None for network errors)."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class DeadlineExceeded(TransportError):
+    """The call's deadline passed before an attempt succeeded."""
+
+
+class CircuitOpen(TransportError):
+    """The endpoint failed repeatedly and is not being called until its cooldown ends."""
+
+
+def _env_float(name: str, default: float) -> float:
+    v = os.getenv(name)
+    return float(v) if v else default
+
+
+def _retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Seconds the server asked us to wait: retry-after-ms (Azure OpenAI), else Retry-After in seconds or as an HTTP date."""
+    if not headers:
+        return None
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return float(ms) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _network_errors() -> Tuple[type, ...]:
+    # only the HTTP libraries already imported can have raised; don't import the others just to check
+    kinds = [TimeoutError, asyncio.TimeoutError, ConnectionError]
+    if "requests" in sys.modules:
+        import requests
+
+        kinds += [requests.ConnectionError, requests.Timeout]
+    if "httpx" in sys.modules:
+        import httpx
+
+        kinds.append(httpx.TransportError)
+    if "openai" in sys.modules:
+        import openai
+
+        if hasattr(openai, "APIConnectionError"):
+            kinds.append(openai.APIConnectionError)
+    return tuple(kinds)
+
+
+def _is_timeout(exc: BaseException) -> bool:
+    # requests.Timeout, httpx.TimeoutException and openai.APITimeoutError share no base class
+    return isinstance(exc, (TimeoutError, asyncio.TimeoutError)) or "Timeout" in type(exc).__name__
+
+
+def classify(exc: BaseException) -> Tuple[bool, Optional[int], Optional[float]]:
+    """(retryable, HTTP status, Retry-After seconds) of a failed attempt.
+
+    Understands the errors of requests, httpx and openai (both major versions) by their attributes:
+    a status code on the exception or its response, and the response headers.
+    """
+    response = getattr(exc, "response", None)
+    status = getattr(exc, "status_code", None) or getattr(exc, "http_status", None) or getattr(response, "status_code", None)
+    if isinstance(status, int):
+        headers = getattr(response, "headers", None) or getattr(exc, "headers", None)
+        return status in RETRY_STATUS, status, _retry_after(headers)
+    return isinstance(exc, _network_errors()), None, None
+
+
+class CircuitBreaker:
+    """Closed until `failures` attempts fail in a row; then open for `cooldown` seconds, after which a single
+    probe is let through (half-open). The probe's outcome closes the circuit or opens it again."""
+
+    def __init__(self, failures: int = 5, cooldown: float = 30.0):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state, self._probing = "half_open", False
+            if self.state == "half_open":
+                if self._probing:
+                    return False
+                self._probing = True
+                return True
+            return self.state == "closed"
+
+    def success(self):
+        with self._lock:
+            self.state, self.consecutive, self._probing = "closed", 0, False
+
+    def failure(self):
+        with self._lock:
+            self.consecutive += 1
+            if self.state == "half_open" or (self.failures and self.consecutive >= self.failures):
+                if self.state != "open":
+                    self.opened += 1
+                self.state, self._opened_at, self._probing = "open", time.monotonic(), False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.consecutive, "opened": self.opened}
+
+
+def _hedge_pool() -> ThreadPoolExecutor:
+    global _HEDGE_POOL
+    with _TRANSPORTS_LOCK:
+        if _HEDGE_POOL is None:
+            _HEDGE_POOL = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+        return _HEDGE_POOL
+
+
+class LLMTransport:
+    """Runs LLM calls against one endpoint with deadlines, retries, hedging and a circuit breaker.
+
+    Constructor arguments default to the PR_ANALYZER_LLM_* environment variables (see the module docstring).
+    An attempt is `attempt(timeout)`; it must give up after `timeout` seconds and raise on HTTP errors.
+    """
+
+    def __init__(
+        self,
+        name: str = "",
+        timeout: Optional[float] = None,
+        deadline: Optional[float] = None,
+        retries: Optional[int] = None,
+        backoff: Optional[float] = None,
+        hedge_after: Optional[float] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.name = name
+        self.timeout = _env_float("PR_ANALYZER_LLM_TIMEOUT", 30.0) if timeout is None else timeout
+        self.deadline = _env_float("PR_ANALYZER_LLM_DEADLINE", 60.0) if deadline is None else deadline
+        self.retries = int(_env_float("PR_ANALYZER_LLM_RETRIES", 3)) if retries is None else retries
+        self.backoff = _env_float("PR_ANALYZER_LLM_BACKOFF", 0.5) if backoff is None else backoff
+        # 0: no hedging
+        self.hedge_after = _env_float("PR_ANALYZER_LLM_HEDGE_AFTER", 0.0) if hedge_after is None else hedge_after
+        self.breaker = breaker or CircuitBreaker(
+            failures=int(_env_float("PR_ANALYZER_LLM_BREAKER_FAILURES", 5)), cooldown=_env_float("PR_ANALYZER_LLM_BREAKER_COOLDOWN", 30.0)
+        )
+        self.calls = 0
+        self.retried = 0
+        self.hedged = 0
+        self.hedges_won = 0
+        self.failed = 0
+
+    def _delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def _admit(self, last: Optional[BaseException]):
+        if not self.breaker.allow():
+            self.failed += 1
+            LLM_CIRCUIT_OPEN.inc()
+            raise CircuitOpen(f"{self.name or 'LLM endpoint'}: circuit open after repeated failures; not calling it for now") from last
+
+    def _failed(self, exc: BaseException, attempt: int, remaining: float) -> Optional[float]:
+        """Seconds to wait before retrying after `exc`, or None when the call should fail now."""
+        retryable, status, retry_after = classify(exc)
+        if retryable:
+            self.breaker.failure()
+        else:
+            # the request itself was bad (4xx); the endpoint answered, so it counts as healthy
+            self.breaker.success()
+            return None
+        if attempt >= self.retries:
+            return None
+        delay = self._delay(attempt, retry_after)
+        if delay >= remaining:
+            return None
+        self.retried += 1
+        LLM_RETRIES.inc(str(status) if status else ("timeout" if _is_timeout(exc) else "connection"))
+        return delay
+
+    def _give_up(self, exc: BaseException, attempts: int, expired: bool):
+        self.failed += 1
+        _, status, _ = classify(exc)
+        kind = DeadlineExceeded if expired else TransportError
+        raise kind(f"{self.name or 'LLM call'} failed after {attempts} attempt(s): {type(exc).__name__}: {exc}", status=status) from exc
+
+    def call(self, attempt: Callable[[float], T], hedge: bool = True) -> T:
+        """`attempt(timeout)`'s result, retried and hedged as configured. `hedge=False` for attempts that must
+        not run twice at once (e.g. ones that return an open stream)."""
+        self.calls += 1
+        end = time.monotonic() + self.deadline
+        last: Optional[BaseException] = None
+        for n in range(self.retries + 1):
+            self._admit(last)
+            remaining = end - time.monotonic()
+            try:
+                result = self._attempt(attempt, min(self.timeout, remaining), hedge)
+            except Exception as e:
+                last = e
+                delay = self._failed(e, n, end - time.monotonic())
+                if delay is None:
+                    self._give_up(e, n + 1, end - time.monotonic() <= 0 or _is_timeout(e))
+                time.sleep(delay)
+                continue
+            self.breaker.success()
+            return result
+        self._give_up(last, self.retries + 1, False)
+
+    def _attempt(self, attempt: Callable[[float], T], timeout: float, hedge: bool) -> T:
+        if not hedge or not self.hedge_after or self.hedge_after >= timeout:
+            return attempt(timeout)
+        pool = _hedge_pool()
+        first = pool.submit(attempt, timeout)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done:
+            return first.result()
+        # the original is slow: race a copy against it; the loser runs to its own timeout and is ignored
+        self.hedged += 1
+        LLM_HEDGES.inc("launched")
+        second = pool.submit(attempt, timeout - self.hedge_after)
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    if f is second:
+                        self.hedges_won += 1
+                        LLM_HEDGES.inc("won")
+                    return f.result()
+                error = f.exception()
+        raise error
+
+    async def call_async(self, attempt: Callable[[float], Awaitable[T]], hedge: bool = True) -> T:
+        """`call` for coroutines; attempts past their timeout, and hedges that lost, are cancelled."""
+        self.calls += 1
+        end = time.monotonic() + self.deadline
+        last: Optional[BaseException] = None
+        for n in range(self.retries + 1):
+            self._admit(last)
+            remaining = end - time.monotonic()
+            try:
+                result = await self._attempt_async(attempt, min(self.timeout, remaining), hedge)
+            except Exception as e:
+                last = e
+                delay = self._failed(e, n, end - time.monotonic())
+                if delay is None:
+                    self._give_up(e, n + 1, end - time.monotonic() <= 0 or _is_timeout(e))
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.success()
+            return result
+        self._give_up(last, self.retries + 1, False)
+
+    async def _attempt_async(self, attempt: Callable[[float], Awaitable[T]], timeout: float, hedge: bool) -> T:
+        first = asyncio.ensure_future(asyncio.wait_for(attempt(timeout), timeout))
+        if not hedge or not self.hedge_after or self.hedge_after >= timeout:
+            return await first
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if done:
+                return first.result()
+            self.hedged += 1
+            LLM_HEDGES.inc("launched")
+            second = asyncio.ensure_future(asyncio.wait_for(attempt(timeout - self.hedge_after), timeout - self.hedge_after))
+            tasks.add(second)
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is None:
+                        if t is second:
+                            self.hedges_won += 1
+                            LLM_HEDGES.inc("won")
+                        return t.result()
+                    error = t.exception()
+            raise error
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "retries": self.retried,
+            "hedged": self.hedged,
+            "hedges_won": self.hedges_won,
+            "failed": self.failed,
+            "circuit": self.breaker.stats(),
+        }
+
+
+def get_transport(endpoint: str) -> LLMTransport:
+    """The process-wide transport (and circuit breaker) for an endpoint, e.g. a base URL."""
+    with _TRANSPORTS_LOCK:
+        transport = _TRANSPORTS.get(endpoint)
+        if transport is None:
+            transport = _TRANSPORTS[endpoint] = LLMTransport(endpoint)
+        return transport
+
+
+def transport_stats() -> Dict[str, Dict[str, Any]]:
+    with _TRANSPORTS_LOCK:
+        transports = dict(_TRANSPORTS)
+    return {endpoint: t.stats() for endpoint, t in transports.items()}
+
+
+def reset_transports():
+    """Forget every endpoint's transport and circuit state; new ones pick up the current environment."""
+    with _TRANSPORTS_LOCK:
+        _TRANSPORTS.clear()
@@ -0,0 +1,145 @@
+"""Indexed chunk metadata and file manifest, stored in SQLite (`<index>.meta.db`).
+
+Replaces the monolithic `.meta` JSON list and `.manifest.json`: chunk rows are
+addressed by vector id (the FAISS id and chunk store record number) and indexed
+by path, so a query reads only the k rows it returns and an incremental build
+touches only the rows of changed files.
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    chunk_size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    live INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS chunks_path ON chunks(path, chunk_index);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime INTEGER,
+    hash TEXT
+);
+CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+META_FIELDS = ("path", "chunk_index", "chunk_size", "hash")
+
+
+class MetaStore:
+    def __init__(self, path: str, readonly: bool = False):
+        self.path = path
+        # handles are shared by request threads; serialize use of the connection
+        self._lock = threading.Lock()
+        if readonly:
+            self._db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.executescript(SCHEMA)
+            self._db.commit()
+
+    # -- chunks, by vector id --------------------------------------------------------------
+
+    def __len__(self) -> int:
+        """Number of ids allocated so far (live or not); new chunks continue from here."""
+        row = self._db.execute("SELECT MAX(id) FROM chunks").fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def add_chunks(self, ids: List[int], metas: List[Dict]):
+        self._db.executemany(
+            "INSERT INTO chunks (id, path, chunk_index, chunk_size, hash, live) VALUES (?, ?, ?, ?, ?, 1)",
+            [(i, m["path"], m["chunk_index"], m["chunk_size"], m["hash"]) for i, m in zip(ids, metas)],
+        )
+
+    def mark_dead(self, ids: Iterable[int]):
+        self._db.executemany("UPDATE chunks SET live = 0 WHERE id = ?", [(int(i),) for i in ids])
+
+    def get_many(self, ids: Iterable[int]) -> Dict[int, Dict]:
+        ids = [int(i) for i in ids]
+        if not ids:
+            return {}
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, path, chunk_index, chunk_size, hash FROM chunks WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()
+        return {r[0]: dict(zip(META_FIELDS, r[1:])) for r in rows}
+
+    def get(self, cid: int) -> Optional[Dict]:
+        return self.get_many([cid]).get(int(cid))
+
+    def by_path(self, path: str, live_only: bool = True) -> List[Tuple[int, Dict]]:
+        q = "SELECT id, path, chunk_index, chunk_size, hash FROM chunks WHERE path = ?" + (" AND live = 1" if live_only else "") + " ORDER BY chunk_index"
+        with self._lock:
+            rows = self._db.execute(q, (path,)).fetchall()
+        return [(r[0], dict(zip(META_FIELDS, r[1:]))) for r in rows]
+
+    def iter_chunks(self, live_only: bool = True) -> Iterator[Tuple[int, Dict]]:
+        q = "SELECT id, path, chunk_index, chunk_size, hash FROM chunks" + (" WHERE live = 1" if live_only else "") + " ORDER BY id"
+        for r in self._db.execute(q):
+            yield r[0], dict(zip(META_FIELDS, r[1:]))
+
+    def paths(self) -> List[str]:
+        return [r[0] for r in self._db.execute("SELECT DISTINCT path FROM chunks WHERE live = 1")]
+
+    def live_ids(self) -> np.ndarray:
+        return np.array([r[0] for r in self._db.execute("SELECT id FROM chunks WHERE live = 1 ORDER BY id")], dtype=np.int64)
+
+    # -- file manifest ---------------------------------------------------------------------
+
+    def files(self) -> Dict[str, Tuple[int, int, str]]:
+        return {r[0]: (r[1], r[2], r[3]) for r in self._db.execute("SELECT path, size, mtime, hash FROM files")}
+
+    def set_file(self, path: str, size: int, mtime: int, content_hash: str):
+        self._db.execute("INSERT OR REPLACE INTO files (path, size, mtime, hash) VALUES (?, ?, ?, ?)", (path, size, mtime, content_hash))
+
+    def delete_file(self, path: str):
+        self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    # -- settings --------------------------------------------------------------------------
+
+    def get_setting(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_setting(self, key: str, value):
+        self._db.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def commit(self):
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    # -- migration -------------------------------------------------------------------------
+
+    def import_json(self, meta_json: str, manifest_json: Optional[str] = None, default_chunk_size: int = 1024):
+        """Load a legacy `.meta` JSON list (position = vector id) and, if present, its `.manifest.json`.
+
+        The oldest indexes did not record a chunk size per row; they were all built with `default_chunk_size`.
+        """
+        with open(meta_json, "r", encoding="utf-8") as fh:
+            metas = json.load(fh)
+        manifest = None
+        if manifest_json and os.path.exists(manifest_json):
+            with open(manifest_json, "r", encoding="utf-8") as fh:
+                manifest = json.load(fh)
+        self.add_chunks(
+            list(range(len(metas))),
+            [{"path": m.get("path", ""), "chunk_index": m.get("chunk_index", 0), "chunk_size": m.get("chunk_size") or default_chunk_size, "hash": m.get("hash", "")} for m in metas],
+        )
+        if manifest is not None:
+            live = {cid for e in manifest["files"].values() for cid, _ in e.get("chunks", [])}
+            self.mark_dead(i for i in range(len(metas)) if i not in live)
+            for p, e in manifest["files"].items():
+                self.set_file(p, e.get("size"), e.get("mtime"), e.get("hash"))
+            self.set_setting("chunk_size", manifest.get("chunk_size"))
+        self.commit()
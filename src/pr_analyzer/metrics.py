@@ -0,0 +1,170 @@
+"""Process-wide latency histograms and counters, exposed in the Prometheus text format (`render`).
+
+Recording is a bisect and a few additions under a lock, cheap enough to leave on in production. Metrics
+are per process: with a process worker pool, stages that run inside the workers are recorded there and
+do not show up in the server's /metrics.
+"""
+import bisect
+import threading
+import time
+from typing import Dict, List, Sequence, Tuple
+
+# seconds; spans a cached lookup (sub-millisecond) to a slow LLM call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_REGISTRY: List["_Metric"] = []
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Sequence[str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_number(v)}" for k, v in values]
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: "Histogram", labels: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        # failed calls are timed too; their count shows up in the matching error counter
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [count per bucket (last one is +Inf)..., sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        key = self._key(labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[slot] += 1
+            row[-1] += value
+
+    def time(self, *labels: str) -> _Timer:
+        """Context manager that observes the wall time of its block."""
+        return _Timer(self, self._key(labels))
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            row = self._values.get(self._key(labels))
+            return 0 if row is None else int(sum(row[:-1]))
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((k, list(v)) for k, v in self._values.items())
+        lines = []
+        for key, row in values:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), row[:-1]):
+                cumulative += n
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_number(row[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def _register(metric):
+    with _REGISTRY_LOCK:
+        _REGISTRY.append(metric)
+    return metric
+
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return _register(Counter(name, help, labelnames))
+
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help, labelnames, buckets))
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format (version 0.0.4)."""
+    with _REGISTRY_LOCK:
+        metrics = list(_REGISTRY)
+    return "\n".join(m.render() for m in metrics) + "\n"
+
+
+REQUEST_SECONDS = histogram("pr_analyzer_request_seconds", "End-to-end latency of API requests (rejected ones included).", ["endpoint"])
+# stages of a request: parse, retrieve (embed + vector_search + lexical_search + fetch), prompt, llm
+STAGE_SECONDS = histogram("pr_analyzer_stage_seconds", "Latency of each stage of an analysis.", ["stage"])
+BUILD_STAGE_SECONDS = histogram(
+    "pr_analyzer_build_stage_seconds", "Latency of index build stages (embed per batch, lexical, ann).", ["stage"], buckets=DEFAULT_BUCKETS + (120.0, 300.0, 900.0)
+)
+RESULT_CACHE = counter("pr_analyzer_result_cache_total", "Result cache lookups by outcome.", ["result"])
+LLM_REQUESTS = counter("pr_analyzer_llm_requests_total", "LLM calls by outcome.", ["outcome"])
+LLM_TOKENS = counter("pr_analyzer_llm_tokens_total", "Tokens reported by the LLM API.", ["kind"])
+BUILD_CHUNKS = counter("pr_analyzer_build_chunks_total", "Chunk vectors produced by index builds, by where they came from.", ["source"])
@@ -0,0 +1,163 @@
+"""Batched OpenAI / Azure OpenAI embeddings over REST.
+
+Texts are sent `batch_size` at a time with up to `concurrency` requests in flight,
+throttled by request- and token-per-minute buckets. 429/5xx and connection errors
+are retried with jittered exponential backoff (honouring Retry-After). Finished
+batches can be checkpointed to a directory so an interrupted run resumes where it
+stopped.
+
+Environment variables (constructor arguments take precedence):
+- OPENAI_API_BASE / OPENAI_API_KEY / OPENAI_API_TYPE / OPENAI_API_VERSION (same as llm.py)
+- OPENAI_EMBED_BATCH_SIZE (default 64), OPENAI_EMBED_CONCURRENCY (default 4)
+- OPENAI_EMBED_RPM / OPENAI_EMBED_TPM: request and token rate limits (unset = unlimited)
+"""
+import hashlib
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+import requests
+
+RETRY_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+
+def _env_int(name: str, default: Optional[int]) -> Optional[int]:
+    v = os.getenv(name)
+    return int(v) if v else default
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate_per_minute`."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, n: float = 1.0):
+        # a single request larger than the bucket waits for a full bucket rather than forever
+        n = min(n, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class EmbeddingRequestError(RuntimeError):
+    pass
+
+
+class OpenAIEmbedder:
+    def __init__(
+        self,
+        model: str,
+        api_base: Optional[str] = None,
+        api_key: Optional[str] = None,
+        api_type: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_retries: int = 6,
+        backoff: float = 1.0,
+        timeout: float = 60.0,
+    ):
+        self.model = model
+        self.api_base = (api_base or os.getenv("OPENAI_API_BASE") or "https://api.openai.com/v1").rstrip("/")
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY", "")
+        self.api_type = api_type or os.getenv("OPENAI_API_TYPE", "openai")
+        self.batch_size = batch_size or _env_int("OPENAI_EMBED_BATCH_SIZE", 64)
+        self.concurrency = concurrency or _env_int("OPENAI_EMBED_CONCURRENCY", 4)
+        rpm = requests_per_minute or _env_int("OPENAI_EMBED_RPM", None)
+        tpm = tokens_per_minute or _env_int("OPENAI_EMBED_TPM", None)
+        self.request_bucket = TokenBucket(rpm) if rpm else None
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _url_and_headers(self):
+        if self.api_type == "azure":
+            version = os.getenv("OPENAI_API_VERSION", "2023-05-15")
+            url = f"{self.api_base}/openai/deployments/{self.model}/embeddings?api-version={version}"
+            return url, {"api-key": self.api_key, "Content-Type": "application/json"}
+        return f"{self.api_base}/embeddings", {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    def _throttle(self, texts: List[str]):
+        if self.request_bucket:
+            self.request_bucket.acquire(1)
+        if self.token_bucket:
+            # ~4 characters per token is close enough for throttling
+            self.token_bucket.acquire(sum(len(t) for t in texts) / 4.0 + 1)
+
+    def _request(self, texts: List[str]) -> np.ndarray:
+        url, headers = self._url_and_headers()
+        payload = {"input": texts}
+        if self.api_type != "azure":
+            payload["model"] = self.model
+        last = None
+        for attempt in range(self.max_retries + 1):
+            self._throttle(texts)
+            retry_after = None
+            try:
+                r = self.session.post(url, headers=headers, json=payload, timeout=self.timeout)
+                if r.status_code not in RETRY_STATUS:
+                    r.raise_for_status()
+                    data = sorted(r.json()["data"], key=lambda d: d["index"])
+                    return np.array([d["embedding"] for d in data], dtype=np.float32)
+                last = EmbeddingRequestError(f"HTTP {r.status_code}: {r.text[:200]}")
+                retry_after = r.headers.get("Retry-After")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last = e
+            if attempt == self.max_retries:
+                break
+            delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+            if retry_after:
+                try:
+                    delay = max(delay, float(retry_after))
+                except ValueError:
+                    pass
+            time.sleep(delay)
+        raise EmbeddingRequestError(f"embedding batch failed after {self.max_retries + 1} attempts: {last}")
+
+    def _checkpoint_file(self, checkpoint_dir: str, texts: List[str]) -> str:
+        h = hashlib.sha1(self.model.encode())
+        for t in texts:
+            h.update(hashlib.sha1(t.encode()).digest())
+        return os.path.join(checkpoint_dir, h.hexdigest() + ".npy")
+
+    def _embed_batch(self, texts: List[str], checkpoint_dir: Optional[str]) -> np.ndarray:
+        if checkpoint_dir:
+            path = self._checkpoint_file(checkpoint_dir, texts)
+            if os.path.exists(path):
+                return np.load(path)
+        embs = self._request(texts)
+        if checkpoint_dir:
+            tmp = path + ".tmp.npy"
+            np.save(tmp, embs)
+            os.replace(tmp, path)
+        return embs
+
+    def embed(self, texts: List[str], checkpoint_dir: Optional[str] = None) -> np.ndarray:
+        if checkpoint_dir:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+        batches = [texts[i : i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1 or self.concurrency <= 1:
+            results = [self._embed_batch(b, checkpoint_dir) for b in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as ex:
+                results = list(ex.map(lambda b: self._embed_batch(b, checkpoint_dir), batches))
+        return np.vstack(results) if results else np.zeros((0, 0), dtype=np.float32)
@@ -26,6 +26,6 @@ def parse_stack_trace(trace: str) -> List[Dict]:
             continue
         m = CS_FRAME_RE.match(line)
         if m:
-            frames.append({"lang": "csharp", "file": m.group("file"), "line": int(m.group("line")), "func": m.group("method"), "raw": line})
+            frames.append({"lang": "csharp", "file": m.group("file"), "line": int(m.group("line")), "func": m.group("method"), "class": m.group("class"), "raw": line})
             continue
     return frames
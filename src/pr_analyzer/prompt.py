@@ -0,0 +1,194 @@
+"""Packing of retrieved code into the analysis prompt under a token budget.
+
+Retrieval returns fixed-size chunks ranked best first, often overlapping: the same chunk found for
+several frames, or neighbouring chunks of one file. `pack_snippets` merges neighbouring chunks of a file
+into one region and drops duplicates. It then spends the budget on the lines around the failing frame's
+line first, then on the frame's file, then on the other regions by rank. Tokens are estimated from the
+character count (`CHARS_PER_TOKEN`), so no tokenizer is needed.
+"""
+import hashlib
+import math
+import os
+from typing import Any, Dict, List, Optional
+
+# rough size of a token in source code
+CHARS_PER_TOKEN = 4
+# snippet tokens per prompt; about what three 800-character snippets used to cost
+DEFAULT_BUDGET = int(os.getenv("PR_ANALYZER_PROMPT_TOKENS", "600"))
+# lines kept on either side of the frame's line
+FRAME_CONTEXT = 12
+# a region cut down to the leftover budget must keep at least this much to be worth including
+MIN_PIECE_TOKENS = 48
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _norm(path: Optional[str]) -> str:
+    return (path or "").replace("\\", "/")
+
+
+def _same_file(path: Optional[str], frame_file: Optional[str]) -> bool:
+    if not path or not frame_file:
+        return False
+    path, frame_file = _norm(path), _norm(frame_file).lstrip("./")
+    return path == frame_file or path.endswith("/" + frame_file) or os.path.basename(path) == os.path.basename(frame_file)
+
+
+def _start_line(region: Dict[str, Any], sources: Dict[str, Optional[str]]) -> Optional[int]:
+    """First line number of a region: from the snippet when given, else located in the source file.
+
+    Chunks are character ranges (`chunk_index * chunk_size`). The position is only trusted when the file
+    still holds the indexed text there.
+    """
+    if region.get("start_line"):
+        return region["start_line"]
+    index, size, path = region.get("chunk_index"), region.get("chunk_size"), region.get("path")
+    if not isinstance(index, int) or not size or not path:
+        return None
+    if path not in sources:
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                sources[path] = fh.read()
+        except Exception:
+            sources[path] = None
+    source = sources[path]
+    offset = index * int(size)
+    if source is None or source[offset : offset + len(region["snippet"])] != region["snippet"]:
+        return None
+    return source.count("\n", 0, offset) + 1
+
+
+def _regions(snippets: List[Dict]) -> List[Dict[str, Any]]:
+    """Merge consecutive chunks of a file into regions and drop repeats; ranked by their best chunk."""
+    by_path: Dict[Any, Dict[Any, Dict[str, Any]]] = {}
+    for rank, s in enumerate(snippets):
+        chunks = by_path.setdefault(s.get("path"), {})
+        key = s.get("chunk_index") if s.get("chunk_index") is not None else ("rank", rank)
+        if key not in chunks:
+            chunks[key] = {**s, "snippet": s.get("snippet") or "", "rank": rank}
+    regions: List[Dict[str, Any]] = []
+    for chunks in by_path.values():
+        indexed = sorted((c for k, c in chunks.items() if isinstance(k, int)), key=lambda c: c["chunk_index"])
+        for c in indexed:
+            prev = regions[-1] if regions else None
+            if prev is not None and prev.get("path") == c.get("path") and prev.get("last_index") == c["chunk_index"] - 1 and prev.get("chunk_size") == c.get("chunk_size"):
+                prev["snippet"] += c["snippet"]
+                prev["last_index"] = c["chunk_index"]
+                prev["rank"] = min(prev["rank"], c["rank"])
+            else:
+                regions.append({**c, "last_index": c["chunk_index"]})
+        regions.extend(c for k, c in chunks.items() if not isinstance(k, int))
+    # the same code under two paths (vendored or copied files) is sent once
+    seen = set()
+    unique = []
+    for r in sorted(regions, key=lambda r: r["rank"]):
+        digest = hashlib.sha1(r["snippet"].strip().encode("utf-8")).hexdigest()
+        if r["snippet"].strip() and digest not in seen:
+            seen.add(digest)
+            unique.append(r)
+    return unique
+
+
+def _piece(region: Dict[str, Any], lines: List[str], start: Optional[int], mark: Optional[int] = None) -> Dict[str, Any]:
+    # blank lines at either end carry nothing; keep line numbers aligned while dropping them
+    while lines and not lines[0].strip():
+        lines = lines[1:]
+        start = start + 1 if start else start
+    while lines and not lines[-1].strip():
+        lines = lines[:-1]
+    if mark is not None and start:
+        # number the lines around the frame and point at the frame's own line
+        text = "\n".join(f"{n}{'>' if n == mark else ':'} {line}" for n, line in enumerate(lines, start))
+    else:
+        text = "\n".join(lines)
+    return {
+        "path": region.get("path"),
+        "chunk_index": region.get("chunk_index"),
+        "start_line": start,
+        "end_line": start + len(lines) - 1 if start else None,
+        "score": region.get("score"),
+        "snippet": text,
+    }
+
+
+def _frame_window(region: Dict[str, Any], start: int, line: int, budget: int, context: int = FRAME_CONTEXT) -> Dict[str, Any]:
+    lines = region["snippet"].split("\n")
+    at = line - start
+    lo, hi = max(0, at - context), min(len(lines), at + context + 1)
+    piece = _piece(region, lines[lo:hi], start + lo, mark=line)
+    # very long lines: give up context, farthest lines first, until the window fits
+    while estimate_tokens(piece["snippet"]) > budget and hi - lo > 1:
+        if at - lo > hi - 1 - at:
+            lo += 1
+        else:
+            hi -= 1
+        piece = _piece(region, lines[lo:hi], start + lo, mark=line)
+    return piece
+
+
+def _head(region: Dict[str, Any], start: Optional[int], budget: int) -> Dict[str, Any]:
+    """The leading lines of a region that fit in `budget` tokens."""
+    kept, used = [], 0
+    for line in region["snippet"].split("\n"):
+        cost = estimate_tokens(line + "\n")
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    return _piece(region, kept, start)
+
+
+def pack_snippets(frame: Dict[str, Any], snippets: List[Dict], budget_tokens: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Code to show the LLM for `frame`, at most `budget_tokens` (default PR_ANALYZER_PROMPT_TOKENS) in all.
+
+    `snippets` are retrieval results ranked best first ({"path", "chunk_index", "chunk_size", "snippet", ...}).
+    Returns {"path", "chunk_index", "start_line", "end_line", "score", "snippet"} pieces in prompt order; line
+    numbers are None when the source file is not available to place a chunk.
+    """
+    budget = DEFAULT_BUDGET if budget_tokens is None else budget_tokens
+    sources: Dict[str, Optional[str]] = {}
+    regions = _regions(snippets)
+    frame_file, frame_line = frame.get("file"), frame.get("line")
+    starts = [_start_line(r, sources) for r in regions]
+    # the frame's file before the rest, each group by rank
+    order = sorted(range(len(regions)), key=lambda i: (not _same_file(regions[i].get("path"), frame_file), regions[i]["rank"]))
+
+    packed: List[Dict[str, Any]] = []
+    focus = None
+    if frame_line:
+        for i in order:
+            start = starts[i]
+            if start and _same_file(regions[i].get("path"), frame_file) and start <= frame_line < start + regions[i]["snippet"].count("\n") + 1:
+                focus = i
+                packed.append(_frame_window(regions[i], start, frame_line, budget))
+                budget -= estimate_tokens(packed[-1]["snippet"])
+                break
+    for i in order:
+        if i == focus or budget <= 0:
+            continue
+        piece = _piece(regions[i], regions[i]["snippet"].split("\n"), starts[i])
+        cost = estimate_tokens(piece["snippet"])
+        if cost > budget:
+            if budget < MIN_PIECE_TOKENS:
+                # something smaller further down may still fit
+                continue
+            piece = _head(regions[i], starts[i], budget)
+            cost = estimate_tokens(piece["snippet"])
+        if piece["snippet"]:
+            packed.append(piece)
+            budget -= cost
+    if focus is not None and budget > 0:
+        # budget left over: widen the frame's window with more of its surroundings
+        window = packed[0]
+        total = estimate_tokens(window["snippet"]) + budget
+        context = FRAME_CONTEXT
+        while True:
+            context += 4
+            wider = _frame_window(regions[focus], starts[focus], frame_line, total, context)
+            if wider["end_line"] - wider["start_line"] <= window["end_line"] - window["start_line"]:
+                break
+            window = wider
+        packed[0] = window
+    return packed
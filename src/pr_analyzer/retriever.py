@@ -1,7 +1,84 @@
-from typing import List, Dict
-from .indexer import search_index
+import re
+from typing import List, Dict, Optional, Tuple
+from .indexer import index_handle
+from .lexical import IDENT_RE
+from .parser import parse_stack_trace
 
+# reciprocal rank fusion constant; dampens the advantage of the very top ranks
+RRF_K = 60
+# candidates taken from each retriever per requested result
+CANDIDATE_FACTOR = 4
+# frame vocabulary that says nothing about which code is involved
+STOP_TERMS = {"at", "in", "line", "file", "module", "lambda", "anonymous", "object", "type", "string", "int", "void", "system"}
 
-def retrieve_for_frame(index_path: str, frame_raw: str, top_k: int = 5) -> List[Dict]:
-    """Retrieve relevant code snippets for a given stack frame raw text."""
-    return search_index(index_path, frame_raw, top_k=top_k)
+
+def _frame_query(frame_raw: str) -> str:
+    """Lexical query for a frame: its class and method names plus the file name, without argument lists,
+    namespaces or build paths. Unparseable lines fall back to their identifiers."""
+    frames = parse_stack_trace(frame_raw)
+    if not frames:
+        return " ".join(t for t in IDENT_RE.findall(frame_raw) if t.lower() not in STOP_TERMS)
+    frame = frames[0]
+    names = IDENT_RE.findall((frame.get("func") or "").split("(")[0])
+    if frame.get("class"):
+        names = IDENT_RE.findall(frame["class"])[-1:] + names
+    stem = re.split(r"[\\/]", frame.get("file") or "")[-1].rsplit(".", 1)[0]
+    terms = names[-2:] + IDENT_RE.findall(stem)
+    return " ".join(dict.fromkeys(t for t in terms if t.lower() not in STOP_TERMS))
+
+
+def _frame_symbol(frame_raw: str) -> Optional[str]:
+    """Most specific identifier of a frame (method/function name), lower-cased, if the line parses as a frame."""
+    frames = parse_stack_trace(frame_raw)
+    if not frames:
+        return None
+    idents = IDENT_RE.findall(frames[0].get("func") or "")
+    return idents[-1].lower() if idents else None
+
+
+def _fuse(rankings: List[List[Tuple[int, float]]], top_k: int) -> List[Tuple[int, float]]:
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, (cid, _) in enumerate(ranking):
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+
+
+def retrieve_for_frames(index_path: str, frame_raws: List[str], top_k: int = 5, mode: str = "hybrid") -> List[List[Dict]]:
+    """Retrieve snippets for several stack frames at once; one result list per frame.
+
+    Frames that need embedding search share one embedding batch and one FAISS search,
+    and chunks returned for several frames are read once.
+
+    mode: "vector" (embeddings only), "lexical" (BM25 over identifiers only) or "hybrid".
+    Hybrid answers a frame from the lexical index alone when its top hits all contain the
+    frame's method name as an exact identifier; otherwise lexical and vector rankings are fused.
+    """
+    with index_handle(index_path) as handle:
+        return _retrieve(handle, frame_raws, top_k, mode)
+
+
+def _retrieve(handle, frame_raws: List[str], top_k: int, mode: str) -> List[List[Dict]]:
+    if mode == "vector":
+        return handle.search_many(frame_raws, top_k=top_k)
+    lexical = [handle.lexical_search(_frame_query(f), top_k * CANDIDATE_FACTOR) for f in frame_raws]
+    if mode == "lexical":
+        return handle.fetch_many([hits[:top_k] for hits in lexical])
+
+    ranked: List[Optional[List[Tuple[int, float]]]] = [None] * len(frame_raws)
+    pending = []
+    for n, (frame_raw, hits) in enumerate(zip(frame_raws, lexical)):
+        symbol = _frame_symbol(frame_raw)
+        if symbol and len(hits) >= top_k and all(handle.has_identifier(cid, symbol) for cid, _ in hits[:top_k]):
+            ranked[n] = hits[:top_k]
+        else:
+            pending.append(n)
+    vectors = handle.vector_search_many([frame_raws[n] for n in pending], top_k * CANDIDATE_FACTOR)
+    for n, vector in zip(pending, vectors):
+        ranked[n] = _fuse([lexical[n], vector], top_k) if lexical[n] else vector[:top_k]
+    return handle.fetch_many(ranked)
+
+
+def retrieve_for_frame(index_path: str, frame_raw: str, top_k: int = 5, mode: str = "hybrid") -> List[Dict]:
+    """Retrieve relevant code snippets for a given stack frame raw text (see `retrieve_for_frames`)."""
+    return retrieve_for_frames(index_path, [frame_raw], top_k=top_k, mode=mode)[0]
@@ -0,0 +1,241 @@
+"""FastAPI app served by `pr-analyzer serve` (kept out of `cli` so the CLI starts without the web stack)."""
+import asyncio
+import json
+import os
+from typing import Literal, Optional
+
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, conlist
+
+from .analyzer import analyze_stack_trace_async, analyze_stack_trace_stream_async, analyze_stack_traces_async, get_result_cache, get_singleflight
+from .singleflight import CoalesceTimeout
+from . import llm, metrics
+from .indexer import IndexWatcher, close_index, index_version, open_index, reload_index, shard_paths
+from .llm_cache import get_llm_cache
+from .llm_transport import transport_stats
+from .jobs import JobQueue, JobStore, QueueClosed, QueueFull
+from .workers import PoolClosed, PoolSaturated, WorkerPool
+
+app = FastAPI()
+
+# traces accepted by one /analyze/batch call
+MAX_BATCH = 256
+
+class AnalyzeRequest(BaseModel):
+    stack_trace: str
+
+class BatchAnalyzeRequest(BaseModel):
+    stack_traces: conlist(str, min_items=1, max_items=MAX_BATCH)
+
+class JobRequest(BaseModel):
+    stack_trace: str
+    # "diagnose": full diagnose_trace pipeline on the served repo; "analyze": same as POST /analyze
+    kind: Literal["diagnose", "analyze"] = "diagnose"
+    since_days: int = 30
+    use_llm: bool = False
+
+
+def _reload_interval() -> float:
+    """Seconds between checks of the index files for a rebuild (PR_ANALYZER_RELOAD_INTERVAL, default 5; 0 disables)."""
+    interval = getattr(app.state, "reload_interval", None)
+    return float(os.getenv("PR_ANALYZER_RELOAD_INTERVAL", "5")) if interval is None else interval
+
+
+def _warm(index_path: str, reload_interval: float = 0) -> Optional[IndexWatcher]:
+    # load model, FAISS index and metadata once so the first request doesn't pay for it
+    if not (os.path.exists(index_path) or shard_paths(index_path)):
+        return None
+    open_index(index_path)
+    # swap in rebuilt indexes from a background thread instead of reloading on the request path
+    return IndexWatcher(index_path, interval=reload_interval).start() if reload_interval > 0 else None
+
+
+@app.on_event("startup")
+def warm_index():
+    index_path = getattr(app.state, "index_path", "./index.faiss")
+    interval = _reload_interval()
+    app.state.watcher = _warm(index_path, interval)
+    pool = getattr(app.state, "pool", None) or WorkerPool()
+    if pool.kind == "process":
+        # worker processes have their own index registry, so each one warms up (and watches the index) too
+        pool.start(initializer=_warm, initargs=(index_path, interval))
+    else:
+        pool.start()
+    app.state.pool = pool
+    jobs = getattr(app.state, "jobs", None) or JobQueue(JobStore())
+    jobs.start()
+    app.state.jobs = jobs
+
+
+@app.on_event("shutdown")
+async def release_index():
+    pool = getattr(app.state, "pool", None)
+    if pool is not None:
+        pool.close()
+    jobs = getattr(app.state, "jobs", None)
+    if jobs is not None:
+        # unfinished jobs stay in the store and run again on the next start
+        jobs.close()
+        app.state.jobs = None
+    watcher = getattr(app.state, "watcher", None)
+    if watcher is not None:
+        watcher.stop()
+        app.state.watcher = None
+    close_index()
+    await llm.aclose()
+    llm.close()
+
+
+@app.exception_handler(PoolSaturated)
+@app.exception_handler(QueueFull)
+async def saturated(request: Request, exc: Exception):
+    return JSONResponse(status_code=429, content={"detail": f"server busy: {exc}"}, headers={"Retry-After": "1"})
+
+
+@app.exception_handler(PoolClosed)
+@app.exception_handler(QueueClosed)
+async def unavailable(request: Request, exc: Exception):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "5"})
+
+
+@app.get("/stats")
+def stats():
+    pool = getattr(app.state, "pool", None)
+    watcher = getattr(app.state, "watcher", None)
+    llm_cache = get_llm_cache()
+    return {
+        "result_cache": get_result_cache().stats(),
+        "coalescing": get_singleflight().stats(),
+        "pool": pool.stats() if pool is not None else None,
+        "index": watcher.stats() if watcher is not None else None,
+        "jobs": app.state.jobs.stats() if getattr(app.state, "jobs", None) is not None else None,
+        "llm_cache": llm_cache.stats() if llm_cache is not None else None,
+        "llm_transport": transport_stats(),
+    }
+
+
+@app.post("/admin/reload")
+async def admin_reload(authorization: Optional[str] = Header(None)):
+    """Load the index from disk now and swap it in; requests keep being served by the old version meanwhile.
+
+    Requires `Authorization: Bearer <PR_ANALYZER_ADMIN_TOKEN>` when that variable is set.
+    """
+    token = os.getenv("PR_ANALYZER_ADMIN_TOKEN")
+    if token and authorization != f"Bearer {token}":
+        raise HTTPException(status_code=403, detail="admin token required")
+    index_path = getattr(app.state, "index_path", "./index.faiss")
+    if not (os.path.exists(index_path) or shard_paths(index_path)):
+        raise HTTPException(status_code=404, detail=f"no index at {index_path}")
+    # loading reads the whole index; keep it off the event loop and out of the analysis pool
+    reloaded = await asyncio.get_running_loop().run_in_executor(None, reload_index, index_path)
+    return {"reloaded": reloaded, "version": index_version(index_path)}
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Per-stage latency histograms and counters in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.exception_handler(CoalesceTimeout)
+async def coalesce_timeout(request: Request, exc: CoalesceTimeout):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+
+def _pool() -> WorkerPool:
+    pool = getattr(app.state, "pool", None)
+    if pool is None:
+        raise PoolClosed("worker pool is not running")
+    return pool
+
+
+@app.post("/analyze")
+async def analyze(req: AnalyzeRequest):
+    index_path = getattr(app.state, "index_path", "./index.faiss")
+    pool = _pool()
+    # duplicates of a cached crash skip the pool; otherwise retrieval runs on the pool and the LLM call is
+    # awaited, so slow requests don't stall the loop
+    with metrics.REQUEST_SECONDS.time("analyze"):
+        return await analyze_stack_trace_async(req.stack_trace, index_path, top_k=3, admit=pool.slot)
+
+
+async def _ndjson_in_slot(pool: WorkerPool, lines) -> StreamingResponse:
+    """NDJSON response of `lines(executor)` (an async iterator of dicts) holding one pool slot until it ends."""
+    # admit before streaming starts so saturation is still a 429
+    slot = pool.slot()
+    executor = await slot.__aenter__()
+    released = False
+
+    async def release():
+        nonlocal released
+        if not released:
+            released = True
+            await slot.__aexit__(None, None, None)
+
+    async def stream():
+        try:
+            async for line in lines(executor):
+                yield json.dumps(line, default=str) + "\n"
+        finally:
+            await release()
+
+    # the stream's own finally never runs if the client disconnects before the body is iterated;
+    # the background task runs after the response either way
+    return StreamingResponse(stream(), media_type="application/x-ndjson", background=BackgroundTask(release))
+
+
+@app.post("/analyze/batch")
+async def analyze_batch(req: BatchAnalyzeRequest):
+    """Stream one NDJSON line per trace, {"index": position in the request, **analyze result}, in completion order."""
+    index_path = getattr(app.state, "index_path", "./index.faiss")
+    pool = _pool()
+
+    async def lines(executor):
+        async for n, result in analyze_stack_traces_async(req.stack_traces, index_path, top_k=3, executor=executor, concurrency=pool.max_concurrency):
+            yield {"index": n, **result}
+
+    # a batch takes one slot
+    return await _ndjson_in_slot(pool, lines)
+
+
+@app.post("/analyze/stream")
+async def analyze_stream(req: AnalyzeRequest):
+    """Stream the analysis as NDJSON: {"field", "value"} for each field of the LLM's reply as soon as it is
+    complete (classification and confidence first), then {"result": <what /analyze returns>}."""
+    index_path = getattr(app.state, "index_path", "./index.faiss")
+
+    def lines(executor):
+        return analyze_stack_trace_stream_async(req.stack_trace, index_path, top_k=3, executor=executor)
+
+    return await _ndjson_in_slot(_pool(), lines)
+
+
+def _jobs() -> JobQueue:
+    jobs = getattr(app.state, "jobs", None)
+    if jobs is None:
+        raise QueueClosed("job queue is not running")
+    return jobs
+
+
+@app.post("/jobs", status_code=202)
+def submit_job(req: JobRequest):
+    """Queue a diagnosis and return its id right away; poll GET /jobs/{id} for the result."""
+    params = {"stack_trace": req.stack_trace, "index_path": os.path.abspath(getattr(app.state, "index_path", "./index.faiss"))}
+    if req.kind == "diagnose":
+        repo = getattr(app.state, "repo_path", None) or os.getenv("PR_ANALYZER_REPO")
+        if not repo:
+            raise HTTPException(status_code=400, detail="diagnose jobs need the server's repository (serve --repo or PR_ANALYZER_REPO)")
+        params.update(repo=os.path.abspath(repo), since_days=req.since_days, use_llm=req.use_llm)
+    job_id = _jobs().submit(req.kind, params)
+    return JSONResponse(status_code=202, content={"id": job_id, "status": "queued"}, headers={"Location": f"/jobs/{job_id}"})
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Status ("queued", "running", "done" or "failed") of a job, with its result or error once finished."""
+    job = _jobs().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"no job {job_id}")
+    return job
@@ -0,0 +1,45 @@
+"""Coalescing of concurrent identical work on an asyncio event loop.
+
+The first caller for a key (the leader) starts the work; callers arriving with the same key while it
+runs (followers) await the same task instead of starting their own. The task is shielded, so a leader
+whose client disconnects does not cancel the work the followers are waiting on.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class CoalesceTimeout(Exception):
+    """A follower gave up waiting for the shared result."""
+
+
+class SingleFlight:
+    def __init__(self, wait_timeout: Optional[float] = None):
+        # how long followers wait for the leader's result (None: as long as it takes)
+        self.wait_timeout = wait_timeout
+        self.leaders = 0
+        self.followers = 0
+        self.timeouts = 0
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._calls.pop(key, None) if self._calls.get(key) is t else None)
+            return await asyncio.shield(task)
+        self.followers += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.wait_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise CoalesceTimeout(f"no result for a coalesced request within {self.wait_timeout}s")
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        return {"leaders": self.leaders, "followers": self.followers, "timeouts": self.timeouts, "in_flight": len(self._calls)}
@@ -0,0 +1,84 @@
+"""Bounded worker pool for the API server.
+
+Blocking work (retrieval, model inference) runs on a thread or process pool instead of the event loop.
+At most `max_concurrency` requests are in flight and at most `queue_depth` more wait for a slot; anything
+beyond that is rejected right away (`PoolSaturated`, HTTP 429) rather than queued without limit.
+
+Environment variables (constructor arguments take precedence):
+- PR_ANALYZER_WORKERS: executor size (default: CPU count + 4, at most 32)
+- PR_ANALYZER_WORKER_KIND: "thread" (default) or "process"
+- PR_ANALYZER_MAX_CONCURRENCY: requests in flight (default: the worker count)
+- PR_ANALYZER_QUEUE_DEPTH: requests waiting for a slot before new ones are rejected (default 64)
+"""
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+
+WORKER_KINDS = ("thread", "process")
+
+
+class PoolSaturated(Exception):
+    """Every slot is busy and the wait queue is full."""
+
+
+class PoolClosed(Exception):
+    """The pool is not running (not started yet, or shutting down)."""
+
+
+class WorkerPool:
+    def __init__(self, workers: Optional[int] = None, kind: Optional[str] = None, max_concurrency: Optional[int] = None, queue_depth: Optional[int] = None):
+        self.workers = workers or int(os.getenv("PR_ANALYZER_WORKERS", "0")) or min(32, (os.cpu_count() or 1) + 4)
+        self.kind = kind or os.getenv("PR_ANALYZER_WORKER_KIND", "thread")
+        if self.kind not in WORKER_KINDS:
+            raise ValueError(f"unknown worker kind {self.kind!r}; expected one of {WORKER_KINDS}")
+        self.max_concurrency = max_concurrency or int(os.getenv("PR_ANALYZER_MAX_CONCURRENCY", "0")) or self.workers
+        self.queue_depth = queue_depth if queue_depth is not None else int(os.getenv("PR_ANALYZER_QUEUE_DEPTH", "64"))
+        self.executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        # admission bookkeeping only happens on the event loop thread, so plain counters are enough
+        self._admitted = 0
+        self.rejected = 0
+
+    def start(self, initializer: Optional[Callable] = None, initargs: Tuple = ()):
+        """Create the executor; `initializer` runs once in every worker (e.g. to load the index in a process)."""
+        if self.kind == "process":
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=initializer, initargs=initargs)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="analyze", initializer=initializer, initargs=initargs)
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    def close(self):
+        executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[Executor]:
+        """Admit one request: wait for a free slot (or raise when the queue is full) and yield the executor."""
+        if self.executor is None:
+            raise PoolClosed("worker pool is not running")
+        if self._admitted >= self.max_concurrency + self.queue_depth:
+            self.rejected += 1
+            raise PoolSaturated(f"{self.max_concurrency} requests in flight and {self.queue_depth} queued")
+        self._admitted += 1
+        try:
+            async with self._slots:
+                if self.executor is None:
+                    raise PoolClosed("worker pool is shutting down")
+                yield self.executor
+        finally:
+            self._admitted -= 1
+
+    def stats(self) -> Dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.queue_depth,
+            "in_flight": min(self._admitted, self.max_concurrency),
+            "queued": max(0, self._admitted - self.max_concurrency),
+            "rejected": self.rejected,
+        }
@@ -1,7 +1,7 @@
 """Symbol-to-file mapping helpers.
 
 Tries multiple strategies in order:
- - Use a local index metadata file (e.g., demo_index.meta or demo_index.json) if present to map symbols to files.
+ - Use a local index metadata store (e.g., demo_index.meta.db) or legacy metadata file (demo_index.meta / demo_index.json) if present to map symbols to files.
  - Use a ctags 'tags' file in the repo root if present.
  - Otherwise return an empty list so the caller can fallback to content-based search.
 
@@ -11,11 +11,22 @@ from __future__ import annotations
 
 import json
 import os
+import sqlite3
+from contextlib import closing
 from pathlib import Path
 from typing import List, Optional
 
 
 def _load_index_meta(index_dir: Path) -> Optional[List[dict]]:
+    # metadata stores written by pr_analyzer.indexer: only the distinct live paths are needed
+    for name in ['demo_index.meta.db', 'index.meta.db', 'index.faiss.meta.db']:
+        p = index_dir / name
+        if p.exists():
+            try:
+                with closing(sqlite3.connect(f'file:{p}?mode=ro', uri=True)) as db:
+                    return [{'path': r[0]} for r in db.execute('SELECT DISTINCT path FROM chunks WHERE live = 1')]
+            except Exception:
+                continue
     # try common filenames
     candidates = ['demo_index.meta', 'demo_index.json', 'index.meta', 'index.json']
     for name in candidates:
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# keep the shared on-disk caches out of the developer's home directory
+os.environ.setdefault("PR_ANALYZER_CACHE_DIR", tempfile.mkdtemp(prefix="pr_analyzer_cache_"))
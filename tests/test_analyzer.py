@@ -24,3 +24,46 @@ def test_analyzer_monkeypatch(monkeypatch, tmp_path):
     res = analyze_stack_trace('  File "a.py", line 1, in foo', str(index), top_k=1)
     assert res["analysis"]["classification"] == "code"
     assert res["analysis"]["confidence"] == 0.9
+
+
+def test_batch_shares_retrieval_and_streams_in_completion_order(monkeypatch, tmp_path):
+    import asyncio
+    from pr_analyzer import analyzer
+    from pr_analyzer.indexer import build_index
+
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "a.py").write_text("def foo():\n    raise ValueError('oops')\n\ndef bar():\n    return foo()\n")
+    index = tmp_path / "idx"
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    build_index(str(repo), str(index))
+
+    calls = []
+    real_retrieve = analyzer.retrieve_for_frames
+    monkeypatch.setattr(analyzer, "retrieve_for_frames", lambda *a, **kw: calls.append(a[1]) or real_retrieve(*a, **kw))
+
+    async def scenario():
+        slow = asyncio.Event()
+
+        async def fake_ask(prompt, temperature=0.0):
+            # the first trace's reply only arrives after the second one was streamed
+            if "in foo" in prompt:
+                await slow.wait()
+            return '{"classification":"code"}'
+
+        monkeypatch.setattr("pr_analyzer.llm.ask_llm_async", fake_ask)
+        traces = ['  File "a.py", line 2, in foo', '  File "a.py", line 5, in bar', "not a trace"]
+        order = []
+        async for n, result in analyzer.analyze_stack_traces_async(traces, str(index), top_k=1):
+            order.append((n, result))
+            if n == 1:
+                slow.set()
+        return order
+
+    order = asyncio.run(scenario())
+    assert len(calls) == 1 and len(calls[0]) == 2
+    assert [n for n, _ in order][-1] == 0
+    results = dict(order)
+    assert results[2] == {"error": "no frames parsed"}
+    assert results[0]["analysis"]["classification"] == "code"
+    assert results[1]["frame"]["func"] == "bar"
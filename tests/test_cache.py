@@ -0,0 +1,36 @@
+import os
+import shutil
+
+import faiss
+
+from pr_analyzer.cache import DiskLRUCache
+
+
+def test_disk_lru_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskLRUCache(str(tmp_path / "c.sqlite"), max_bytes=300)
+    cache.put_many({"a": b"x" * 100, "b": b"x" * 100})
+    assert cache.get("a") == b"x" * 100  # touch a so b is the oldest
+    cache.put("c", b"x" * 150)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["misses"] == 1
+
+
+def test_new_branch_is_indexed_from_embedding_cache(tmp_path, monkeypatch):
+    from pr_analyzer import indexer
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    repo = tmp_path / "main"
+    repo.mkdir()
+    (repo / "a.py").write_text("def a():\n    return 1\n")
+    (repo / "b.py").write_text("def b():\n    return 2\n")
+    indexer.build_index(str(repo), str(tmp_path / "main.index"))
+
+    branch = tmp_path / "branch"
+    shutil.copytree(repo, branch)
+
+    def no_model(*args, **kwargs):
+        raise AssertionError("model should not be called for cached chunks")
+
+    monkeypatch.setattr(indexer, "get_provider", no_model)
+    indexer.build_index(str(branch), str(tmp_path / "branch.index"))
+    assert faiss.read_index(str(tmp_path / "branch.index")).ntotal == 2
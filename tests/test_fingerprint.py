@@ -0,0 +1,72 @@
+import os
+
+from pr_analyzer.cache import TTLCache
+from pr_analyzer.fingerprint import fingerprint, signature
+from pr_analyzer.parser import parse_stack_trace
+
+
+def test_signature_ignores_build_paths_lines_and_generic_arity():
+    a = parse_stack_trace("   at Contoso.Data.Repo`1.Load(String id) in F:\\dbs\\sh\\5uj5\\0401_102801\\src\\Repo.cs:line 42")
+    b = parse_stack_trace("   at Contoso.Data.Repo`2.Load(String id) in /home/vsts/work/1/s/src/Repo.cs:line 57")
+    c = parse_stack_trace("   at Contoso.Data.Repo`1.Save(String id) in F:\\dbs\\sh\\5uj5\\0401_102801\\src\\Repo.cs:line 42")
+    assert fingerprint(a) == fingerprint(b) != fingerprint(c)
+    generic = parse_stack_trace("   at Contoso.Cache<TKey, TValue>.Get(TKey key) in C:\\b\\Cache.cs:line 3")
+    assert signature(generic) == "csharp|cache.cs|Cache.Get(TKey key)"
+
+
+def test_ttl_cache_expires_and_evicts_lru(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("pr_analyzer.cache.time.monotonic", lambda: now[0])
+    cache = TTLCache(max_entries=2, ttl=10)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # b is now least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("c") == 3
+    now[0] += 11
+    assert cache.get("a") is None
+    assert cache.stats() == {"hits": 2, "misses": 2, "expired": 1, "entries": 1, "max_entries": 2}
+
+
+def test_duplicate_crash_is_served_from_result_cache(monkeypatch, tmp_path):
+    from pr_analyzer.analyzer import analyze_stack_trace, get_result_cache
+    from pr_analyzer.indexer import build_index
+
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "a.py").write_text("def foo():\n    raise ValueError('oops')\n")
+    build_index(str(repo), str(tmp_path / "idx"))
+    calls = []
+    monkeypatch.setattr("pr_analyzer.llm.ask_llm", lambda prompt, temperature=0.0: calls.append(prompt) or '{"classification":"code"}')
+
+    before = get_result_cache().stats()["hits"]
+    first = analyze_stack_trace('  File "/build/1/a.py", line 2, in foo', str(tmp_path / "idx"), top_k=1)
+    again = analyze_stack_trace('  File "/build/2/a.py", line 9, in foo', str(tmp_path / "idx"), top_k=1)
+    assert len(calls) == 1
+    assert again["analysis"] == first["analysis"] and again["frame"]["line"] == 9
+    assert get_result_cache().stats()["hits"] == before + 1
+
+
+def test_rebuilding_the_index_invalidates_cached_results(monkeypatch, tmp_path):
+    from pr_analyzer.analyzer import analyze_stack_trace
+    from pr_analyzer.indexer import build_index, index_version
+
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "a.py").write_text("def foo():\n    raise ValueError('oops')\n")
+    idx = str(tmp_path / "idx")
+    build_index(str(repo), idx)
+    calls = []
+    monkeypatch.setattr("pr_analyzer.llm.ask_llm", lambda prompt, temperature=0.0: calls.append(prompt) or '{"classification":"code"}')
+
+    trace = '  File "a.py", line 2, in foo'
+    analyze_stack_trace(trace, idx, top_k=1)
+    version = index_version(idx)
+    (repo / "a.py").write_text("def foo():\n    raise KeyError('fixed differently')\n")
+    build_index(str(repo), idx, rebuild=True)
+    assert index_version(idx) != version
+    analyze_stack_trace(trace, idx, top_k=1)
+    assert len(calls) == 2
+    assert "KeyError" in calls[1]
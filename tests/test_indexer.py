@@ -14,3 +14,281 @@ def test_index_and_search(tmp_path):
     build_index(str(repo), str(index_path))
     results = search_index(str(index_path), "foo", top_k=2)
     assert isinstance(results, list)
+
+
+def test_open_index_reuses_handle_until_rebuild(tmp_path):
+    import os
+    from pr_analyzer.indexer import open_index, close_index
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "a.py").write_text("def foo():\n    return 1\n")
+    index_path = str(tmp_path / "test.index")
+    build_index(str(repo), index_path)
+    h1 = open_index(index_path)
+    assert open_index(index_path) is h1
+    # a rebuild changes the files on disk, so the next open reloads
+    (repo / "b.py").write_text("def bar():\n    return 2\n")
+    build_index(str(repo), index_path)
+    h2 = open_index(index_path)
+    assert h2 is not h1
+    assert len(h2.metas) == 2
+    close_index(index_path)
+    assert open_index(index_path) is not h2
+
+
+def test_search_returns_indexed_text_from_chunk_store(tmp_path):
+    import os
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    f = repo / "a.py"
+    f.write_text("def foo():\n    return 1\n")
+    index_path = str(tmp_path / "test.index")
+    build_index(str(repo), index_path)
+    # snippets come from the store, not from the (since modified) source file
+    f.write_text("changed after indexing\n")
+    results = search_index(index_path, "foo", top_k=1)
+    assert results[0]["snippet"] == "def foo():\n    return 1\n"
+
+
+def test_parallel_ingestion_matches_serial(tmp_path):
+    import os
+    import numpy as np
+    from pr_analyzer import indexer
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    for i in range(40):
+        (repo / f"m{i}.py").write_text(f"def f{i}():\n    return {i}\n" * (i + 1))
+    serial, parallel = str(tmp_path / "serial.index"), str(tmp_path / "parallel.index")
+    build_index(str(repo), serial, chunk_size=64)
+    build_index(str(repo), parallel, chunk_size=64, jobs=2)
+    a, b = indexer.open_index(serial), indexer.open_index(parallel)
+    assert list(a.metas.iter_chunks()) == list(b.metas.iter_chunks())
+    assert [a.snippet(i) for i in range(len(a.metas))] == [b.snippet(i) for i in range(len(b.metas))]
+    assert np.array_equal(a.index.reconstruct_n(0, a.index.ntotal), b.index.reconstruct_n(0, b.index.ntotal))
+
+
+def test_incremental_reindex_updates_and_deletes(tmp_path):
+    import os
+    import faiss
+    from pr_analyzer.indexer import open_index
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "a.py").write_text("def a():\n    return 1\n")
+    (repo / "b.py").write_text("def b():\n    return 2\n")
+    (repo / "c.py").write_text("def c():\n    return 3\n")
+    index_path = str(tmp_path / "test.index")
+    build_index(str(repo), index_path)
+    assert open_index(index_path).index.ntotal == 3
+
+    (repo / "a.py").write_text("def a():\n    return 10\n")
+    (repo / "b.py").unlink()
+    # touched but identical content keeps its vector
+    st = os.stat(repo / "c.py")
+    os.utime(repo / "c.py", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    build_index(str(repo), index_path)
+
+    h = open_index(index_path)
+    assert h.index.ntotal == 2
+    live = {h.snippet(i) for i in faiss.vector_to_array(h.index.id_map).tolist()}
+    assert live == {"def a():\n    return 10\n", "def c():\n    return 3\n"}
+    # only the changed chunk was appended
+    assert len(h.metas) == 4
+
+
+def test_ann_index_types_and_benchmark(tmp_path):
+    import os
+    from pr_analyzer import ann
+    from pr_analyzer.indexer import benchmark_index, open_index
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    for i in range(30):
+        (repo / f"m{i}.py").write_text("".join(f"def f{i}_{j}(): return {j}\n" for j in range(10)))
+    index_path = str(tmp_path / "test.index")
+    build_index(str(repo), index_path, chunk_size=64, index_type="ivf")
+    params = ann.load_params(index_path)
+    assert params["index_type"] == "ivf" and params["nprobe"] >= 1
+    h = open_index(index_path)
+    assert len(h.search("def f1_2", top_k=3)) == 3
+    rows = benchmark_index(index_path, n_queries=20, top_k=5)
+    assert rows and all(0.0 <= r["recall"] <= 1.0 for r in rows)
+    # switching type re-uses the stored vectors
+    ntotal, n_metas = h.index.ntotal, len(h.metas)
+    build_index(str(repo), index_path, chunk_size=64, index_type="hnsw")
+    h2 = open_index(index_path)
+    assert ann.load_params(index_path)["index_type"] == "hnsw"
+    assert h2.index.ntotal == ntotal and len(h2.metas) == n_metas
+
+
+def test_legacy_json_meta_is_migrated(tmp_path):
+    import json
+    import os
+    from pr_analyzer.indexer import open_index
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "a.py").write_text("def foo():\n    return 1\n")
+    index_path = str(tmp_path / "test.index")
+    build_index(str(repo), index_path)
+    # turn the index back into the original layout: a JSON list whose position is the vector id, rows without
+    # a chunk size, and no chunk store, lexical index or params file
+    h = open_index(index_path)
+    legacy = [{"path": m["path"], "chunk_index": m["chunk_index"], "hash": m["hash"]} for _, m in h.metas.iter_chunks(live_only=False)]
+    h.close()
+    for ext in (".meta.db", ".chunks", ".offsets", ".lex.db", ".params.json"):
+        os.remove(index_path + ext)
+    with open(index_path + ".meta", "w") as fh:
+        json.dump(legacy, fh)
+    results = search_index(index_path, "foo", top_k=1)
+    assert results[0]["path"] == legacy[0]["path"]
+    assert results[0]["snippet"].startswith("def foo():")
+    assert os.path.exists(index_path + ".meta.db")
+
+
+def test_search_many_matches_single_queries(tmp_path):
+    import os
+    from pr_analyzer.indexer import search_many
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    for i in range(5):
+        (repo / f"m{i}.py").write_text(f"def f{i}():\n    return {i}\n")
+    index_path = str(tmp_path / "test.index")
+    build_index(str(repo), index_path)
+    queries = ["f1", "f3", "f1"]
+    batched = search_many(index_path, queries, top_k=2)
+    assert [[r["path"] for r in rs] for rs in batched] == [[r["path"] for r in search_index(index_path, q, top_k=2)] for q in queries]
+    # the same chunk returned for two queries shares one snippet read
+    assert batched[0][0]["snippet"] is batched[2][0]["snippet"]
+
+
+def test_quantized_storage_without_raw_vectors(tmp_path):
+    import os
+    from pr_analyzer import ann
+    from pr_analyzer.indexer import benchmark_index, open_index
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    for i in range(30):
+        (repo / f"m{i}.py").write_text("".join(f"def f{i}_{j}(): return {j}\n" for j in range(10)))
+    index_path = str(tmp_path / "test.index")
+    build_index(str(repo), index_path, chunk_size=64, storage="int8", keep_vectors=False)
+    assert ann.load_params(index_path)["factory"] == "SQ8"
+    assert not os.path.exists(index_path + ".vecs")
+    assert len(open_index(index_path).search("def f1_2", top_k=3)) == 3
+    # later runs keep the storage choice; a changed file is added without a raw copy
+    (repo / "m0.py").write_text("def changed(): pass\n")
+    build_index(str(repo), index_path, chunk_size=64)
+    assert ann.load_params(index_path)["storage"] == "int8"
+    assert not os.path.exists(index_path + ".vecs")
+    rows = benchmark_index(index_path, n_queries=20, top_k=5, compare_storage=True)
+    assert [r["storage"] for r in rows][:4] == ["exact", "float32", "float16", "int8"]
+    assert all(0.0 <= r["recall"] <= 1.0 for r in rows)
+
+
+def test_sharded_index_merges_shards_and_rebuilds_one(tmp_path):
+    import os
+    from pr_analyzer.indexer import open_index, close_index, search_many, shard_paths
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    repo = tmp_path / "repo"
+    (repo / "api").mkdir(parents=True)
+    (repo / "core").mkdir()
+    (repo / "api" / "routes.py").write_text("def handle_request():\n    return 1\n")
+    (repo / "core" / "engine.py").write_text("def run_engine():\n    return 2\n")
+    (repo / "setup.py").write_text("def setup():\n    pass\n")
+    flat_path = str(tmp_path / "flat.index")
+    sharded_path = str(tmp_path / "sharded.index")
+    build_index(str(repo), flat_path)
+    build_index(str(repo), sharded_path, shard_by="dir")
+    assert [os.path.basename(p) for p in shard_paths(sharded_path)] == ["_root.faiss", "api.faiss", "core.faiss"]
+
+    # fan-out search with a merged top-k finds the same chunks as one unsharded index
+    queries = ["handle_request", "run_engine"]
+    flat = search_many(flat_path, queries, top_k=3)
+    sharded = search_many(sharded_path, queries, top_k=3)
+    assert [[r["snippet"] for r in rs] for rs in sharded] == [[r["snippet"] for r in rs] for rs in flat]
+
+    # rebuilding one shard leaves the others' handles loaded
+    handle = open_index(sharded_path)
+    api, core = handle.shards[1], handle.shards[2]
+    (repo / "core" / "engine.py").write_text("def run_engine_v2():\n    return 3\n")
+    build_index(str(repo), sharded_path, shards=["core"], rebuild=True)
+    reloaded = open_index(sharded_path)
+    assert reloaded is not handle
+    assert reloaded.shards[1] is api and reloaded.shards[2] is not core
+    assert any("run_engine_v2" in r["snippet"] for r in reloaded.search("run_engine_v2", top_k=3))
+    close_index()
+
+
+def test_replaced_handle_is_closed_after_its_last_user(tmp_path):
+    import os
+    from pr_analyzer.indexer import open_index, index_handle, close_index
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "a.py").write_text("def foo():\n    return 1\n")
+    index_path = str(tmp_path / "test.index")
+    build_index(str(repo), index_path)
+    with index_handle(index_path) as old:
+        (repo / "b.py").write_text("def bar():\n    return 2\n")
+        build_index(str(repo), index_path)
+        new = open_index(index_path)
+        # still in use by this block: the reload must not pull its files away
+        assert new is not old and old.metas is not None
+        assert old.search("foo", top_k=1)
+    assert old.metas is None and old.chunks is None
+    # a handle nobody is using is closed as soon as it is replaced
+    (repo / "c.py").write_text("def baz():\n    return 3\n")
+    build_index(str(repo), index_path)
+    assert open_index(index_path) is not new and new.metas is None
+    close_index()
+
+
+def test_parallel_ingestion_stops_when_consumer_stops(tmp_path):
+    import threading
+    from pr_analyzer.indexer import _iter_chunk_batches
+    files = []
+    for i in range(200):
+        p = tmp_path / f"m{i}.py"
+        p.write_text(f"def f{i}():\n    return {i}\n")
+        files.append(str(p))
+    batches = _iter_chunk_batches(files, 1024, jobs=2, batch_size=1)
+    next(batches)
+    batches.close()
+    assert not any(t.name == "pr-analyzer-ingest" and t.is_alive() for t in threading.enumerate())
+
+
+def test_watcher_swaps_in_a_rebuilt_index_in_the_background(tmp_path):
+    import time
+    from pr_analyzer.indexer import IndexWatcher, close_index, index_handle, open_index
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "a.py").write_text("def foo():\n    return 1\n")
+    index_path = str(tmp_path / "test.index")
+    build_index(str(repo), index_path)
+    old = open_index(index_path)
+    watcher = IndexWatcher(index_path, interval=0.02).start()
+    try:
+        with index_handle(index_path) as in_flight:
+            (repo / "b.py").write_text("def bar():\n    return 2\n")
+            build_index(str(repo), index_path)
+            # requests keep the resident handle instead of reloading it themselves
+            assert open_index(index_path) is old
+            for _ in range(250):
+                if open_index(index_path) is not old:
+                    break
+                time.sleep(0.02)
+            new = open_index(index_path)
+            assert new is not old and len(new.metas) == 2
+            # the request that started on the old version finishes on it
+            assert in_flight is old and old.search("foo", top_k=1)
+        assert old.metas is None
+        assert watcher.stats()["reloads"] == 1 and watcher.stats()["errors"] == 0
+    finally:
+        watcher.stop()
+        close_index()
@@ -0,0 +1,80 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from pr_analyzer.jobs import JobQueue, JobStore, QueueFull
+
+
+def _wait(queue, job_id, status="done"):
+    for _ in range(500):
+        job = queue.get(job_id)
+        if job["status"] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} is {job['status']}, not {status}")
+
+
+def test_jobs_survive_a_restart(tmp_path):
+    db = str(tmp_path / "jobs.sqlite")
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow(params):
+        started.set()
+        release.wait(5)
+        return {"echo": params["x"]}
+
+    first = JobQueue(JobStore(db), workers=1, max_queued=1, runners={"slow": slow})
+    first.start()
+    running = first.submit("slow", {"x": 1})
+    started.wait(5)
+    queued = first.submit("slow", {"x": 2})
+    # one job waits already: a second waiting job is rejected
+    with pytest.raises(QueueFull):
+        first.submit("slow", {"x": 3})
+    # shutting down with a job still running and one queued
+    first.close(timeout=0)
+    assert first.get(running)["status"] == "running" and first.get(queued)["status"] == "queued"
+    release.set()
+
+    again = JobQueue(JobStore(db), workers=2, runners={"slow": lambda p: {"echo": p["x"]}})
+    again.start()
+    try:
+        assert _wait(again, running)["result"] == {"echo": 1}
+        assert _wait(again, queued)["result"] == {"echo": 2}
+        assert again.get("missing") is None
+    finally:
+        again.close()
+
+
+def test_failed_job_records_its_error(tmp_path):
+    def broken(params):
+        raise ValueError("bad trace")
+
+    queue = JobQueue(JobStore(str(tmp_path / "jobs.sqlite")), workers=1, runners={"broken": broken})
+    queue.start()
+    try:
+        job = _wait(queue, queue.submit("broken", {}), status="failed")
+        assert job["error"] == "ValueError: bad trace" and job["result"] is None
+        assert queue.stats()["failed"] == 1
+    finally:
+        queue.close()
+
+
+def test_diagnose_job_runs_the_pipeline(tmp_path):
+    # diagnose_trace lives at the top of the checkout, like the server's working directory
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "File.cs").write_text("\n".join(f"// line {i + 1}" for i in range(60)))
+    queue = JobQueue(JobStore(str(tmp_path / "jobs.sqlite")), workers=1)
+    queue.start()
+    try:
+        job_id = queue.submit("diagnose", {"stack_trace": "System.Exception: boom\n   at My.Namespace.Type.Method(File.cs:10)", "repo": str(repo), "since_days": 1})
+        report = _wait(queue, job_id)["result"]
+        assert report[0]["match"]["found"] is True
+    finally:
+        queue.close()
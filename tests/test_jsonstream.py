@@ -0,0 +1,30 @@
+import json
+
+from pr_analyzer.jsonstream import JSONObjectStream, parse_reply
+
+REPLY = {
+    "classification": "code",
+    "confidence": 0.85,
+    "explanation": 'foo() raises on "empty" input, see {config}',
+    "suggested_fix": ["check the input", "return early"],
+}
+
+
+def test_fields_are_reported_as_soon_as_they_complete():
+    text = "```json\n" + json.dumps(REPLY, indent=2) + "\n```"
+    stream = JSONObjectStream()
+    seen = []
+    for n, c in enumerate(text):
+        for name, value in stream.feed(c).items():
+            seen.append((name, value, n))
+    assert [(name, value) for name, value, _ in seen] == list(REPLY.items())
+    # classification and confidence are known before the explanation has started
+    assert seen[1][2] < text.index("explanation")
+    assert stream.done and stream.fields == REPLY
+
+
+def test_parse_reply_finds_json_inside_prose_and_falls_back_to_raw_text():
+    assert parse_reply(json.dumps(REPLY)) == REPLY
+    assert parse_reply("Here is my answer:\n```json\n" + json.dumps(REPLY) + "\n```\nHope it helps.") == REPLY
+    assert parse_reply("no idea") == {"raw_text": "no idea"}
+    assert parse_reply('{"classification": "code"') == {"raw_text": '{"classification": "code"'}
@@ -0,0 +1,159 @@
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from pr_analyzer import llm
+
+
+@pytest.fixture
+def chat_server():
+    """Local chat-completions endpoint that records the client port of every request."""
+    ports = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            ports.append(self.client_address[1])
+            body = json.dumps({"choices": [{"message": {"role": "assistant", "content": "ok"}}], "usage": {"prompt_tokens": 1, "completion_tokens": 1}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", ports
+    server.shutdown()
+    server.server_close()
+
+
+def test_sdk_client_is_shared_and_keeps_its_connection(chat_server, monkeypatch):
+    url, ports = chat_server
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("OPENAI_BASE_URL", url)
+    try:
+        assert llm._make_client() is llm._make_client()
+        assert [llm._ask_llm(f"prompt {n}", 0.0) for n in range(3)] == ["ok"] * 3
+        # three calls, one TCP connection
+        assert len(ports) == 3 and len(set(ports)) == 1
+    finally:
+        llm.close()
+    assert not llm._CLIENTS
+
+
+def test_rest_fallback_reuses_one_session(chat_server, monkeypatch):
+    url, ports = chat_server
+    monkeypatch.setattr(llm, "OPENAI_API_BASE", url)
+    monkeypatch.setattr(llm, "OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(llm, "_make_client", lambda: None)
+    try:
+        assert [llm._ask_llm(f"prompt {n}", 0.0) for n in range(3)] == ["ok"] * 3
+        assert llm._http_session() is llm._http_session()
+        assert len(ports) == 3 and len(set(ports)) == 1
+    finally:
+        llm.close()
+
+
+def test_azure_helper_reuses_its_client(chat_server, monkeypatch):
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    import llm_client
+
+    url, ports = chat_server
+    monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", url)
+    monkeypatch.setenv("AZURE_OPENAI_KEY", "test-key")
+    monkeypatch.setenv("AZURE_OPENAI_DEPLOYMENT", "dep")
+    answers = [llm_client.call_azure_openai_system_and_user("sys", f"user {n}", use_cache=False) for n in range(3)]
+    assert answers == ["ok"] * 3
+    assert len(ports) == 3 and len(set(ports)) == 1
+
+
+@pytest.fixture
+def sse_server():
+    """Local chat-completions endpoint that streams its reply as server-sent events. It holds everything
+    after the first piece until `proceed` is set, so tests can check the first piece arrives on its own."""
+    pieces = ['{"classification": "co', 'de", "confidence": 0.9, ', '"explanation": "bad input – see café"}']
+    proceed = threading.Event()
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def send_chunk(self, data: bytes):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def do_POST(self):
+            requests.append(json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0)))))
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            # an event without choices first, as Azure sends for its content filter
+            events = [{"choices": []}] + [{"choices": [{"index": 0, "delta": {"content": p}}]} for p in pieces]
+            for n, event in enumerate(events):
+                if n == 2:
+                    proceed.wait(5)
+                self.send_chunk(f"data: {json.dumps(event)}\n\n".encode())
+            self.send_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", pieces, proceed, requests
+    proceed.set()
+    server.shutdown()
+    server.server_close()
+
+
+def test_stream_yields_pieces_as_they_arrive_and_caches_the_reply(sse_server, monkeypatch):
+    url, pieces, proceed, requests = sse_server
+    monkeypatch.setattr(llm, "OPENAI_API_BASE", url)
+    monkeypatch.setattr(llm, "OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(llm, "_make_client", lambda: None)
+    try:
+        stream = llm.ask_llm_stream("streamed prompt")
+        # the rest of the reply is still held back by the server
+        assert next(stream) == pieces[0]
+        proceed.set()
+        assert list(stream) == pieces[1:]
+        assert requests[0]["stream"] is True
+        # answered from the response cache, in one piece
+        assert list(llm.ask_llm_stream("streamed prompt")) == ["".join(pieces)]
+        assert len(requests) == 1
+    finally:
+        llm.close()
+
+
+def test_sdk_and_async_streams(sse_server, monkeypatch):
+    import asyncio
+
+    url, pieces, proceed, requests = sse_server
+    proceed.set()
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("OPENAI_BASE_URL", url)
+    try:
+        assert list(llm.ask_llm_stream("sdk prompt", use_cache=False)) == pieces
+
+        async def collect():
+            try:
+                return [p async for p in llm.ask_llm_stream_async("async prompt", use_cache=False)]
+            finally:
+                await llm.aclose()
+
+        assert asyncio.run(collect()) == pieces
+        assert len(requests) == 2 and all(r["stream"] for r in requests)
+    finally:
+        llm.close()
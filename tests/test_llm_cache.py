@@ -0,0 +1,84 @@
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+from pr_analyzer import llm
+from pr_analyzer.llm_cache import LLMResponseCache, cache_key, cached_completion
+
+
+def test_identical_requests_are_answered_from_disk(tmp_path):
+    calls = []
+    cache = LLMResponseCache(str(tmp_path / "llm.sqlite"), max_bytes=1 << 20)
+
+    def call():
+        calls.append(1)
+        return "answer"
+
+    key = cache_key("sys", "user", "gpt", 0.0, 800)
+    assert cache.get(key) is None
+    cache.put(key, "answer")
+    # a new process sees what the last one stored
+    reopened = LLMResponseCache(str(tmp_path / "llm.sqlite"), max_bytes=1 << 20)
+    assert reopened.get(key) == "answer"
+    # every part of the request is in the key
+    assert len({key, cache_key("sys", "user", "gpt", 0.2, 800), cache_key("sys", "user", "gpt", 0.0, 900), cache_key("", "user", "gpt", 0.0, 800), cache_key("sys", "user", "gpt-4o", 0.0, 800)}) == 5
+    assert reopened.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    assert not calls
+
+
+def test_expired_entries_are_called_again(tmp_path, monkeypatch):
+    cache = LLMResponseCache(str(tmp_path / "llm.sqlite"), max_bytes=1 << 20, ttl=60)
+    cache.put("k", "old")
+    assert cache.get("k") == "old"
+    later = time.time() + 61
+    monkeypatch.setattr("pr_analyzer.llm_cache.time.time", lambda: later)
+    assert cache.get("k") is None
+    assert cache.stats()["expired"] == 1 and cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_ask_llm_uses_the_cache_unless_bypassed(monkeypatch, tmp_path):
+    monkeypatch.setenv("PR_ANALYZER_LLM_CACHE_DB", str(tmp_path / "llm.sqlite"))
+    monkeypatch.setattr("pr_analyzer.llm_cache._CACHE", None)
+    calls = []
+
+    def fake(prompt, temperature):
+        calls.append(prompt)
+        return f"reply {len(calls)}"
+
+    async def fake_async(prompt, temperature):
+        return fake(prompt, temperature)
+
+    monkeypatch.setattr(llm, "_ask_llm", fake)
+    monkeypatch.setattr(llm, "_ask_llm_async", fake_async)
+    assert llm.ask_llm("same prompt") == "reply 1"
+    assert llm.ask_llm("same prompt") == "reply 1"
+    # the async path shares the cache
+    assert asyncio.run(llm.ask_llm_async("same prompt")) == "reply 1"
+    assert llm.ask_llm("same prompt", temperature=0.5) == "reply 2"
+    assert llm.ask_llm("same prompt", use_cache=False) == "reply 3"
+    assert asyncio.run(llm.ask_llm_async("other prompt")) == "reply 4"
+    assert llm.ask_llm("other prompt") == "reply 4"
+    monkeypatch.setenv("PR_ANALYZER_LLM_CACHE", "0")
+    assert llm.ask_llm("same prompt") == "reply 5"
+    assert len(calls) == 5
+
+
+def test_azure_helper_caches_system_and_user_prompts(monkeypatch, tmp_path):
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    import llm_client
+
+    monkeypatch.setenv("PR_ANALYZER_LLM_CACHE_DB", str(tmp_path / "llm.sqlite"))
+    monkeypatch.setattr("pr_analyzer.llm_cache._CACHE", None)
+    for name in ("AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_KEY", "AZURE_OPENAI_DEPLOYMENT"):
+        monkeypatch.setenv(name, "x")
+    calls = []
+    monkeypatch.setattr(llm_client, "_call", lambda system, user, temperature: calls.append(user) or ("patch" if user == "fix it" else None))
+    assert llm_client.call_azure_openai_system_and_user("sys", "fix it") == "patch"
+    assert llm_client.call_azure_openai_system_and_user("sys", "fix it") == "patch"
+    assert llm_client.call_azure_openai_system_and_user("other sys", "fix it") == "patch"
+    # failed calls are not remembered
+    assert llm_client.call_azure_openai_system_and_user("sys", "fails") is None
+    assert llm_client.call_azure_openai_system_and_user("sys", "fails") is None
+    assert calls == ["fix it", "fix it", "fails", "fails"]
+    assert cached_completion("sys", "fix it", "x", 0.0, llm_client.MAX_TOKENS, lambda: "never called") == "patch"
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from pr_analyzer import llm
+from pr_analyzer.llm_transport import CircuitOpen, DeadlineExceeded, TransportError, get_transport, reset_transports
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """Local chat-completions endpoint playing a script: each request takes the next
+    {"delay": seconds, "status": code, "headers": {...}} step (then plain 200s) and is logged with its arrival time."""
+    script = []
+    log = []
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with lock:
+                step = script.pop(0) if script else {}
+                log.append(time.monotonic())
+            time.sleep(step.get("delay", 0))
+            status = step.get("status", 200)
+            body = json.dumps({"choices": [{"message": {"content": f"answer {len(log)}"}}]} if status == 200 else {"error": {"code": str(status)}}).encode()
+            try:
+                self.send_response(status)
+                for name, value in step.get("headers", {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except OSError:
+                # the client gave up on this attempt
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    # the REST path, with quick backoff so the tests don't sleep for long
+    monkeypatch.setattr(llm, "OPENAI_API_BASE", url)
+    monkeypatch.setattr(llm, "OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(llm, "_make_client", lambda: None)
+    monkeypatch.setenv("PR_ANALYZER_LLM_BACKOFF", "0.01")
+    yield url, script, log
+    server.shutdown()
+    server.server_close()
+    llm.close()
+    reset_transports()
+
+
+def test_throttled_call_is_retried_after_retry_after(fake_llm):
+    url, script, log = fake_llm
+    script += [{"status": 429, "headers": {"Retry-After": "0.3"}}, {"status": 503}]
+    assert llm.ask_llm("throttled", use_cache=False) == "answer 3"
+    assert len(log) == 3
+    # the server's Retry-After is waited out, not just the (much shorter) backoff
+    assert log[1] - log[0] >= 0.3
+    assert get_transport(url).stats()["retries"] == 2
+
+
+def test_bad_request_fails_at_once_and_deadline_bounds_slow_calls(fake_llm, monkeypatch):
+    url, script, log = fake_llm
+    script.append({"status": 400})
+    with pytest.raises(TransportError) as bad:
+        llm.ask_llm("bad", use_cache=False)
+    assert bad.value.status == 400 and len(log) == 1
+
+    monkeypatch.setenv("PR_ANALYZER_LLM_TIMEOUT", "0.2")
+    monkeypatch.setenv("PR_ANALYZER_LLM_DEADLINE", "0.5")
+    reset_transports()
+    script += [{"delay": 2}] * 5
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        llm.ask_llm("slow", use_cache=False)
+    # instead of waiting a minute for the first reply
+    assert time.monotonic() - start < 1.5
+
+
+def test_slow_attempt_is_hedged(fake_llm, monkeypatch):
+    url, script, log = fake_llm
+    monkeypatch.setenv("PR_ANALYZER_LLM_HEDGE_AFTER", "0.1")
+    script.append({"delay": 1.5})
+    start = time.monotonic()
+    assert llm.ask_llm("hedged", use_cache=False) == "answer 2"
+    assert time.monotonic() - start < 1.0
+    stats = get_transport(url).stats()
+    assert stats["hedged"] == 1 and stats["hedges_won"] == 1
+
+
+def test_circuit_opens_on_repeated_failures_and_closes_after_a_probe(fake_llm, monkeypatch):
+    url, script, log = fake_llm
+    monkeypatch.setenv("PR_ANALYZER_LLM_RETRIES", "1")
+    monkeypatch.setenv("PR_ANALYZER_LLM_BREAKER_FAILURES", "4")
+    monkeypatch.setenv("PR_ANALYZER_LLM_BREAKER_COOLDOWN", "0.3")
+    script += [{"status": 500}] * 4
+    for _ in range(2):
+        with pytest.raises(TransportError):
+            llm.ask_llm("failing", use_cache=False)
+    assert get_transport(url).stats()["circuit"]["state"] == "open"
+    # fails fast without reaching the endpoint
+    with pytest.raises(CircuitOpen):
+        llm.ask_llm("failing", use_cache=False)
+    assert len(log) == 4
+    time.sleep(0.35)
+    assert llm.ask_llm("recovered", use_cache=False) == "answer 5"
+    assert get_transport(url).stats()["circuit"] == {"state": "closed", "consecutive_failures": 0, "opened": 1}
+
+
+def test_async_calls_retry_and_hedge(fake_llm, monkeypatch):
+    url, script, log = fake_llm
+    monkeypatch.setenv("PR_ANALYZER_LLM_HEDGE_AFTER", "0.1")
+    script += [{"status": 502}, {"delay": 1.5}]
+
+    async def scenario():
+        try:
+            return await llm.ask_llm_async("async", use_cache=False)
+        finally:
+            await llm.aclose()
+
+    start = time.monotonic()
+    assert asyncio.run(scenario()) == "answer 3"
+    assert time.monotonic() - start < 1.0
+    stats = get_transport(url).stats()
+    assert stats["retries"] == 1 and stats["hedges_won"] == 1
+
+
+def test_azure_helper_raises_instead_of_returning_none(fake_llm, monkeypatch):
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    import llm_client
+
+    url, script, log = fake_llm
+    monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", url)
+    monkeypatch.setenv("AZURE_OPENAI_KEY", "test-key")
+    monkeypatch.setenv("AZURE_OPENAI_DEPLOYMENT", "dep")
+    monkeypatch.setenv("PR_ANALYZER_LLM_RETRIES", "1")
+    script += [{"status": 503, "headers": {"retry-after-ms": "50"}}, {"status": 401}]
+    with pytest.raises(TransportError) as err:
+        llm_client.call_azure_openai_system_and_user("sys", "user", use_cache=False)
+    assert err.value.status == 401 and len(log) == 2
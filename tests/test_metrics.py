@@ -0,0 +1,30 @@
+from pr_analyzer.metrics import Counter, Histogram
+
+
+def test_histogram_renders_cumulative_buckets():
+    h = Histogram("demo_seconds", "Demo.", ["stage"], buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 0.5, 3.0):
+        h.observe(v, "x")
+    lines = h.render().splitlines()
+    assert lines[:2] == ["# HELP demo_seconds Demo.", "# TYPE demo_seconds histogram"]
+    assert lines[2:] == [
+        'demo_seconds_bucket{stage="x",le="0.1"} 1',
+        'demo_seconds_bucket{stage="x",le="1"} 3',
+        'demo_seconds_bucket{stage="x",le="+Inf"} 4',
+        'demo_seconds_sum{stage="x"} 4.05',
+        'demo_seconds_count{stage="x"} 4',
+    ]
+    assert h.count("x") == 4 and h.count("y") == 0
+
+
+def test_counter_labels_are_checked_and_escaped():
+    c = Counter("demo_total", "Demo.", ["kind"])
+    c.inc('a"b', amount=2)
+    assert c.value('a"b') == 2
+    assert c.render().splitlines()[-1] == 'demo_total{kind="a\\"b"} 2'
+    try:
+        c.inc()
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("missing label accepted")
@@ -0,0 +1,65 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from pr_analyzer.openai_embed import EmbeddingRequestError, OpenAIEmbedder
+
+
+class FakeEmbeddings(BaseHTTPRequestHandler):
+    calls = []
+    fail_first = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        FakeEmbeddings.calls.append(body["input"])
+        if FakeEmbeddings.fail_first > 0:
+            FakeEmbeddings.fail_first -= 1
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+            return
+        data = [{"index": i, "embedding": [float(len(t)), 1.0]} for i, t in enumerate(body["input"])]
+        out = json.dumps({"data": list(reversed(data))}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    FakeEmbeddings.calls = []
+    FakeEmbeddings.fail_first = 0
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), FakeEmbeddings)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}/v1"
+    srv.shutdown()
+
+
+def test_batches_retries_and_order(server):
+    FakeEmbeddings.fail_first = 2
+    emb = OpenAIEmbedder("m", api_base=server, api_key="k", batch_size=3, concurrency=2, backoff=0.01)
+    texts = ["a" * n for n in range(1, 8)]
+    out = emb.embed(texts)
+    assert out[:, 0].tolist() == [float(n) for n in range(1, 8)]
+    # 3 batches plus the two throttled attempts
+    assert len(FakeEmbeddings.calls) == 5
+
+
+def test_checkpoint_resumes_without_refetching(server, tmp_path):
+    emb = OpenAIEmbedder("m", api_base=server, api_key="k", batch_size=2, concurrency=1, backoff=0.01, max_retries=0)
+    texts = ["x", "yy", "zzz", "wwww"]
+    first = emb.embed(texts, checkpoint_dir=str(tmp_path))
+    FakeEmbeddings.calls = []
+    FakeEmbeddings.fail_first = 100
+    assert np.array_equal(emb.embed(texts, checkpoint_dir=str(tmp_path)), first)
+    assert FakeEmbeddings.calls == []
+    with pytest.raises(EmbeddingRequestError):
+        emb.embed(["new"], checkpoint_dir=str(tmp_path))
@@ -0,0 +1,48 @@
+from pr_analyzer.analyzer import _build_prompt
+from pr_analyzer.prompt import estimate_tokens, pack_snippets
+
+
+def _chunks(path, text, size):
+    return [{"path": str(path), "chunk_index": i, "chunk_size": size, "snippet": text[o : o + size], "score": 1.0} for i, o in enumerate(range(0, len(text), size))]
+
+
+def test_frame_lines_come_first_and_overlaps_are_dropped(tmp_path):
+    source = "".join(f"line_{n} = compute({n})\n" for n in range(1, 201))
+    path = tmp_path / "service.py"
+    path.write_text(source)
+    chunks = _chunks(path, source, 512)
+    frame_chunk = next(c for c in chunks if "line_150 " in c["snippet"])
+    other = {"path": str(tmp_path / "other.py"), "chunk_index": 0, "chunk_size": 512, "snippet": "def helper():\n    return 1\n"}
+    # the frame's chunk is ranked last; the first chunk shows up twice and once more as a copy in another file
+    snippets = [chunks[0], other, chunks[0], {**chunks[0], "path": str(tmp_path / "copy.py")}, chunks[1], frame_chunk]
+    frame = {"file": "service.py", "line": 150, "raw": '  File "service.py", line 150, in run'}
+
+    packed = pack_snippets(frame, snippets, budget_tokens=250)
+    assert "150> line_150 = compute(150)" in packed[0]["snippet"]
+    assert packed[0]["start_line"] <= 150 <= packed[0]["end_line"]
+    assert sum(estimate_tokens(p["snippet"]) for p in packed) <= 250
+    # chunks 0 and 1 are neighbours: one region, and the duplicate and the copy are gone
+    paths = [p["path"] for p in packed]
+    assert str(tmp_path / "copy.py") not in paths
+    assert sum(1 for p in packed if p["path"] == str(path)) <= 2
+    # with the frame's file first, then the rest by rank
+    assert paths.index(str(path)) < paths.index(str(tmp_path / "other.py")) if str(tmp_path / "other.py") in paths else True
+
+
+def test_budget_bounds_the_prompt(tmp_path):
+    source = "x = 1\n" * 2000
+    path = tmp_path / "big.py"
+    path.write_text(source)
+    snippets = _chunks(path, source, 1024)
+    frame = {"file": "big.py", "line": 1000, "raw": "big.py:1000"}
+    small = _build_prompt(frame, snippets, budget_tokens=100)
+    large = _build_prompt(frame, snippets, budget_tokens=1000)
+    assert len(small) < len(large) <= len(_build_prompt(frame, [], budget_tokens=0)) + 1000 * 4 + 400
+    assert "1000> x = 1" in small
+
+
+def test_chunks_without_a_source_file_keep_their_chunk_index():
+    snippets = [{"path": "/gone/a.py", "chunk_index": 3, "chunk_size": 1024, "snippet": "def gone():\n    pass\n"}]
+    packed = pack_snippets({"file": "a.py", "line": 10}, snippets, budget_tokens=100)
+    assert packed == [{"path": "/gone/a.py", "chunk_index": 3, "start_line": None, "end_line": None, "score": None, "snippet": "def gone():\n    pass"}]
+    assert "- /gone/a.py:3 ->" in _build_prompt({"file": "a.py", "line": 10, "raw": "a.py:10"}, snippets)
@@ -0,0 +1,63 @@
+import os
+
+from pr_analyzer.indexer import build_index
+from pr_analyzer.lexical import tokenize
+from pr_analyzer.retriever import retrieve_for_frame
+
+
+def test_tokenize_splits_identifiers():
+    tokens = tokenize("BaseFiniteStateMachineContext.ExecuteWithOutcome(x)")
+    assert "executewithoutcome" in tokens
+    assert {"base", "finite", "state", "machine", "context", "outcome"} <= set(tokens)
+
+
+def test_exact_identifier_found_lexically(tmp_path, monkeypatch):
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "Fsm.cs").write_text("class BaseFiniteStateMachineContext {\n  void ExecuteWithOutcome() { throw new Exception(); }\n}\n")
+    for i in range(20):
+        (repo / f"Other{i}.cs").write_text(f"class Other{i} {{ void Run{i}() {{ }} }}\n")
+    index_path = str(tmp_path / "idx")
+    build_index(str(repo), index_path)
+
+    frame = "   at Company.BaseFiniteStateMachineContext.ExecuteWithOutcome() in F:\\dbs\\sh\\Fsm.cs:line 2"
+    hits = retrieve_for_frame(index_path, frame, top_k=1)
+    assert hits[0]["path"].endswith("Fsm.cs")
+    # the exact identifier short-circuits the embedding search
+    from pr_analyzer.indexer import IndexHandle
+
+    vector_queries = []
+
+    def record_vectors(self, queries, top_k=5):
+        vector_queries.append(list(queries))
+        return [[] for _ in queries]
+
+    monkeypatch.setattr(IndexHandle, "vector_search_many", record_vectors)
+    assert retrieve_for_frame(index_path, frame, top_k=1)[0]["path"].endswith("Fsm.cs")
+    assert vector_queries == [[]]
+    lexical_only = retrieve_for_frame(index_path, "at Other3.Run3() in Other3.cs:line 1", top_k=3, mode="lexical")
+    assert lexical_only[0]["path"].endswith("Other3.cs")
+
+
+def test_frame_query_keeps_names_and_drops_noise():
+    from pr_analyzer.retriever import _frame_query
+
+    frame = (
+        "   at Microsoft.Xdb.Common.BaseFiniteStateMachineContext.ExecuteWithOutcome(FiniteStateMachine fsm, Object[] parameters)"
+        " in F:\\dbs\\sh\\5uj5\\0401_102801\\cmd\\7\\Sql\\BaseFiniteStateMachineContext.cs:line 382"
+    )
+    assert _frame_query(frame) == "BaseFiniteStateMachineContext ExecuteWithOutcome"
+    assert _frame_query('  File "app/main.py", line 42, in handler') == "handler main"
+
+
+def test_very_common_terms_are_skipped(tmp_path, monkeypatch):
+    from pr_analyzer import lexical
+
+    monkeypatch.setattr(lexical, "MIN_DOCS_FOR_DF_CAP", 1)
+    index = lexical.LexicalIndex(str(tmp_path / "lex.db"))
+    index.add(range(20), [f"object value{i}" for i in range(20)])
+    index.commit()
+    # "object" is in every chunk: it neither scores nor gets its postings read
+    assert [cid for cid, _ in index.search("object value7")] == [7]
+    assert len(index.search("object", top_k=50)) == 20
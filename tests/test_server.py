@@ -0,0 +1,432 @@
+import asyncio
+import os
+
+import httpx
+
+from pr_analyzer import llm
+from pr_analyzer.indexer import build_index
+from pr_analyzer.server import app, release_index, warm_index
+from pr_analyzer.workers import WorkerPool
+
+
+def test_analyze_is_bounded_and_rejects_when_saturated(monkeypatch, tmp_path):
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "a.py").write_text("def foo():\n    raise ValueError('oops')\n")
+    index = tmp_path / "idx"
+    build_index(str(repo), str(index))
+    app.state.index_path = str(index)
+    app.state.pool = WorkerPool(workers=2, max_concurrency=1, queue_depth=1)
+    body = {"stack_trace": '  File "a.py", line 1, in foo'}
+    # distinct crashes, so they queue and get rejected instead of being coalesced onto the first request
+    other = {"stack_trace": '  File "a.py", line 1, in other'}
+    third = {"stack_trace": '  File "a.py", line 1, in third'}
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def fake_ask(prompt, temperature=0.0):
+            await release.wait()
+            return '{"classification":"code","confidence":0.8}'
+
+        monkeypatch.setattr(llm, "ask_llm_async", fake_ask)
+        warm_index()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = asyncio.create_task(client.post("/analyze", json=body))
+            second = asyncio.create_task(client.post("/analyze", json=other))
+            # the loop stays responsive while one request waits on the LLM and one waits for its slot
+            for _ in range(500):
+                if app.state.pool.stats()["queued"] == 1:
+                    break
+                await asyncio.sleep(0.01)
+            assert app.state.pool.stats()["in_flight"] == 1
+            rejected = await client.post("/analyze", json=third)
+            release.set()
+            done = await asyncio.gather(first, second)
+            await release_index()
+            # a new crash needs the (closed) pool; the one analyzed above is still answered from the cache
+            closed = await client.post("/analyze", json={"stack_trace": '  File "b.py", line 1, in bar'})
+            cached = await client.post("/analyze", json=body)
+        return rejected, done, closed, cached
+
+    rejected, done, closed, cached = asyncio.run(scenario())
+    assert rejected.status_code == 429 and rejected.headers["Retry-After"] == "1"
+    assert [r.status_code for r in done] == [200, 200]
+    assert done[0].json()["analysis"]["classification"] == "code"
+    assert app.state.pool.stats()["rejected"] == 1
+    assert closed.status_code == 503
+    assert cached.status_code == 200 and cached.json()["analysis"] == done[0].json()["analysis"]
+    del app.state.pool
+
+
+def test_analyze_batch_streams_ndjson(monkeypatch, tmp_path):
+    import json
+
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "a.py").write_text("def foo():\n    raise ValueError('oops')\n")
+    index = tmp_path / "idx"
+    build_index(str(repo), str(index))
+    app.state.index_path = str(index)
+    app.state.pool = WorkerPool(workers=2, max_concurrency=2, queue_depth=0)
+
+    async def fake_ask(prompt, temperature=0.0):
+        return '{"classification":"code","confidence":0.7}'
+
+    monkeypatch.setattr(llm, "ask_llm_async", fake_ask)
+
+    async def scenario():
+        warm_index()
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                ok = await client.post("/analyze/batch", json={"stack_traces": ['  File "a.py", line 1, in foo', "garbage"]})
+                empty = await client.post("/analyze/batch", json={"stack_traces": []})
+            return ok, empty
+        finally:
+            await release_index()
+
+    ok, empty = asyncio.run(scenario())
+    assert ok.status_code == 200 and ok.headers["content-type"].startswith("application/x-ndjson")
+    lines = {row["index"]: row for row in map(json.loads, ok.text.splitlines())}
+    assert lines[0]["analysis"]["classification"] == "code" and lines[1] == {"index": 1, "error": "no frames parsed"}
+    assert empty.status_code == 422
+    assert app.state.pool.stats()["in_flight"] == 0
+    del app.state.pool
+
+
+def _coalescing_setup(monkeypatch, tmp_path, timeout=None):
+    from pr_analyzer import analyzer
+
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    if timeout is None:
+        monkeypatch.delenv("PR_ANALYZER_COALESCE_TIMEOUT", raising=False)
+    else:
+        monkeypatch.setenv("PR_ANALYZER_COALESCE_TIMEOUT", str(timeout))
+    # pick up the env var with a fresh coalescer
+    monkeypatch.setattr(analyzer, "_SINGLEFLIGHT", None)
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "a.py").write_text("def foo():\n    raise ValueError('oops')\n")
+    build_index(str(repo), str(tmp_path / "idx"))
+    app.state.index_path = str(tmp_path / "idx")
+    app.state.pool = WorkerPool(workers=2, max_concurrency=1, queue_depth=0)
+    return analyzer.get_singleflight
+
+
+def test_identical_concurrent_requests_share_one_analysis(monkeypatch, tmp_path):
+    get_singleflight = _coalescing_setup(monkeypatch, tmp_path)
+    calls = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def fake_ask(prompt, temperature=0.0):
+            calls.append(prompt)
+            await release.wait()
+            return '{"classification":"dependency"}'
+
+        monkeypatch.setattr(llm, "ask_llm_async", fake_ask)
+        warm_index()
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                # the same crash from ten builds; one pool slot and no queue, so only coalescing lets them all through
+                posts = [
+                    asyncio.create_task(client.post("/analyze", json={"stack_trace": f'  File "/build/{n}/a.py", line {n}, in foo'}))
+                    for n in range(10)
+                ]
+                for _ in range(500):
+                    if get_singleflight().stats()["followers"] == 9:
+                        break
+                    await asyncio.sleep(0.01)
+                release.set()
+                return await asyncio.wait_for(asyncio.gather(*posts), 10)
+        finally:
+            await release_index()
+
+    responses = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert [r.status_code for r in responses] == [200] * 10
+    assert {r.json()["analysis"]["classification"] for r in responses} == {"dependency"}
+    assert [r.json()["frame"]["line"] for r in responses] == list(range(10))
+    assert get_singleflight().stats() == {"leaders": 1, "followers": 9, "timeouts": 0, "in_flight": 0}
+    del app.state.pool
+
+
+def test_coalesced_request_times_out_with_504(monkeypatch, tmp_path):
+    get_singleflight = _coalescing_setup(monkeypatch, tmp_path, timeout=0.05)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def fake_ask(prompt, temperature=0.0):
+            await release.wait()
+            return '{"classification":"code"}'
+
+        monkeypatch.setattr(llm, "ask_llm_async", fake_ask)
+        warm_index()
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                leader = asyncio.create_task(client.post("/analyze", json={"stack_trace": '  File "a.py", line 1, in foo'}))
+                for _ in range(500):
+                    if get_singleflight().in_flight():
+                        break
+                    await asyncio.sleep(0.01)
+                follower = await client.post("/analyze", json={"stack_trace": '  File "a.py", line 2, in foo'})
+                release.set()
+                return await asyncio.wait_for(leader, 10), follower
+        finally:
+            await release_index()
+
+    leader, follower = asyncio.run(scenario())
+    assert leader.status_code == 200
+    assert follower.status_code == 504
+    assert get_singleflight().stats()["timeouts"] == 1
+    del app.state.pool
+
+
+def test_async_llm_reuses_one_client_per_loop(monkeypatch):
+    monkeypatch.setattr(llm, "OPENAI_API_BASE", "http://127.0.0.1:9")
+    monkeypatch.setattr(llm, "OPENAI_API_KEY", "k")
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setattr(llm, "_ASYNC_LOOP", None)
+    seen = []
+
+    class FakeResponse:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"choices": [{"message": {"content": "ok"}}]}
+
+    async def fake_post(self, url, **kw):
+        seen.append(self)
+        return FakeResponse()
+
+    monkeypatch.setattr(httpx.AsyncClient, "post", fake_post)
+
+    async def scenario():
+        answers = [await llm.ask_llm_async("a"), await llm.ask_llm_async("b")]
+        http = llm._ASYNC_HTTP
+        await llm.aclose()
+        return answers, http
+
+    answers, http = asyncio.run(scenario())
+    assert answers == ["ok", "ok"]
+    assert seen == [http, http] and http.is_closed
+
+
+def test_analyze_batch_reports_retrieval_failure_per_item_and_frees_its_slot(monkeypatch, tmp_path):
+    import json
+    from pr_analyzer import analyzer
+    from pr_analyzer.server import BatchAnalyzeRequest, analyze_batch
+
+    app.state.index_path = str(tmp_path / "missing-index")
+    app.state.pool = WorkerPool(workers=1, max_concurrency=1, queue_depth=0)
+
+    def broken(*a, **kw):
+        raise FileNotFoundError("no index")
+
+    monkeypatch.setattr(analyzer, "prepare_analyses", broken)
+    traces = ['  File "x.py", line 1, in one', '  File "x.py", line 2, in two']
+
+    async def scenario():
+        app.state.pool.start()
+        try:
+            # a client that disconnects before the body is read: only the background task runs
+            dropped = await analyze_batch(BatchAnalyzeRequest(stack_traces=traces))
+            assert app.state.pool.stats()["in_flight"] == 1
+            await dropped.background()
+            after_drop = app.state.pool.stats()["in_flight"]
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                ok = await client.post("/analyze/batch", json={"stack_traces": traces})
+            return after_drop, ok
+        finally:
+            app.state.pool.close()
+
+    after_drop, ok = asyncio.run(scenario())
+    assert after_drop == 0
+    rows = sorted(map(json.loads, ok.text.splitlines()), key=lambda r: r["index"])
+    assert [r["error"] for r in rows] == ["retrieval failed: no index"] * 2
+    assert app.state.pool.stats()["in_flight"] == 0
+    del app.state.pool
+
+
+def test_metrics_endpoint_reports_stage_latencies(monkeypatch, tmp_path):
+    from types import SimpleNamespace
+
+    from pr_analyzer import metrics
+
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "a.py").write_text("def measured():\n    raise ValueError('oops')\n")
+    build_index(str(repo), str(tmp_path / "idx"))
+    app.state.index_path = str(tmp_path / "idx")
+    app.state.pool = WorkerPool(workers=1, max_concurrency=1, queue_depth=0)
+
+    async def create(**kwargs):
+        message = SimpleNamespace(content='{"classification":"code"}')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=SimpleNamespace(prompt_tokens=120, completion_tokens=30))
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(llm, "_async_clients", lambda: (client, None))
+    llm_calls = metrics.STAGE_SECONDS.count("llm")
+    completion_tokens = metrics.LLM_TOKENS.value("completion")
+
+    async def scenario():
+        warm_index()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            r = await http.post("/analyze", json={"stack_trace": '  File "a.py", line 2, in measured'})
+            assert r.status_code == 200
+            return await http.get("/metrics")
+
+    try:
+        r = asyncio.run(scenario())
+    finally:
+        asyncio.run(release_index())
+    assert r.status_code == 200 and r.headers["content-type"].startswith("text/plain")
+    for stage in ("parse", "retrieve", "embed", "vector_search", "fetch", "prompt", "llm"):
+        assert f'pr_analyzer_stage_seconds_count{{stage="{stage}"}}' in r.text
+    assert 'pr_analyzer_stage_seconds_bucket{stage="llm",le="+Inf"}' in r.text
+    assert metrics.STAGE_SECONDS.count("llm") == llm_calls + 1
+    assert metrics.LLM_TOKENS.value("completion") == completion_tokens + 30
+    assert 'pr_analyzer_request_seconds_count{endpoint="analyze"}' in r.text
+    assert 'pr_analyzer_result_cache_total{result="miss"}' in r.text
+
+
+def test_admin_reload_swaps_the_index_without_a_restart(monkeypatch, tmp_path):
+    from pr_analyzer.indexer import open_index
+
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    monkeypatch.setenv("PR_ANALYZER_ADMIN_TOKEN", "s3cret")
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "a.py").write_text("def foo():\n    raise ValueError('oops')\n")
+    index = str(tmp_path / "idx")
+    build_index(str(repo), index)
+    app.state.index_path = index
+    app.state.pool = WorkerPool(workers=1, max_concurrency=1, queue_depth=0)
+    # a long poll interval: only the admin call can pick up the rebuild within this test
+    app.state.reload_interval = 3600
+
+    async def scenario():
+        warm_index()
+        old = open_index(index)
+        (repo / "b.py").write_text("def bar():\n    return 2\n")
+        build_index(str(repo), index)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            denied = await client.post("/admin/reload")
+            assert open_index(index) is old
+            first = await client.post("/admin/reload", headers={"Authorization": "Bearer s3cret"})
+            again = await client.post("/admin/reload", headers={"Authorization": "Bearer s3cret"})
+            stats = await client.get("/stats")
+        return old, denied, first, again, stats
+
+    try:
+        old, denied, first, again, stats = asyncio.run(scenario())
+        new = open_index(index)
+        assert new is not old and len(new.metas) == 2
+    finally:
+        asyncio.run(release_index())
+        del app.state.reload_interval
+    assert denied.status_code == 403
+    assert first.json()["reloaded"] is True and again.json()["reloaded"] is False
+    assert stats.json()["index"]["interval"] == 3600
+
+
+def test_jobs_endpoint_runs_analysis_in_the_background(monkeypatch, tmp_path):
+    from pr_analyzer.jobs import JobQueue, JobStore
+
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "a.py").write_text("def queued():\n    raise ValueError('oops')\n")
+    build_index(str(repo), str(tmp_path / "idx"))
+    app.state.index_path = str(tmp_path / "idx")
+    app.state.pool = WorkerPool(workers=1, max_concurrency=1, queue_depth=0)
+    app.state.jobs = JobQueue(JobStore(str(tmp_path / "jobs.sqlite")), workers=1, max_queued=4)
+    monkeypatch.delenv("PR_ANALYZER_REPO", raising=False)
+    monkeypatch.setattr(llm, "ask_llm", lambda prompt, temperature=0.0: '{"classification":"code"}')
+
+    async def scenario():
+        warm_index()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # the default kind needs a repository to diagnose, which this server has none of
+            no_repo = await client.post("/jobs", json={"stack_trace": "x"})
+            submitted = await client.post("/jobs", json={"stack_trace": '  File "a.py", line 2, in queued', "kind": "analyze"})
+            for _ in range(500):
+                job = await client.get(submitted.headers["location"])
+                if job.json()["status"] in ("done", "failed"):
+                    break
+                await asyncio.sleep(0.01)
+            missing = await client.get("/jobs/nope")
+        return no_repo, submitted, job, missing
+
+    try:
+        no_repo, submitted, job, missing = asyncio.run(scenario())
+    finally:
+        asyncio.run(release_index())
+    assert no_repo.status_code == 400
+    assert submitted.status_code == 202 and submitted.json()["status"] == "queued"
+    assert job.json()["status"] == "done" and job.json()["result"]["analysis"] == {"classification": "code"}
+    assert missing.status_code == 404
+
+
+def test_analyze_stream_sends_fields_before_the_reply_is_finished(monkeypatch, tmp_path):
+    import json
+    from pr_analyzer.server import AnalyzeRequest, analyze_stream
+
+    os.environ["PR_ANALYZER_UNIT_TEST"] = "1"
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "a.py").write_text("def streamed():\n    raise ValueError('oops')\n")
+    index = tmp_path / "idx"
+    build_index(str(repo), str(index))
+    app.state.index_path = str(index)
+    app.state.pool = WorkerPool(workers=1, max_concurrency=1, queue_depth=0)
+    body = {"stack_trace": '  File "a.py", line 2, in streamed'}
+
+    async def scenario():
+        finish = asyncio.Event()
+
+        async def fake_stream(prompt, temperature=0.0, use_cache=True):
+            yield '```json\n{"classification": "code", "confidence": 0.9,'
+            # the rest of the reply is not written until the client has seen the first fields
+            await finish.wait()
+            yield ' "explanation": "raises on bad input"}\n```'
+
+        monkeypatch.setattr(llm, "ask_llm_stream_async", fake_stream)
+        warm_index()
+        try:
+            # read the body as it is produced (the ASGI test transport only returns finished responses)
+            response = await analyze_stream(AnalyzeRequest(**body))
+            assert response.media_type == "application/x-ndjson"
+            lines = []
+            async for line in response.body_iterator:
+                lines.append(json.loads(line))
+                if len(lines) == 2:
+                    finish.set()
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                cached = await client.post("/analyze/stream", json=body)
+            return lines, [json.loads(line) for line in cached.text.splitlines()]
+        finally:
+            await release_index()
+
+    lines, cached = asyncio.run(scenario())
+    assert lines[:3] == [{"field": "classification", "value": "code"}, {"field": "confidence", "value": 0.9}, {"field": "explanation", "value": "raises on bad input"}]
+    assert lines[3]["result"]["analysis"] == {"classification": "code", "confidence": 0.9, "explanation": "raises on bad input"}
+    # the second request is answered from the result cache, fields first
+    assert cached == lines
+    assert app.state.pool.stats()["in_flight"] == 0
+    del app.state.pool
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from pr_analyzer.singleflight import CoalesceTimeout, SingleFlight
+
+
+def test_leader_failure_reaches_followers():
+    async def scenario():
+        flight = SingleFlight()
+        started = asyncio.Event()
+
+        async def boom():
+            started.set()
+            await asyncio.sleep(0.01)
+            raise ValueError("llm down")
+
+        leader = asyncio.ensure_future(flight.do("k", boom))
+        await started.wait()
+        followers = [asyncio.ensure_future(flight.do("k", boom)) for _ in range(3)]
+        results = await asyncio.gather(leader, *followers, return_exceptions=True)
+        return flight, results
+
+    flight, results = asyncio.run(scenario())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert flight.stats() == {"leaders": 1, "followers": 3, "timeouts": 0, "in_flight": 0}
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "done"
+
+        leader = asyncio.ensure_future(flight.do("k", work))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("k", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower, leader.cancelled(), calls
+
+    result, cancelled, calls = asyncio.run(scenario())
+    assert (result, cancelled, calls) == ("done", True, [1])
+
+
+def test_follower_timeout():
+    async def scenario():
+        flight = SingleFlight(wait_timeout=0.01)
+        leader = asyncio.ensure_future(flight.do("k", lambda: asyncio.sleep(0.1, result="late")))
+        await asyncio.sleep(0)
+        with pytest.raises(CoalesceTimeout):
+            await flight.do("k", lambda: asyncio.sleep(0.1))
+        # the shared work itself keeps running for the leader
+        return await leader
+
+    assert asyncio.run(scenario()) == "late"
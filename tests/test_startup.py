@@ -0,0 +1,23 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+CODE_DIR = Path(__file__).resolve().parents[1]
+if str(CODE_DIR) not in sys.path:
+    sys.path.insert(0, str(CODE_DIR))
+
+from bench_startup import FORBIDDEN, import_profile, violations
+
+
+@pytest.mark.parametrize("module", sorted(FORBIDDEN))
+def test_entry_points_defer_heavy_imports(module):
+    pytest.importorskip(module)
+    _, times = import_profile(module)
+    assert violations(module, times) == []
+
+
+def test_cli_app_is_loaded_on_demand():
+    from pr_analyzer import cli
+
+    assert cli.app is __import__("pr_analyzer.server", fromlist=["app"]).app